@@ -2,7 +2,9 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import click
 import os
+import threading
 from config import config
 
 # Initialize Flask app
@@ -16,17 +18,67 @@ app.config.from_object(config[config_name])
 CORS(app, 
      origins=app.config['CORS_ORIGINS'],
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-     allow_headers=['Content-Type', 'Authorization', 'Accept'],
+     allow_headers=['Content-Type', 'Authorization', 'Accept', 'X-Profile'],
      supports_credentials=True)
 
 # Initialize database
 db = SQLAlchemy(app)
 
+# Profile requests on demand (no hooks unless PROFILER_ENABLED or PROFILER_TOKEN is set)
+from services.profiler import install_profiler
+install_profiler(app)
+
+# Cancel statements that run past their route's STATEMENT_TIMEOUTS
+from services.timeouts import install_statement_timeouts, timeout_stats
+install_statement_timeouts()
+
 # Import routes
 from routes.warehouse import warehouse_bp
+from routes.pricing import pricing_bp
 
 # Register blueprints
 app.register_blueprint(warehouse_bp, url_prefix='/api/warehouse')
+app.register_blueprint(pricing_bp, url_prefix='/api/warehouse')
+
+# Watch Main/Chines for changes and keep the inventory snapshot, mirror and
+# search index fresh. The threads start with the first request, so only a
+# serving process runs them: not CLI commands, nor the reloader's watcher.
+from services.changes import start_change_feed
+from services.inventory import refresh_inventory_snapshot, start_inventory_refresher
+from services.mirror import start_mirror_sync, sync_mirror
+from services.search import start_search_index
+from services.admission import admission_status
+from services.breaker import breaker_status
+
+_workers_started = False
+_workers_lock = threading.Lock()
+
+@app.before_request
+def start_background_workers():
+    global _workers_started
+    if _workers_started:
+        return
+    with _workers_lock:
+        if not _workers_started:
+            start_change_feed(app)
+            start_inventory_refresher(app)
+            start_mirror_sync(app)
+            start_search_index(app)
+            _workers_started = True
+
+@app.cli.command('refresh-inventory')
+def refresh_inventory_command():
+    """Rebuild the inventory_snapshot table from Main and Chines."""
+    rows = refresh_inventory_snapshot()
+    print(f"inventory_snapshot refreshed: {rows} rows")
+
+@app.cli.command('sync-mirror')
+@click.option('--full', is_flag=True, help='Recopy every table instead of syncing incrementally.')
+def sync_mirror_command(full):
+    """Copy new and changed Main/Chines/Customers rows into the analytics mirror."""
+    for table, stats in sync_mirror(full=full).items():
+        print(f"{table}: {stats['mode']}, {stats['copied']} copied, {stats['reread']} re-read, "
+              f"{stats['deleted']} deleted, {stats['rows']} rows")
 
 @app.route('/')
 def home():
@@ -40,7 +92,10 @@ def home():
 def health_check():
     return jsonify({
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'database': breaker_status(),
+        'admission': admission_status(),
+        'statement_timeouts': timeout_stats()
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,371 @@
+"""Load-test every warehouse route against a synthetic SQLite dataset.
+
+Each route is driven by a pool of concurrent workers, either in-process through
+the Flask test client (``--mode client``) or over HTTP against a local threaded
+server (``--mode http``). For every route the run records p50/p95/p99 latency,
+throughput, errors and the peak resident memory seen while it ran, and writes
+the results as JSON so runs can be compared across versions:
+
+    python -m benchmarks.synthetic --pieces 100000
+    python -m benchmarks.run --requests 50 --concurrency 8
+    python -m benchmarks.run --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB = os.path.join(BACKEND_DIR, 'benchmarks', 'data', 'synthetic.db')
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+API = '/api/warehouse'
+# Sent to the /profiles routes, which always require PROFILER_TOKEN
+PROFILE_TOKEN = 'benchmark'
+
+
+def create_app(db_path):
+    """Import the application configured for the synthetic SQLite database."""
+    os.environ['FLASK_CONFIG'] = 'testing'
+    os.environ['TEST_DATABASE_URL'] = f'sqlite:///{os.path.abspath(db_path)}'
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    from app import app
+    from services import sqlite_compat
+
+    with app.app_context():
+        sqlite_compat.install(app.extensions['sqlalchemy'].engine)
+    return app
+
+
+def sample_values(db_path):
+    """Pick existing keys for the parameterised routes."""
+    connection = sqlite3.connect(db_path)
+    query = lambda sql: (connection.execute(sql).fetchone() or ('',))
+    desan, color = query("SELECT Desan, Color FROM Main WHERE Status = 'مستودع' AND Customer = '6000' LIMIT 1")
+    scrap_desan, scrap_color = query("SELECT Desan, Color FROM Main WHERE Status = 'سقط' LIMIT 1")
+    chinese_type, chinese_color = query("SELECT Type, Color FROM Chines WHERE Status = 'مستودع' LIMIT 1")
+    order, = query("SELECT Customer FROM Main WHERE Status = 'تصنيع' AND Customer != '6000' LIMIT 1")
+    orders = [row[0] for row in connection.execute(
+        "SELECT DISTINCT Customer FROM Main WHERE Status = 'تصنيع' AND Customer != '6000' LIMIT 10"
+    )]
+    connection.close()
+    return {
+        'desan': desan, 'color': color, 'scrap_desan': scrap_desan, 'scrap_color': scrap_color,
+        'type': chinese_type, 'chinese_color': chinese_color, 'order': order, 'orders': orders or [order],
+    }
+
+
+def prepare_fixtures(app, sample, work_dir):
+    """Create the report job and saved profile that the ``/jobs/<id>`` and ``/profiles/<name>`` cases read.
+
+    Job results and profiles go under ``work_dir``, never the configured
+    ``JOB_CACHE_DIR``/``PROFILER_DIR`` (a benchmark must not touch real ones).
+    """
+    from services.profiler import RequestProfile, save_profile
+
+    app.config['JOB_CACHE_DIR'] = os.path.join(work_dir, 'jobs')
+    app.config['PROFILER_DIR'] = os.path.join(work_dir, 'profiles')
+    app.config['PROFILER_TOKEN'] = PROFILE_TOKEN
+    client = app.test_client()
+    response = client.post(f'{API}/jobs', json={'report': 'sales_main_detailed', 'params': {'limit': 1000}})
+    job = response.get_json()['data']
+    response.close()
+    while job['state'] not in ('done', 'failed'):
+        time.sleep(0.05)
+        response = client.get(f"{API}/jobs/{job['id']}")
+        job = response.get_json()['data']
+        response.close()
+
+    # Profile one request in this thread, as the profiler hooks would
+    with app.test_request_context():
+        profile = RequestProfile('benchmark', app.config.get('PROFILER_INTERVAL_MS', 5) / 1000).start()
+        client.get(f'{API}/summary').close()
+        profile.stop()
+        profile_name = save_profile(profile.speedscope({'path': f'{API}/summary'}), profile.name)
+    return dict(sample, job=job['id'], profile=profile_name)
+
+
+def route_cases(sample):
+    """Request path per route rule, with realistic query parameters."""
+    year_ago = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    today = datetime.now().strftime('%Y-%m-%d')
+    return {
+        '/scrap': '/scrap',
+        '/classic': '/classic',
+        '/chinese': '/chinese',
+        '/summary': '/summary',
+        '/sales/summary': '/sales/summary?period=last_month',
+        '/sales/main': '/sales/main?period=last_3_months',
+        '/sales/chinese': '/sales/chinese?period=last_3_months',
+        '/sales/top-products': '/sales/top-products?type=both&limit=10',
+        '/sales/chinese/customers': '/sales/chinese/customers?period=last_month&limit=10',
+        '/sales/chinese/detailed': '/sales/chinese/detailed?limit=1000',
+        '/sales/chinese/top-products': '/sales/chinese/top-products?period=last_month&limit=10',
+        '/sales/main/detailed': '/sales/main/detailed?limit=1000',
+        '/sales/main/customers': '/sales/main/customers?period=last_month&limit=10',
+        '/sales/main/top-products': '/sales/main/top-products?period=last_month&limit=10',
+        '/orders-in-progress': '/orders-in-progress',
+        '/orders/late': '/orders/late',
+        '/orders/all': '/orders/all',
+        '/orders/summary': '/orders/summary',
+        '/orders/ready': '/orders/ready',
+        '/orders/details': f"/orders/details?orderNumber={sample['order']}",
+        '/orders/details/batch': f"/orders/details/batch?orderNumbers={','.join(sample['orders'])}",
+        '/classic/details/<desan>': f"/classic/details/{sample['desan']}",
+        '/classic/color-details/<desan>/<color>': f"/classic/color-details/{sample['desan']}/{sample['color']}",
+        '/scrap/details/<desan>': f"/scrap/details/{sample['scrap_desan']}",
+        '/scrap/color-details/<desan>/<color>': f"/scrap/color-details/{sample['scrap_desan']}/{sample['scrap_color']}",
+        '/chinese/details/<type>': f"/chinese/details/{sample['type']}",
+        '/chinese/color-details/<type>/<color>': f"/chinese/color-details/{sample['type']}/{sample['chinese_color']}",
+        '/test-chinese': '/test-chinese',
+        '/export/<source>': f'/export/main?start_date={year_ago}&end_date={today}',
+        '/cube': '/cube?group_by=product,color&source=main&period=last_month&sort=meters&top=10',
+        '/search': f"/search?q={sample['desan'][:2]}&limit=10",
+        '/jobs': '/jobs',
+        '/jobs/<job_id>': f"/jobs/{sample['job']}",
+        '/jobs/<job_id>/result': f"/jobs/{sample['job']}/result",
+        '/profiles': '/profiles',
+        '/profiles/<name>': f"/profiles/{sample['profile']}",
+    }
+
+
+# Long-lived streams have no request/response latency to measure
+STREAMING_RULES = {'/live', '/jobs/<job_id>/events'}
+
+
+def blueprint_rules(app):
+    """Warehouse blueprint GET rules, without the API prefix (the pricing proxy calls out and is skipped)."""
+    return sorted({
+        rule.rule[len(API):] for rule in app.url_map.iter_rules()
+        if rule.endpoint.startswith('warehouse.') and 'GET' in rule.methods
+        and rule.rule[len(API):] not in STREAMING_RULES
+    })
+
+
+class RssSampler:
+    """Track the peak resident set size of this process between resets."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def current(self):
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * self._page_size
+        except OSError:
+            # ru_maxrss is KiB on Linux and bytes on macOS; either way it is a lifetime peak
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return usage if sys.platform == 'darwin' else usage * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            time.sleep(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def reset(self):
+        self.peak = self.current()
+
+    def stop(self):
+        self._stop.set()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def _headers(path):
+    # Only the /profiles routes get the token: elsewhere it would profile every request
+    return {'X-Profile': PROFILE_TOKEN} if path.startswith(f'{API}/profiles') else None
+
+
+def make_requester(app, mode, base_url):
+    """Return a factory of per-worker ``get(path) -> status`` callables."""
+    if mode == 'http':
+        import requests
+        local = threading.local()
+
+        def get(path):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            response = session.get(base_url + path, headers=_headers(path))
+            response.content
+            return response.status_code
+        return get
+
+    local = threading.local()
+
+    def get(path):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        response = client.get(path, headers=_headers(path))
+        response.get_data()
+        return response.status_code
+    return get
+
+
+def serve(app, port):
+    """Start a threaded WSGI server for ``--mode http`` in the background."""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_route(get, path, requests_count, concurrency, sampler):
+    """Run ``requests_count`` requests for ``path`` and summarise them."""
+    get(API + path)  # warm-up (first frame load, connection setup)
+    sampler.reset()
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            status = get(API + path)
+        except Exception:
+            status = 0
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    errors = sum(1 for _, status in samples if status >= 400 or status == 0)
+    return {
+        'path': path,
+        'requests': requests_count,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'throughput_rps': round(requests_count / elapsed, 2) if elapsed else None,
+        'peak_rss_mb': round(sampler.peak / (1024 * 1024), 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path, threshold=0.10):
+    """Print p95 changes against a previous result file, flagging regressions."""
+    with open(previous_path, encoding='utf-8') as handle:
+        previous = json.load(handle)
+    print(f"\nComparison with {previous_path} (revision {previous['meta'].get('revision')}):")
+    regressions = 0
+    for rule, result in current['routes'].items():
+        before = previous['routes'].get(rule)
+        if not before or not before.get('p95_ms'):
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms']
+        flag = 'REGRESSION' if change > threshold else ''
+        regressions += bool(flag)
+        print(f"  {rule:45s} p95 {before['p95_ms']:9.2f} -> {result['p95_ms']:9.2f} ms ({change:+.0%}) {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the warehouse API on synthetic data')
+    parser.add_argument('--db', default=DEFAULT_DB, help='Synthetic database (see benchmarks.synthetic)')
+    parser.add_argument('--pieces', type=int, default=100000, help='Generate the database first if missing')
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--routes', nargs='*', help='Only run these route rules')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Previous result file to compare against')
+    parser.add_argument('--verbose', action='store_true', help="Show the routes' own log output")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        from benchmarks.synthetic import generate
+        print(f"Generating {args.pieces} pieces into {args.db} ...")
+        generate(args.db, args.pieces)
+
+    app = create_app(args.db)
+    # The routes log debug lines; keep them out of the report unless asked
+    if not args.verbose:
+        app.logger.setLevel(logging.CRITICAL)
+    work_dir = tempfile.mkdtemp(prefix='warehouse-bench-')
+    cases = route_cases(prepare_fixtures(app, sample_values(args.db), work_dir))
+    rules = blueprint_rules(app)
+    missing = [rule for rule in rules if rule not in cases]
+    if missing:
+        print(f"Warning: no benchmark case for {', '.join(missing)}")
+    selected = [rule for rule in rules if rule in cases and (not args.routes or rule in args.routes)]
+
+    server = serve(app, args.port) if args.mode == 'http' else None
+    get = make_requester(app, args.mode, f'http://127.0.0.1:{args.port}')
+    sampler = RssSampler()
+    sampler.start()
+
+    results = {}
+    for rule in selected:
+        results[rule] = result = bench_route(get, cases[rule], args.requests, args.concurrency, sampler)
+        print(f"{rule:45s} p50 {result['p50_ms']:9.2f}  p95 {result['p95_ms']:9.2f}  p99 {result['p99_ms']:9.2f} ms"
+              f"  {result['throughput_rps']:8.1f} req/s  rss {result['peak_rss_mb']:7.1f} MB  errors {result['errors']}")
+
+    sampler.stop()
+    if server:
+        server.shutdown()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    with sqlite3.connect(args.db) as connection:
+        dataset = {table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                   for table in ('Main', 'Chines', 'Customers')}
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'mode': args.mode,
+            'requests_per_route': args.requests,
+            'concurrency': args.concurrency,
+            'dataset': dataset,
+        },
+        'routes': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        sys.exit(1 if compare(report, args.compare) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Synthetic ``Main``, ``Chines`` and ``Customers`` tables for benchmarking.
+
+Generates an SQLite database shaped like the production schema the routes
+query, with a realistic status mix (most orders shipped, a working set in
+manufacturing, dyeing and the raw warehouse, a small scrap share) and the
+Arabic status values the SQL filters on. Output is deterministic for a seed.
+
+    python -m benchmarks.synthetic --pieces 100000 --output benchmarks/data/synthetic.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+
+STOCK_CUSTOMER = '6000'
+
+# Orders move through the factory as a whole; each order is in one of these
+# states and its pieces take statuses from that state's mix. Overall this
+# gives roughly 70% shipped, 15% in stock, 12% in production, 3% scrap.
+ORDER_STATES = (
+    ('shipped', 0.55, (('مشحون', 0.98), ('سقط', 0.02))),
+    ('ready', 0.10, (('مستودع', 0.7), ('مشحون', 0.28), ('سقط', 0.02))),
+    ('in_progress', 0.35, (('مشحون', 0.3), ('مستودع', 0.15), ('تصنيع', 0.25),
+                           ('مستودع الخام', 0.14), ('مصبغة', 0.12), ('سقط', 0.04))),
+)
+
+# Stock pieces (customer 6000) are either on the shelf or scrapped
+STOCK_STATUSES = (('مستودع', 0.9), ('سقط', 0.1))
+
+CHINES_STATUSES = (
+    ('مشحون', 0.75),
+    ('مستودع', 0.25),
+)
+
+COLORS = ('أبيض', 'أسود', 'كحلي', 'رمادي', 'بيج', 'أحمر', 'أزرق', 'أخضر', 'بني', 'زيتي',
+          'سكري', 'فضي', 'خمري', 'عسلي', 'موف', 'تركواز')
+
+SCHEMA = """
+CREATE TABLE Customers (
+    Number TEXT PRIMARY KEY,
+    Name TEXT
+);
+CREATE TABLE Main (
+    Number INTEGER PRIMARY KEY,
+    Desan TEXT,
+    Color TEXT,
+    Long REAL,
+    Long2 REAL,
+    Status TEXT,
+    Customer TEXT,
+    customerNumber TEXT,
+    Invoice TEXT,
+    Nots TEXT,
+    Date TIMESTAMP,
+    Date1 TIMESTAMP,
+    Date2 TIMESTAMP,
+    Date3 TIMESTAMP,
+    Date4 TIMESTAMP,
+    endDate TIMESTAMP,
+    "في_تصنيع" INTEGER,
+    "في_مصبغة" INTEGER,
+    "في_مستودع_الخام" INTEGER
+);
+CREATE TABLE Chines (
+    Number INTEGER PRIMARY KEY,
+    Type TEXT,
+    Color TEXT,
+    Long REAL,
+    Status TEXT,
+    Customer TEXT,
+    Date TIMESTAMP
+);
+"""
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _weighted(rng, choices):
+    roll = rng.random()
+    cumulative = 0.0
+    for value, weight in choices:
+        cumulative += weight
+        if roll < cumulative:
+            return value
+    return choices[-1][0]
+
+
+def _ts(moment):
+    return moment.strftime(TIMESTAMP_FORMAT) if moment else None
+
+
+def _main_rows(rng, pieces, customers, now, start_number=1):
+    """Yield Main rows grouped into orders of 20-200 pieces."""
+    desans = [f'D{index:03d}' for index in range(1, max(20, pieces // 2000) + 1)]
+    number = start_number
+    order_index = 0
+    remaining = pieces
+    while remaining > 0:
+        order_index += 1
+        order_size = min(remaining, rng.randint(20, 200))
+        is_stock = rng.random() < 0.15
+        if is_stock:
+            statuses = STOCK_STATUSES
+        else:
+            statuses = _weighted(rng, [(mix, weight) for _, weight, mix in ORDER_STATES])
+        customer_number = STOCK_CUSTOMER if is_stock else rng.choice(customers)
+        order = STOCK_CUSTOMER if is_stock else str(100000 + order_index)
+        ordered = now - timedelta(days=rng.randint(0, 730), minutes=rng.randint(0, 1440))
+        due = ordered + timedelta(days=rng.randint(14, 90))
+        desan = rng.choice(desans)
+        invoice = str(rng.randint(1000, 99999)) if rng.random() < 0.6 else None
+        for _ in range(order_size):
+            status = _weighted(rng, statuses)
+            length = round(rng.uniform(20, 120), 1)
+            created = ordered + timedelta(hours=rng.randint(0, 72))
+            shipped = created + timedelta(days=rng.randint(3, 60)) if status == 'مشحون' else None
+            yield (
+                number, desan, rng.choice(COLORS), length, round(length * rng.uniform(0.9, 1.0), 1),
+                status, order, customer_number, invoice, '' if rng.random() < 0.9 else 'ملاحظة',
+                _ts(created), _ts(ordered), _ts(ordered + timedelta(days=1)),
+                _ts(shipped or created), _ts(created + timedelta(days=rng.randint(1, 10))), _ts(due),
+                int(status == 'تصنيع'), int(status == 'مصبغة'), int(status == 'مستودع الخام'),
+            )
+            number += 1
+        remaining -= order_size
+
+
+def _chines_rows(rng, pieces, customers, now, start_number=1):
+    types = [f'T{index:03d}' for index in range(1, max(10, pieces // 5000) + 1)]
+    for number in range(start_number, start_number + pieces):
+        status = _weighted(rng, CHINES_STATUSES)
+        customer = rng.choice(customers) if status == 'مشحون' else None
+        yield (
+            number, rng.choice(types), rng.choice(COLORS), round(rng.uniform(30, 100), 1), status, customer,
+            _ts(now - timedelta(days=rng.randint(0, 730), minutes=rng.randint(0, 1440))),
+        )
+
+
+def generate(path, pieces=100000, chinese_ratio=0.3, customers=500, seed=1986, batch_size=50000):
+    """Create the synthetic database at ``path`` and return row counts per table."""
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    connection = sqlite3.connect(path)
+    connection.executescript('PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;' + SCHEMA)
+
+    customer_numbers = [str(1000 + index) for index in range(customers)]
+    connection.executemany(
+        'INSERT INTO Customers VALUES (?, ?)',
+        [(number, f'زبون {number}') for number in customer_numbers] + [(STOCK_CUSTOMER, 'مستودع المعمل')]
+    )
+
+    counts = {'Customers': customers + 1}
+    for table, rows, width in (
+        ('Main', _main_rows(rng, pieces, customer_numbers, now), 19),
+        ('Chines', _chines_rows(rng, int(pieces * chinese_ratio), customer_numbers, now), 7),
+    ):
+        statement = f'INSERT INTO {table} VALUES ({", ".join("?" * width)})'
+        batch = []
+        counts[table] = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                connection.executemany(statement, batch)
+                counts[table] += len(batch)
+                batch = []
+        if batch:
+            connection.executemany(statement, batch)
+            counts[table] += len(batch)
+
+    connection.commit()
+    connection.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic warehouse database')
+    parser.add_argument('--pieces', type=int, default=100000, help='Main pieces to generate (100k-10M)')
+    parser.add_argument('--chinese-ratio', type=float, default=0.3, help='Chines pieces per Main piece')
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1986)
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'data', 'synthetic.db'))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(args.output, args.pieces, args.chinese_ratio, args.customers, args.seed)
+    print(f"Generated {counts} in {time.perf_counter() - started:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,142 @@ class Config:
         'pool_size': int(os.environ.get('DB_POOL_SIZE', 5))
     }
     
+    # Rows fetched per batch by the columnar export endpoints
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 10000))
+
+    # Share one execution between identical concurrent queries
+    QUERY_COALESCING = os.environ.get('QUERY_COALESCING', 'True').lower() == 'true'
+
+    # Seconds a loaded shipped-pieces frame is shared by the ranking routes
+    ANALYTICS_FRAME_TTL = int(os.environ.get('ANALYTICS_FRAME_TTL', 60))
+
+    # Seconds the pre-aggregated sales cube behind /cube is reused before it is rebuilt
+    CUBE_TTL = int(os.environ.get('CUBE_TTL', 600))
+    # HyperLogLog precision of the cube's daily distinct-count sketches (?approx=1); error ~1.04/sqrt(2**p)
+    HLL_PRECISION = int(os.environ.get('HLL_PRECISION', 14))
+
+    # Poll Main/Chines watermarks and drop dependent cache entries when they move
+    CHANGE_FEED_ENABLED = os.environ.get('CHANGE_FEED_ENABLED', 'True').lower() == 'true'
+    CHANGE_FEED_INTERVAL = float(os.environ.get('CHANGE_FEED_INTERVAL', 5))
+    # Without change tracking the per-status scan runs when MAX(Number) moves or after this many seconds
+    CHANGE_FEED_SCAN_INTERVAL = float(os.environ.get('CHANGE_FEED_SCAN_INTERVAL', 60))
+
+    # Per-order cache behind /orders/details and the batch size cap of /orders/details/batch
+    ORDER_DETAILS_CACHE_TTL = int(os.environ.get('ORDER_DETAILS_CACHE_TTL', 120))
+    ORDER_DETAILS_CACHE_SIZE = int(os.environ.get('ORDER_DETAILS_CACHE_SIZE', 512))
+    ORDER_DETAILS_BATCH_LIMIT = int(os.environ.get('ORDER_DETAILS_BATCH_LIMIT', 50))
+    # Whether Main.Customer compares case-insensitively (the server's default collation); the batch query's
+    # rows are matched back to the requested numbers the same way, trailing spaces always ignored
+    ORDER_NUMBER_CASE_INSENSITIVE = os.environ.get('ORDER_NUMBER_CASE_INSENSITIVE', 'True').lower() == 'true'
+    # Orders at the top of each order list whose details are loaded in the background (0 disables)
+    ORDER_DETAILS_PREFETCH = int(os.environ.get('ORDER_DETAILS_PREFETCH', 5))
+
+    # Serve inventory routes from the inventory_snapshot table (flask refresh-inventory),
+    # rebuilt every INVENTORY_SNAPSHOT_INTERVAL seconds in-app (0: CLI only) and on status changes
+    INVENTORY_SNAPSHOT_ENABLED = os.environ.get('INVENTORY_SNAPSHOT_ENABLED', 'False').lower() == 'true'
+    INVENTORY_SNAPSHOT_INTERVAL = int(os.environ.get('INVENTORY_SNAPSHOT_INTERVAL', 300))
+    # Seconds after which a snapshot is reported as stale
+    INVENTORY_SNAPSHOT_MAX_AGE = int(os.environ.get('INVENTORY_SNAPSHOT_MAX_AGE', 600))
+
+    # /api/warehouse/live: seconds between shared polls, keep-alive interval,
+    # how many undelivered events a slow client may queue before it is dropped,
+    # and how many streams may be open at once (each holds a server thread)
+    LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', 10))
+    LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT', 15))
+    LIVE_MAX_PENDING = int(os.environ.get('LIVE_MAX_PENDING', 100))
+    LIVE_MAX_CLIENTS = int(os.environ.get('LIVE_MAX_CLIENTS', 50))
+
+    # Inventory totals as the legacy '1,234.5' strings (False: typed numbers); ?numbers= overrides per request
+    NUMBER_STRING_COMPAT = os.environ.get('NUMBER_STRING_COMPAT', 'True').lower() == 'true'
+
+    # /api/warehouse/search index: seconds between incremental updates in-app (0: built on first search),
+    # and between full rebuilds that drop vanished values
+    SEARCH_INDEX_INTERVAL = int(os.environ.get('SEARCH_INDEX_INTERVAL', 60))
+    SEARCH_INDEX_REBUILD_INTERVAL = int(os.environ.get('SEARCH_INDEX_REBUILD_INTERVAL', 3600))
+
+    # Local SQLite copy of Main/Chines/Customers that the /sales routes read when
+    # enabled; synced by `flask sync-mirror` and every ANALYTICS_MIRROR_INTERVAL seconds in-app (0: CLI only)
+    ANALYTICS_MIRROR_ENABLED = os.environ.get('ANALYTICS_MIRROR_ENABLED', 'False').lower() == 'true'
+    ANALYTICS_MIRROR_PATH = os.environ.get('ANALYTICS_MIRROR_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'analytics_mirror.db'))
+    ANALYTICS_MIRROR_INTERVAL = int(os.environ.get('ANALYTICS_MIRROR_INTERVAL', 300))
+    # Without SQL Server change tracking, seconds between full recopies that pick up edits and deletes (0: never)
+    ANALYTICS_MIRROR_FULL_INTERVAL = int(os.environ.get('ANALYTICS_MIRROR_FULL_INTERVAL', 86400))
+
+    # Admission control per cost class: concurrent requests, requests allowed to wait, and seconds
+    # they wait before a 503 (limit 0: the whole pool). Heavy, export and report jobs share the pool minus
+    # ADMISSION_RESERVED_SLOTS, kept for the inventory and order screens; jobs wait for a slot instead of being shed.
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'True').lower() == 'true'
+    ADMISSION_CLASSES = {
+        'light': {'limit': 0, 'queue': int(os.environ.get('ADMISSION_LIGHT_QUEUE', 20)), 'wait': 30},
+        'heavy': {'limit': int(os.environ.get('ADMISSION_HEAVY_LIMIT', 1)), 'queue': int(os.environ.get('ADMISSION_HEAVY_QUEUE', 2)), 'wait': 10},
+        'export': {'limit': int(os.environ.get('ADMISSION_EXPORT_LIMIT', 1)), 'queue': 0, 'wait': 0},
+        'job': {'limit': 0, 'queue': 1000, 'wait': int(os.environ.get('ADMISSION_JOB_WAIT', 600))},
+    }
+    ADMISSION_RESERVED_SLOTS = int(os.environ.get('ADMISSION_RESERVED_SLOTS', 1))
+    # Retry-After (seconds) for a class with no finished requests yet
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 5))
+
+    # Seconds one statement may run before it is cancelled: per route (first matching rule substring),
+    # else STATEMENT_TIMEOUT (0: no limit). Report jobs get JOB_STATEMENT_TIMEOUT instead of their route's
+    # interactive limit; refreshers and prefetching are not limited.
+    STATEMENT_TIMEOUT = int(os.environ.get('STATEMENT_TIMEOUT', 30))
+    STATEMENT_TIMEOUTS = {
+        '/export/': int(os.environ.get('EXPORT_STATEMENT_TIMEOUT', 600)),
+        '/orders/all': 90,
+        '/sales/': 90,
+        '/cube': 120,
+    }
+
+    # Circuit breaker around the SQL Server: consecutive connectivity failures that open it, and seconds
+    # it stays open before one probe. Meanwhile inventory and sales routes serve their last good response
+    # (at most DB_STALE_MAX_AGE seconds old, DB_STALE_CACHE_SIZE URLs) marked stale.
+    DB_BREAKER_ENABLED = os.environ.get('DB_BREAKER_ENABLED', 'True').lower() == 'true'
+    DB_BREAKER_THRESHOLD = int(os.environ.get('DB_BREAKER_THRESHOLD', 5))
+    DB_BREAKER_RESET = int(os.environ.get('DB_BREAKER_RESET', 30))
+    DB_STALE_MAX_AGE = int(os.environ.get('DB_STALE_MAX_AGE', 86400))
+    DB_STALE_CACHE_SIZE = int(os.environ.get('DB_STALE_CACHE_SIZE', 256))
+
+    # Isolation level of the inventory and sales aggregates: 'snapshot' (when the database has
+    # ALLOW_SNAPSHOT_ISOLATION ON, else REPORT_READ_FALLBACK), 'read_uncommitted' or 'read_committed'
+    REPORT_READ_MODE = os.environ.get('REPORT_READ_MODE', 'snapshot')
+    REPORT_READ_FALLBACK = os.environ.get('REPORT_READ_FALLBACK', 'read_committed')
+
+    # Background report jobs (/api/warehouse/jobs): worker threads, result directory and its size cap
+    # (least recently used results are deleted first), and seconds a result is reused for the same spec
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_CACHE_DIR = os.environ.get('JOB_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs'))
+    JOB_CACHE_MAX_BYTES = int(os.environ.get('JOB_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 600))
+    JOB_STATEMENT_TIMEOUT = int(os.environ.get('JOB_STATEMENT_TIMEOUT', 1800))
+
+    # Per-request profiler: PROFILER_ENABLED profiles every request, PROFILER_TOKEN profiles requests
+    # sent with a matching X-Profile header. /profiles is only served with that header, so without a
+    # token saved profiles stay on disk. Unset: no hooks are installed at all. Sampling every 5 ms keeps
+    # the sampler's own cost on the profiled request low.
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'False').lower() == 'true'
+    PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN')
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+    PROFILER_DIR = os.environ.get('PROFILER_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'profiles'))
+    # Newest profiles kept in PROFILER_DIR; 0 keeps them all
+    PROFILER_KEEP = int(os.environ.get('PROFILER_KEEP', 50))
+
+    # External pricing service proxied by /api/warehouse/pricing/*
+    PRICING_API_URL = os.environ.get('PRICING_API_URL', 'https://istanbul.almaestro.org/api')
+    PRICING_TIMEOUT = int(os.environ.get('PRICING_TIMEOUT', 10))
+    PRICING_POOL_SIZE = int(os.environ.get('PRICING_POOL_SIZE', 10))
+    # Seconds a pricing response is fresh, per resource (PRICING_CACHE_TTL for the rest)
+    PRICING_CACHE_TTL = int(os.environ.get('PRICING_CACHE_TTL', 300))
+    PRICING_CACHE_TTLS = {
+        'desans': PRICING_CACHE_TTL,
+        'main_desan': PRICING_CACHE_TTL,
+        'desan': PRICING_CACHE_TTL,
+        'kalite': PRICING_CACHE_TTL,
+        'details': PRICING_CACHE_TTL,
+    }
+    # Entries kept per resource, and how long past its TTL an entry is served while refreshing
+    PRICING_CACHE_SIZE = int(os.environ.get('PRICING_CACHE_SIZE', 256))
+    PRICING_STALE_TTL = int(os.environ.get('PRICING_STALE_TTL', 3600))
+
     # CORS Configuration for frontend access
     CORS_ORIGINS = ["http://localhost:3000", "http://localhost:5173"]
     
@@ -70,8 +206,13 @@ class TestingConfig(Config):
     """Configuration for running tests."""
     TESTING = True
     # Use an in-memory SQLite database for fast, isolated tests
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # (the benchmark suite points this at its synthetic dataset)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
     SQLALCHEMY_ENGINE_OPTIONS = {} # Use default engine options for SQLite
+    CHANGE_FEED_ENABLED = False # Tests poll the feed explicitly
+    ORDER_DETAILS_PREFETCH = 0 # Keep background queries out of tests and benchmarks
+    SEARCH_INDEX_INTERVAL = 0 # Search index is built on first use
+    ADMISSION_ENABLED = False # Benchmarks drive their own concurrency
 
 # A dictionary to map configuration names to their respective classes
 config = {
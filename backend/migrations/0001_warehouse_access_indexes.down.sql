@@ -0,0 +1,40 @@
+-- 0001_warehouse_access_indexes (down): indexes for the warehouse API access patterns.
+-- Generated by `python -m migrations.index_advisor script`; safe to run more than once.
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+-- Chines(Status, Date) INCLUDE(Type, Color, Long, Customer)  [chinese_shipped_by_date]
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Chines_Status_Date' AND object_id = OBJECT_ID('dbo.Chines'))
+    DROP INDEX [IX_Chines_Status_Date] ON [dbo].[Chines];
+GO
+
+-- Chines(Status, Type, Color) INCLUDE(Long)  [chinese_inventory, chinese_details]
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Chines_Status_Type_Color' AND object_id = OBJECT_ID('dbo.Chines'))
+    DROP INDEX [IX_Chines_Status_Type_Color] ON [dbo].[Chines];
+GO
+
+-- Main(Customer, Status) INCLUDE(customerNumber, Invoice, endDate, Date)  [open_orders, order_details]
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Main_Customer_Status' AND object_id = OBJECT_ID('dbo.Main'))
+    DROP INDEX [IX_Main_Customer_Status] ON [dbo].[Main];
+GO
+
+-- Main(Status, Date) INCLUDE(Long2, Customer)  [shipped_by_date]
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Main_Status_Date' AND object_id = OBJECT_ID('dbo.Main'))
+    DROP INDEX [IX_Main_Status_Date] ON [dbo].[Main];
+GO
+
+-- Main(Status, Date3) INCLUDE(Desan, Color, Long2, customerNumber, Customer)  [shipped_by_date3, change_watermarks]
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Main_Status_Date3' AND object_id = OBJECT_ID('dbo.Main'))
+    DROP INDEX [IX_Main_Status_Date3] ON [dbo].[Main];
+GO
+
+-- Main(Desan, Color) INCLUDE(Long2) WHERE Status = N'مستودع' AND Customer = '6000'  [classic_inventory]
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Main_Stock_Desan_Color' AND object_id = OBJECT_ID('dbo.Main'))
+    DROP INDEX [IX_Main_Stock_Desan_Color] ON [dbo].[Main];
+GO
+
+-- Main(Status, Desan, Color) INCLUDE(Long2, Customer, customerNumber)  [scrap_inventory, scrap_details, classic_details]
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Main_Status_Desan_Color' AND object_id = OBJECT_ID('dbo.Main'))
+    DROP INDEX [IX_Main_Status_Desan_Color] ON [dbo].[Main];
+GO
@@ -0,0 +1,416 @@
+"""Index advisor for the warehouse API's ``Main``/``Chines`` access patterns.
+
+Every route filters ``Main`` by ``Status`` together with
+``Customer``/``customerNumber``, ``Desan``, ``Color`` or a date column, and
+``Chines`` by ``Status`` with ``Type``, ``Color`` or ``Date``. This module
+records those query shapes, the indexes that serve them, and checks a target
+database for them: SQL Server through the catalog views, SQLite (tests and the
+synthetic benchmark dataset) through its pragmas.
+
+    python -m migrations.index_advisor check                # which proposals are missing
+    python -m migrations.index_advisor script               # regenerate the T-SQL migrations
+    python -m migrations.index_advisor apply [--revert]     # run the up (or down) migration
+    python -m migrations.index_advisor benchmark --pieces 200000
+
+``--database-url`` overrides the application's configured database. The
+migrations are idempotent (guarded by ``IF [NOT] EXISTS``) and the down
+script drops exactly what the up script creates.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(MIGRATIONS_DIR)
+MIGRATION_NAME = '0001_warehouse_access_indexes'
+
+
+class QueryShape:
+    """A representative query of one access pattern and the routes that issue it."""
+    __slots__ = ('name', 'routes', 'sql')
+
+    def __init__(self, name, routes, sql):
+        self.name = name
+        self.routes = routes
+        self.sql = sql
+
+
+class IndexSpec:
+    """A proposed nonclustered index: key columns, included columns and optional filter."""
+    __slots__ = ('name', 'table', 'keys', 'include', 'where', 'serves')
+
+    def __init__(self, name, table, keys, include=(), where=None, serves=()):
+        self.name = name
+        self.table = table
+        self.keys = tuple(keys)
+        self.include = tuple(include)
+        self.where = where
+        self.serves = tuple(serves)
+
+    def describe(self):
+        definition = f"{self.table}({', '.join(self.keys)})"
+        if self.include:
+            definition += f" INCLUDE({', '.join(self.include)})"
+        if self.where:
+            definition += f" WHERE {self.where}"
+        return definition
+
+    def create_sql(self, dialect):
+        if dialect == 'sqlite':
+            # No INCLUDE in SQLite: trailing key columns make the index covering
+            columns = ', '.join(f'"{column}"' for column in self.keys + self.include)
+            # SQLite has no N'' literals
+            where = ' WHERE ' + re.sub(r"\bN'", "'", self.where) if self.where else ''
+            return f'CREATE INDEX IF NOT EXISTS "{self.name}" ON "{self.table}" ({columns}){where}'
+        statement = f"CREATE NONCLUSTERED INDEX [{self.name}] ON [dbo].[{self.table}] ({', '.join(f'[{c}]' for c in self.keys)})"
+        if self.include:
+            statement += f" INCLUDE ({', '.join(f'[{c}]' for c in self.include)})"
+        if self.where:
+            statement += f" WHERE {self.where}"
+        return (
+            f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{self.name}' AND object_id = OBJECT_ID('dbo.{self.table}'))\n"
+            f"    {statement};"
+        )
+
+    def drop_sql(self, dialect):
+        if dialect == 'sqlite':
+            return f'DROP INDEX IF EXISTS "{self.name}"'
+        return (
+            f"IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{self.name}' AND object_id = OBJECT_ID('dbo.{self.table}'))\n"
+            f"    DROP INDEX [{self.name}] ON [dbo].[{self.table}];"
+        )
+
+
+QUERY_SHAPES = (
+    QueryShape('scrap_inventory', ('/scrap', '/summary', '/live'), """
+        SELECT Desan, COUNT(*), SUM(Long2) FROM Main WHERE Status = 'سقط' GROUP BY Desan ORDER BY Desan DESC
+    """),
+    QueryShape('scrap_details', ('/scrap/details/<desan>', '/scrap/color-details/<desan>/<color>'), """
+        SELECT Desan, Color, COUNT(*), SUM(Long2) FROM Main WHERE Status = 'سقط' AND Desan = :scrap_desan
+        GROUP BY Desan, Color ORDER BY Color DESC
+    """),
+    QueryShape('classic_inventory', ('/classic', '/live'), """
+        SELECT Desan, COUNT(*), SUM(Long2) FROM Main WHERE Status = 'مستودع' AND Customer = '6000'
+        GROUP BY Desan ORDER BY Desan DESC
+    """),
+    QueryShape('classic_details', ('/classic/details/<desan>', '/classic/color-details/<desan>/<color>'), """
+        SELECT Desan, Color, COUNT(*), SUM(Long2) FROM Main
+        WHERE Status = 'مستودع' AND Customer = '6000' AND customerNumber = '6000' AND Desan = :desan
+        GROUP BY Desan, Color ORDER BY Color DESC
+    """),
+    QueryShape('shipped_by_date3', ('/sales/main/*', '/sales/summary', '/export/main'), """
+        SELECT Desan, Color, Long2, customerNumber, Customer FROM Main
+        WHERE Status = 'مشحون' AND Date3 >= :start_date AND Date3 < :end_date
+    """),
+    QueryShape('shipped_by_date', ('/sales/main', '/sales/summary'), """
+        SELECT COUNT(*), SUM(Long2) FROM Main
+        WHERE Status = 'مشحون' AND Date >= :start_date AND Date <= :end_date AND Customer != '6000'
+    """),
+    QueryShape('open_orders', ('/orders-in-progress', '/orders/late', '/orders/ready', '/live'), """
+        SELECT Customer, COUNT(CASE WHEN Status = 'تصنيع' THEN 1 END), MAX(endDate) FROM Main
+        WHERE Status IN ('مستودع', 'تصنيع', 'مصبغة', 'مشحون', 'مستودع الخام') AND customerNumber != '6000'
+          AND Customer NOT IN (
+              SELECT Customer FROM Main GROUP BY Customer
+              HAVING COUNT(DISTINCT CASE WHEN Status != 'مشحون' THEN Status END) = 0
+          )
+        GROUP BY Customer
+    """),
+    QueryShape('order_details', ('/orders/details', '/orders/details/batch'), """
+        SELECT Number, Desan, Color, Long2, Status, Date, Date4, endDate FROM Main
+        WHERE Customer = :order ORDER BY Date DESC
+    """),
+    QueryShape('change_watermarks', ('change feed',), """
+        SELECT Status, COUNT(*), MAX(Number), MAX(Date3) FROM Main GROUP BY Status
+    """),
+    QueryShape('chinese_inventory', ('/chinese', '/summary', '/live'), """
+        SELECT Type, COUNT(*), SUM(Long) FROM Chines WHERE Status = 'مستودع' GROUP BY Type ORDER BY Type
+    """),
+    QueryShape('chinese_details', ('/chinese/details/<type>', '/chinese/color-details/<type>/<color>'), """
+        SELECT Color, COUNT(*) FROM Chines WHERE Type = :type AND Status = 'مستودع' GROUP BY Color ORDER BY Color
+    """),
+    QueryShape('chinese_shipped_by_date', ('/sales/chinese/*', '/sales/summary', '/export/chinese'), """
+        SELECT Type, Color, Long, Customer FROM Chines
+        WHERE Status = 'مشحون' AND Date >= :start_date AND Date < :end_date
+    """),
+)
+
+PROPOSED_INDEXES = (
+    IndexSpec('IX_Main_Status_Desan_Color', 'Main', ('Status', 'Desan', 'Color'),
+              ('Long2', 'Customer', 'customerNumber'),
+              serves=('scrap_inventory', 'scrap_details', 'classic_details')),
+    # Filtered: classic stock is a small slice of the table. Sessions that write
+    # Main need ANSI_NULLS and QUOTED_IDENTIFIER ON once a filtered index exists.
+    IndexSpec('IX_Main_Stock_Desan_Color', 'Main', ('Desan', 'Color'), ('Long2',),
+              where="Status = N'مستودع' AND Customer = '6000'",
+              serves=('classic_inventory',)),
+    IndexSpec('IX_Main_Status_Date3', 'Main', ('Status', 'Date3'),
+              ('Desan', 'Color', 'Long2', 'customerNumber', 'Customer'),
+              serves=('shipped_by_date3', 'change_watermarks')),
+    IndexSpec('IX_Main_Status_Date', 'Main', ('Status', 'Date'), ('Long2', 'Customer'),
+              serves=('shipped_by_date',)),
+    IndexSpec('IX_Main_Customer_Status', 'Main', ('Customer', 'Status'),
+              ('customerNumber', 'Invoice', 'endDate', 'Date'),
+              serves=('open_orders', 'order_details')),
+    IndexSpec('IX_Chines_Status_Type_Color', 'Chines', ('Status', 'Type', 'Color'), ('Long',),
+              serves=('chinese_inventory', 'chinese_details')),
+    IndexSpec('IX_Chines_Status_Date', 'Chines', ('Status', 'Date'), ('Type', 'Color', 'Long', 'Customer'),
+              serves=('chinese_shipped_by_date',)),
+)
+
+_MSSQL_INDEXES_SQL = """
+    SELECT t.name AS table_name, i.name AS index_name, c.name AS column_name,
+           ic.is_included_column, i.filter_definition
+    FROM sys.indexes i
+    JOIN sys.tables t ON t.object_id = i.object_id
+    JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+    JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+    WHERE t.name IN ('Main', 'Chines') AND i.type > 0
+    ORDER BY t.name, i.name, ic.is_included_column, ic.key_ordinal, ic.index_column_id
+"""
+
+
+def existing_indexes(connection):
+    """Indexes on Main/Chines as ``{name: {'table', 'keys', 'include', 'where'}}``."""
+    indexes = {}
+    if connection.dialect.name == 'sqlite':
+        for table in ('Main', 'Chines'):
+            for name, sql in connection.execute(text(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+            ), {'table': table}):
+                columns = [row[2] for row in connection.execute(text(f'PRAGMA index_xinfo("{name}")')) if row[5] and row[2]]
+                where = sql.split(' WHERE ', 1)[1] if sql and ' WHERE ' in sql else None
+                indexes[name] = {'table': table, 'keys': columns, 'include': [], 'where': where}
+        return indexes
+
+    for table, name, column, included, where in connection.execute(text(_MSSQL_INDEXES_SQL)):
+        index = indexes.setdefault(name, {'table': table, 'keys': [], 'include': [], 'where': where})
+        index['include' if included else 'keys'].append(column)
+    return indexes
+
+
+def _normalize_filter(where):
+    return re.sub(r"[\s()\[\]\"]|\bN(?=')", '', where or '').lower()
+
+
+def covering_index(spec, indexes):
+    """Name of an existing index that serves ``spec`` (same leading keys, covers the rest), or None."""
+    wanted_keys = [column.lower() for column in spec.keys]
+    wanted = {column.lower() for column in spec.keys + spec.include}
+    for name, index in indexes.items():
+        if index['table'].lower() != spec.table.lower():
+            continue
+        keys = [column.lower() for column in index['keys']]
+        if keys[:len(wanted_keys)] != wanted_keys:
+            continue
+        if not wanted <= set(keys) | {column.lower() for column in index['include']}:
+            continue
+        if _normalize_filter(index['where']) != _normalize_filter(spec.where):
+            continue
+        return name
+    return None
+
+
+def advise(connection):
+    """One entry per proposed index: whether it (or an equivalent) exists."""
+    indexes = existing_indexes(connection)
+    report = []
+    for spec in PROPOSED_INDEXES:
+        match = covering_index(spec, indexes)
+        report.append({
+            'index': spec.name,
+            'definition': spec.describe(),
+            'serves': list(spec.serves),
+            'status': 'present' if match else 'missing',
+            'existing': match,
+        })
+    return report
+
+
+def migration_script(direction='up', dialect='mssql'):
+    """The T-SQL (``GO``-separated) or SQLite statements of the migration."""
+    specs = PROPOSED_INDEXES if direction == 'up' else tuple(reversed(PROPOSED_INDEXES))
+    if dialect == 'sqlite':
+        return [spec.create_sql('sqlite') if direction == 'up' else spec.drop_sql('sqlite') for spec in specs]
+
+    lines = [
+        f'-- {MIGRATION_NAME} ({direction}): indexes for the warehouse API access patterns.',
+        '-- Generated by `python -m migrations.index_advisor script`; safe to run more than once.',
+        'SET ANSI_NULLS ON;',
+        'SET QUOTED_IDENTIFIER ON;',
+        'GO',
+    ]
+    for spec in specs:
+        lines.append('')
+        lines.append(f"-- {spec.describe()}  [{', '.join(spec.serves)}]")
+        lines.append(spec.create_sql('mssql') if direction == 'up' else spec.drop_sql('mssql'))
+        lines.append('GO')
+    return '\n'.join(lines) + '\n'
+
+
+def migration_path(direction):
+    return os.path.join(MIGRATIONS_DIR, f'{MIGRATION_NAME}.{direction}.sql')
+
+
+def _batches(script):
+    return [batch.strip() for batch in re.split(r'^\s*GO\s*$', script, flags=re.MULTILINE) if batch.strip()]
+
+
+def apply_migration(engine, direction='up'):
+    """Run the up or down migration against ``engine``; returns the statements executed."""
+    if engine.dialect.name == 'sqlite':
+        statements = migration_script(direction, 'sqlite')
+        if direction == 'up':
+            statements.append('ANALYZE')
+    else:
+        with open(migration_path(direction), encoding='utf-8') as handle:
+            statements = _batches(handle.read())
+
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    return statements
+
+
+def _default_database_url():
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from config import config
+    return config[os.environ.get('FLASK_CONFIG', 'development')].SQLALCHEMY_DATABASE_URI
+
+
+def _shape_params(db_path):
+    from benchmarks.run import sample_values
+    sample = sample_values(db_path)
+    end = datetime.now()
+    return {
+        'desan': sample['desan'], 'scrap_desan': sample['scrap_desan'], 'type': sample['type'],
+        'order': sample['order'], 'start_date': end - timedelta(days=90), 'end_date': end,
+    }
+
+
+def _time_shapes(engine, params, repeat):
+    timings = {}
+    with engine.connect() as connection:
+        for shape in QUERY_SHAPES:
+            statement = text(shape.sql)
+            bound = {name: value for name, value in params.items() if f':{name}' in shape.sql}
+            connection.execute(statement, bound).fetchall()  # warm the page cache
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                connection.execute(statement, bound).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[shape.name] = round(statistics.median(samples), 2)
+    return timings
+
+
+def _query_plans(engine, params):
+    """Indexes SQLite chose per shape (from EXPLAIN QUERY PLAN)."""
+    plans = {}
+    with engine.connect() as connection:
+        for shape in QUERY_SHAPES:
+            bound = {name: value for name, value in params.items() if f':{name}' in shape.sql}
+            rows = connection.execute(text('EXPLAIN QUERY PLAN ' + shape.sql), bound).fetchall()
+            used = sorted({match for row in rows for match in re.findall(r'INDEX "?(\w+)"?', str(row[-1]))})
+            plans[shape.name] = used
+    return plans
+
+
+def benchmark(db_path, pieces, repeat=5, output=None):
+    """Time every query shape on a copy of the synthetic dataset before and after the migration."""
+    from benchmarks.synthetic import generate
+    from services import sqlite_compat
+
+    if not os.path.exists(db_path):
+        print(f"Generating {pieces} pieces into {db_path} ...")
+        generate(db_path, pieces)
+    work_path = db_path + '.indexes'
+    shutil.copyfile(db_path, work_path)
+
+    engine = create_engine(f'sqlite:///{os.path.abspath(work_path)}')
+    sqlite_compat.install(engine)
+    params = _shape_params(work_path)
+    try:
+        before = _time_shapes(engine, params, repeat)
+        apply_migration(engine, 'up')
+        after = _time_shapes(engine, params, repeat)
+        plans = _query_plans(engine, params)
+    finally:
+        engine.dispose()
+        os.remove(work_path)
+
+    print(f"{'shape':26s} {'before ms':>10s} {'after ms':>10s} {'speedup':>8s}  index used")
+    for shape in QUERY_SHAPES:
+        speedup = before[shape.name] / after[shape.name] if after[shape.name] else float('inf')
+        print(f"{shape.name:26s} {before[shape.name]:10.2f} {after[shape.name]:10.2f} {speedup:7.1f}x  "
+              f"{', '.join(plans[shape.name]) or '-'}")
+
+    report = {
+        'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'), 'database': db_path, 'repeat': repeat},
+        'shapes': {shape.name: {'before_ms': before[shape.name], 'after_ms': after[shape.name],
+                                'indexes': plans[shape.name], 'routes': list(shape.routes)}
+                   for shape in QUERY_SHAPES},
+    }
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {output}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index advisor for the warehouse API')
+    parser.add_argument('command', choices=('check', 'script', 'apply', 'benchmark'))
+    parser.add_argument('--database-url', help='Target database (default: the configured application database)')
+    parser.add_argument('--revert', action='store_true', help='apply: run the down migration')
+    parser.add_argument('--db', default=os.path.join(BACKEND_DIR, 'benchmarks', 'data', 'synthetic.db'),
+                        help='benchmark: synthetic database (generated if missing)')
+    parser.add_argument('--pieces', type=int, default=200000, help='benchmark: pieces to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='benchmark: runs per query shape')
+    parser.add_argument('--output', help='benchmark: write the results as JSON')
+    args = parser.parse_args()
+
+    if args.command == 'script':
+        for direction in ('up', 'down'):
+            with open(migration_path(direction), 'w', encoding='utf-8') as handle:
+                handle.write(migration_script(direction))
+            print(f"Wrote {migration_path(direction)}")
+        return
+
+    if args.command == 'benchmark':
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        benchmark(args.db, args.pieces, args.repeat, args.output)
+        return
+
+    engine = create_engine(args.database_url or _default_database_url())
+    if args.command == 'apply':
+        direction = 'down' if args.revert else 'up'
+        for statement in apply_migration(engine, direction):
+            print(statement.splitlines()[-1].strip())
+        print(f"Applied {MIGRATION_NAME} ({direction})")
+        return
+
+    with engine.connect() as connection:
+        report = advise(connection)
+    for entry in report:
+        existing = f" (as {entry['existing']})" if entry['existing'] and entry['existing'] != entry['index'] else ''
+        print(f"[{entry['status']:7s}] {entry['index']:30s} {entry['definition']}{existing}")
+        print(f"          serves: {', '.join(entry['serves'])}")
+    missing = sum(entry['status'] == 'missing' for entry in report)
+    print(f"\n{missing} of {len(report)} proposed indexes missing"
+          + (f"; run `python -m migrations.index_advisor apply`" if missing else ''))
+
+
+if __name__ == '__main__':
+    main()
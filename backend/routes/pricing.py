@@ -0,0 +1,142 @@
+from flask import Blueprint, jsonify, current_app
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.singleflight import SingleFlight
+from services.ttl_cache import TTLCache
+
+pricing_bp = Blueprint('pricing', __name__)
+
+# One pooled keep-alive session for all upstream pricing calls
+_session = None
+_session_lock = threading.Lock()
+
+# One TTL+LRU cache of upstream responses per pricing resource
+pricing_caches = {}
+_caches_lock = threading.Lock()
+_inflight = SingleFlight()
+
+
+class UpstreamError(Exception):
+    """The pricing service could not be reached or returned an error."""
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = current_app.config.get('PRICING_POOL_SIZE', 10)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept': 'application/json', 'Content-Type': 'application/json'})
+            _session = session
+        return _session
+
+
+def _get_cache(app, resource):
+    with _caches_lock:
+        cache = pricing_caches.get(resource)
+        if cache is None:
+            ttl = app.config.get('PRICING_CACHE_TTLS', {}).get(resource, app.config.get('PRICING_CACHE_TTL', 300))
+            cache = TTLCache(app.config.get('PRICING_CACHE_SIZE', 256), ttl)
+            pricing_caches[resource] = cache
+        return cache
+
+
+def _fetch_upstream(app, upstream_path):
+    """POST to the pricing service and return its decoded JSON body."""
+    url = app.config['PRICING_API_URL'].rstrip('/') + upstream_path
+    try:
+        response = _get_session().post(url, json={}, timeout=app.config.get('PRICING_TIMEOUT', 10))
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise UpstreamError(str(e)) from e
+
+
+def _refresh(app, resource, upstream_path):
+    """Fetch from upstream once per key at a time and store the result."""
+    def load():
+        body = _fetch_upstream(app, upstream_path)
+        _get_cache(app, resource).put(upstream_path, body)
+        return body
+    return _inflight.do((resource, upstream_path), load)
+
+
+def _revalidate_in_background(app, resource, upstream_path):
+    def run():
+        try:
+            _refresh(app, resource, upstream_path)
+        except UpstreamError as e:
+            app.logger.error(f"Pricing revalidation failed for {upstream_path}: {str(e)}")
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _proxy(resource, upstream_path):
+    """Serve a pricing resource from cache, revalidating or falling back to stale data."""
+    app = current_app._get_current_object()
+    cache = _get_cache(app, resource)
+    stale_ttl = app.config.get('PRICING_STALE_TTL', 3600)
+
+    entry = cache.get_entry(upstream_path)
+    if entry is not None:
+        body, age = entry
+        if age <= cache.ttl:
+            return _cached_response(body, 'HIT')
+        if age <= cache.ttl + stale_ttl:
+            # Stale but recent enough: answer now, refresh for the next caller
+            _revalidate_in_background(app, resource, upstream_path)
+            return _cached_response(body, 'STALE')
+
+    try:
+        return _cached_response(_refresh(app, resource, upstream_path), 'MISS')
+    except UpstreamError as e:
+        if entry is not None:
+            # Upstream is down: any previous answer beats an error
+            return _cached_response(entry[0], 'STALE')
+        current_app.logger.error(f"Error proxying pricing resource {upstream_path}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Pricing service unavailable: {str(e)}'
+        }), 502
+
+
+def _cached_response(body, cache_status):
+    response = jsonify(body)
+    response.headers['X-Cache'] = cache_status
+    return response, 200
+
+
+@pricing_bp.route('/pricing/desans', methods=['GET', 'POST'])
+def get_desans_pricing():
+    """Get the desans price list from the pricing service"""
+    return _proxy('desans', '/desans')
+
+@pricing_bp.route('/pricing/desan/<path:name>', methods=['GET', 'POST'])
+def get_desan_pricing(name):
+    """Get price details for a single desan"""
+    return _proxy('desan', f"/desan/{requests.utils.quote(name, safe='')}")
+
+@pricing_bp.route('/pricing/main_desan', methods=['GET', 'POST'])
+def get_main_desan_pricing():
+    """Get the main desan (tasaneef) categories"""
+    return _proxy('main_desan', '/main_desan')
+
+@pricing_bp.route('/pricing/kalite/<path:name>', methods=['GET', 'POST'])
+def get_kalite_pricing(name):
+    """Get the qualities (kalite) of a main desan"""
+    return _proxy('kalite', f"/kalite/{requests.utils.quote(name, safe='')}")
+
+@pricing_bp.route('/pricing/details/<path:name>', methods=['GET', 'POST'])
+def get_kalite_details_pricing(name):
+    """Get price details for a single quality"""
+    return _proxy('details', f"/details/{requests.utils.quote(name, safe='')}")
+
+@pricing_bp.route('/tasaneef-details-proxy/<path:name>', methods=['GET', 'POST'])
+def get_tasaneef_details(name):
+    """Get the qualities of a tasaneef category (used by TasaneefPricing)"""
+    return _proxy('kalite', f"/kalite/{requests.utils.quote(name, safe='')}")
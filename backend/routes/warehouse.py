@@ -1,22 +1,66 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, Response, jsonify, request, current_app, send_from_directory, stream_with_context
 from sqlalchemy import text
 from flask_sqlalchemy import SQLAlchemy
+from services.records import (
+    ChinesPiece, ChinesStockPiece, MainOrderDetail, MainOrderLine, MainPiece,
+    MainStockPiece, OrderAggregate, records_response
+)
+from services.analytics import load_frame, resolve_window, with_percentages
+from services.cube import DIMENSIONS as CUBE_DIMENSIONS, MEASURES as CUBE_MEASURES, current_cube
+from services.query import fetch_all, fetch_one
+from services.formatting import format_totals
+from services.export import EXPORT_FORMATS, EXPORT_SOURCES, export_available, stream_export
+from services.live import CHANNELS as LIVE_CHANNELS, TooManyClients, live_hub
+from services.orders import OPEN_ORDERS_SQL, order_key
+from services.order_details import load_order_details, prefetch_top_orders
+from services.snapshots import delta_response
+from services.inventory import inventory_query, snapshot_status
+from services.mirror import tag_mirror_response, use_mirror_for_sales
+from services.search import KINDS as SEARCH_KINDS, get_search_index
+from services.profiler import list_profiles, profile_dir, profile_files, profiles_authorized
+from services.admission import admit_request, release_admission, release_on_close
+from services.timeouts import timeout_response
+from services.breaker import remember_or_fall_back, serve_stale_when_open
+from services.read_mode import apply_read_mode, tag_read_mode
+from services.jobs import REPORTS as JOB_REPORTS, job_queue
 
 warehouse_bp = Blueprint('warehouse', __name__)
 
+# Sales reports read the local analytics mirror when it is enabled and synced
+warehouse_bp.before_request(use_mirror_for_sales)
+warehouse_bp.after_request(tag_mirror_response)
+
+# While the database circuit is open, inventory and sales routes answer with their
+# last good response before taking an admission slot
+warehouse_bp.before_request(serve_stale_when_open)
+
+# Cost-class limits keep heavy reports from taking every pooled connection
+# (registered after the mirror hook so mirrored reports are not admitted)
+warehouse_bp.before_request(admit_request)
+warehouse_bp.after_request(release_on_close)
+warehouse_bp.teardown_request(release_admission)
+
+# Reporting routes read in REPORT_READ_MODE (snapshot / dirty reads); registered after
+# the admission hook, which only skips requests that the mirror answers
+warehouse_bp.before_request(apply_read_mode)
+warehouse_bp.after_request(tag_read_mode)
+
+# Remember good responses; database outages fall back to them (stale: true) or a 503
+warehouse_bp.after_request(remember_or_fall_back)
+
+# Statements cancelled by their route's timeout answer with a structured 504
+# (registered last so it runs before the other after_request hooks see the response)
+warehouse_bp.after_request(timeout_response)
+
 @warehouse_bp.route('/scrap', methods=['GET'])
 def get_scrap_warehouse():
     """Get scrap warehouse data using your working SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Your working query
-        sql_query = text("SELECT Desan , COUNT(*) as Desan_Count , Format(SUM(Long2) , 'N1') AS TotalLong FROM Main WHERE Status = 'سقط' GROUP BY Desan ORDER BY Desan DESC")
+        sql_query = inventory_query('scrap')
         
         # Execute the query
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query)
         
         # Convert rows to list of dictionaries
         products = []
@@ -24,15 +68,16 @@ def get_scrap_warehouse():
             product = {
                 'desan': row[0] if row[0] else '',
                 'desan_count': row[1] if len(row) > 1 else 0,
-                'total_long': row[2] if len(row) > 2 else '0.0'
+                'total_long': row[2] if len(row) > 2 else 0.0
             }
             products.append(product)
         
         return jsonify({
             'success': True,
-            'data': products,
+            'data': format_totals(products),
             'warehouse_type': 'scrap',
-            'count': len(products)
+            'count': len(products),
+            'snapshot': snapshot_status()
         }), 200
         
     except Exception as e:
@@ -45,15 +90,11 @@ def get_scrap_warehouse():
 def get_classic_warehouse():
     """Get classic warehouse data using your working SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Your working query for classic warehouse
-        sql_query = text("SELECT Desan , COUNT(*) as Desan_Count , Format(SUM(Long2) , 'N1') AS TotalLong FROM Main WHERE Status = 'مستودع' AND Customer = '6000' GROUP BY Desan ORDER BY Desan DESC")
+        sql_query = inventory_query('classic')
         
         # Execute the query
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query)
         
         # Convert rows to list of dictionaries
         products = []
@@ -61,15 +102,16 @@ def get_classic_warehouse():
             product = {
                 'desan': row[0] if row[0] else '',
                 'desan_count': row[1] if len(row) > 1 else 0,
-                'total_long': row[2] if len(row) > 2 else '0.0'
+                'total_long': row[2] if len(row) > 2 else 0.0
             }
             products.append(product)
         
         return jsonify({
             'success': True,
-            'data': products,
+            'data': format_totals(products),
             'warehouse_type': 'classic',
-            'count': len(products)
+            'count': len(products),
+            'snapshot': snapshot_status()
         }), 200
         
     except Exception as e:
@@ -82,15 +124,11 @@ def get_classic_warehouse():
 def get_chinese_warehouse():
     """Get Chinese warehouse data using the provided SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Updated query to include both count and total length
-        sql_query = text("SELECT Type, COUNT(*) as Type_Count, Format(SUM(Long), 'N1') AS TotalLong FROM Chines WHERE Status = 'مستودع' GROUP BY Type ORDER BY Type")
+        sql_query = inventory_query('chinese')
         
         # Execute the query
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query)
         
         # Convert rows to list of dictionaries
         products = []
@@ -98,15 +136,16 @@ def get_chinese_warehouse():
             product = {
                 'type': row[0] if row[0] else '',
                 'count': row[1] if len(row) > 1 else 0,
-                'total_long': row[2] if len(row) > 2 else '0.0'
+                'total_long': row[2] if len(row) > 2 else 0.0
             }
             products.append(product)
         
         return jsonify({
             'success': True,
-            'data': products,
+            'data': format_totals(products),
             'warehouse_type': 'chinese',
-            'count': len(products)
+            'count': len(products),
+            'snapshot': snapshot_status()
         }), 200
         
     except Exception as e:
@@ -119,23 +158,17 @@ def get_chinese_warehouse():
 def get_warehouse_summary():
     """Get summary statistics for all warehouse types"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Get scrap warehouse summary
-        scrap_query = text("SELECT COUNT(DISTINCT Desan) as unique_desans, SUM(Long2) as total_length FROM Main WHERE Status = 'سقط'")
-        scrap_result = db.session.execute(scrap_query)
-        scrap_row = scrap_result.fetchone()
+        scrap_query = inventory_query('summary_scrap')
+        scrap_row = fetch_one(scrap_query)
         
         # Get classic warehouse summary
-        classic_query = text("SELECT COUNT(DISTINCT Desan) as unique_desans, SUM(Long2) as total_length FROM Main WHERE Status = 'مستودع'")
-        classic_result = db.session.execute(classic_query)
-        classic_row = classic_result.fetchone()
+        classic_query = inventory_query('summary_classic')
+        classic_row = fetch_one(classic_query)
         
         # Get Chinese warehouse summary
-        chinese_query = text("SELECT COUNT(DISTINCT Type) as unique_types, COUNT(*) as total_pieces FROM Chines WHERE Status = 'مستودع'")
-        chinese_result = db.session.execute(chinese_query)
-        chinese_row = chinese_result.fetchone()
+        chinese_query = inventory_query('summary_chinese')
+        chinese_row = fetch_one(chinese_query)
         
         summary = {
             'scrap': {
@@ -154,7 +187,8 @@ def get_warehouse_summary():
         
         return jsonify({
             'success': True,
-            'data': summary
+            'data': summary,
+            'snapshot': snapshot_status()
         }), 200
         
     except Exception as e:
@@ -167,7 +201,6 @@ def get_warehouse_summary():
 def get_sales_summary():
     """Get sales summary with support for different time periods and custom dates"""
     try:
-        db = current_app.extensions['sqlalchemy']
         period = request.args.get('period', 'last_month')
         custom_start_date = request.args.get('start_date')
         custom_end_date = request.args.get('end_date')
@@ -177,9 +210,12 @@ def get_sales_summary():
         
         # Use custom dates if provided, otherwise use period
         if custom_start_date and custom_end_date:
+            # Reject malformed dates up front instead of failing inside the queries
+            datetime.strptime(custom_start_date, '%Y-%m-%d')
+            datetime.strptime(custom_end_date, '%Y-%m-%d')
             start_date = custom_start_date
             end_date = custom_end_date
-            print(f"Sales Summary - Using custom dates: Start: {start_date}, End: {end_date}")
+            current_app.logger.debug(f"Sales Summary - Using custom dates: Start: {start_date}, End: {end_date}")
         else:
             if period == 'yesterday':
                 start_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
@@ -196,91 +232,110 @@ def get_sales_summary():
             else:
                 start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
                 end_date = datetime.now().strftime('%Y-%m-%d')
-            print(f"Sales Summary - Period: {period}, Start: {start_date}, End: {end_date}")
-        
-        # Debug: Check total records in date range without filters
-        debug_query = text("""
-            SELECT COUNT(*) as total_records
-            FROM Main 
-            WHERE Date >= :start_date 
-            AND Date <= :end_date
-        """)
-        debug_result = db.session.execute(debug_query, {
-            'start_date': start_date, 
-            'end_date': end_date
-        })
-        debug_row = debug_result.fetchone()
-        print(f"Total records in date range: {debug_row[0] if debug_row else 0}")
+            current_app.logger.debug(f"Sales Summary - Period: {period}, Start: {start_date}, End: {end_date}")
+        
+        approx = request.args.get('approx') == '1'
+        if approx:
+            # Totals from the sales cube, distinct counts merged from its daily HyperLogLog sketches;
+            # same bounds as the exact queries (Date3 <= 'YYYY-MM-DD' stops at that midnight)
+            cube = current_cube()
+            window = (datetime.strptime(start_date, '%Y-%m-%d'), datetime.strptime(end_date, '%Y-%m-%d'), False)
+            main = cube.approx_summary('main', window)
+            chinese = cube.approx_summary('chinese', window)
+            
+            main_data = {
+                'total_pieces': main['total_pieces'],
+                'total_meters': main['total_meters'],
+                'unique_customers': main['customers'],
+                'unique_products': main['products']
+            }
+            
+            chinese_data = {
+                'total_pieces': chinese['total_pieces'],
+                'total_meters': chinese['total_meters'],
+                'unique_types': chinese['products'],
+                'unique_colors': chinese['colors']
+            }
+        else:
+            # Debug: Check total records in date range without filters
+            debug_query = text("""
+                SELECT COUNT(*) as total_records
+                FROM Main 
+                WHERE Date >= :start_date 
+                AND Date <= :end_date
+            """)
+            debug_row = fetch_one(debug_query, {
+                'start_date': start_date, 
+                'end_date': end_date
+            })
+            current_app.logger.debug(f"Total records in date range: {debug_row[0] if debug_row else 0}")
+        
+            # Debug: Check records with status filter
+            debug_status_query = text("""
+                SELECT COUNT(*) as total_records
+                FROM Main 
+                WHERE Date >= :start_date 
+                AND Date <= :end_date
+                AND Status = 'مشحون'
+            """)
+            debug_status_row = fetch_one(debug_status_query, {
+                'start_date': start_date, 
+                'end_date': end_date
+            })
+            current_app.logger.debug(f"Records with Status='مشحون': {debug_status_row[0] if debug_status_row else 0}")
+              # Main (Classic) sales summary
+            main_query = text("""
+                SELECT 
+                    COUNT(*) as total_pieces,
+                    SUM(Long2) as total_meters,
+                    COUNT(DISTINCT customerNumber) as unique_customers,
+                    COUNT(DISTINCT Desan) as unique_products
+                FROM Main 
+                WHERE Status = 'مشحون' 
+                AND Date3 >= :start_date 
+                AND Date3 <= :end_date
+                AND customerNumber != '6000'
+            """)
         
-        # Debug: Check records with status filter
-        debug_status_query = text("""
-            SELECT COUNT(*) as total_records
-            FROM Main 
-            WHERE Date >= :start_date 
-            AND Date <= :end_date
-            AND Status = 'مشحون'
-        """)
-        debug_status_result = db.session.execute(debug_status_query, {
-            'start_date': start_date, 
-            'end_date': end_date
-        })
-        debug_status_row = debug_status_result.fetchone()
-        print(f"Records with Status='مشحون': {debug_status_row[0] if debug_status_row else 0}")
-          # Main (Classic) sales summary
-        main_query = text("""
-            SELECT 
-                COUNT(*) as total_pieces,
-                SUM(Long2) as total_meters,
-                COUNT(DISTINCT customerNumber) as unique_customers,
-                COUNT(DISTINCT Desan) as unique_products
-            FROM Main 
-            WHERE Status = 'مشحون' 
-            AND Date3 >= :start_date 
-            AND Date3 <= :end_date
-            AND customerNumber != '6000'
-        """)
+            main_row = fetch_one(main_query, {
+                'start_date': start_date, 
+                'end_date': end_date
+            })
         
-        main_result = db.session.execute(main_query, {
-            'start_date': start_date, 
-            'end_date': end_date
-        })
-        main_row = main_result.fetchone()
+            current_app.logger.debug(f"Main query result: {main_row}")
         
-        print(f"Main query result: {main_row}")
+            # Chinese sales summary
+            chinese_query = text("""
+                SELECT 
+                    COUNT(*) as total_pieces,
+                    SUM(Long) as total_meters,
+                    COUNT(DISTINCT Type) as unique_types,
+                    COUNT(DISTINCT Color) as unique_colors
+                FROM Chines 
+                WHERE Status = 'مشحون' 
+                AND Date >= :start_date 
+                AND Date <= :end_date
+            """)
         
-        # Chinese sales summary
-        chinese_query = text("""
-            SELECT 
-                COUNT(*) as total_pieces,
-                SUM(Long) as total_meters,
-                COUNT(DISTINCT Type) as unique_types,
-                COUNT(DISTINCT Color) as unique_colors
-            FROM Chines 
-            WHERE Status = 'مشحون' 
-            AND Date >= :start_date 
-            AND Date <= :end_date
-        """)
+            chinese_row = fetch_one(chinese_query, {
+                'start_date': start_date, 
+                'end_date': end_date
+            })
         
-        chinese_result = db.session.execute(chinese_query, {
-            'start_date': start_date, 
-            'end_date': end_date
-        })
-        chinese_row = chinese_result.fetchone()
-        
-        # Process results
-        main_data = {
-            'total_pieces': main_row[0] if main_row and main_row[0] else 0,
-            'total_meters': float(main_row[1]) if main_row and main_row[1] else 0.0,
-            'unique_customers': main_row[2] if main_row and main_row[2] else 0,
-            'unique_products': main_row[3] if main_row and main_row[3] else 0
-        }
+            # Process results
+            main_data = {
+                'total_pieces': main_row[0] if main_row and main_row[0] else 0,
+                'total_meters': float(main_row[1]) if main_row and main_row[1] else 0.0,
+                'unique_customers': main_row[2] if main_row and main_row[2] else 0,
+                'unique_products': main_row[3] if main_row and main_row[3] else 0
+            }
         
-        chinese_data = {
-            'total_pieces': chinese_row[0] if chinese_row and chinese_row[0] else 0,
-            'total_meters': float(chinese_row[1]) if chinese_row and chinese_row[1] else 0.0,
-            'unique_types': chinese_row[2] if chinese_row and chinese_row[2] else 0,
-            'unique_colors': chinese_row[3] if chinese_row and chinese_row[3] else 0
-        }
+            chinese_data = {
+                'total_pieces': chinese_row[0] if chinese_row and chinese_row[0] else 0,
+                'total_meters': float(chinese_row[1]) if chinese_row and chinese_row[1] else 0.0,
+                'unique_types': chinese_row[2] if chinese_row and chinese_row[2] else 0,
+                'unique_colors': chinese_row[3] if chinese_row and chinese_row[3] else 0
+            }
         
         combined_data = {
             'total_pieces': main_data['total_pieces'] + chinese_data['total_pieces'],
@@ -298,9 +353,16 @@ def get_sales_summary():
             'date_range': {
                 'start_date': start_date,
                 'end_date': end_date
-            }
+            },
+            'approx': approx,
+            'standard_error': round(cube.sketch_error, 4) if approx else None
         }), 200
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -311,7 +373,6 @@ def get_sales_summary():
 def get_main_sales():
     """Get main sales data with period support"""
     try:
-        db = current_app.extensions['sqlalchemy']
         period = request.args.get('period', 'last_month')
         
         # Define date ranges (same logic as summary)
@@ -348,11 +409,10 @@ def get_main_sales():
             ORDER BY period DESC
         """)
         
-        result = db.session.execute(monthly_query, {
+        rows = fetch_all(monthly_query, {
             'start_date': start_date, 
             'end_date': end_date
         })
-        rows = result.fetchall()
         
         data = []
         for row in rows:
@@ -378,7 +438,6 @@ def get_main_sales():
 def get_chinese_sales():
     """Get Chinese sales data with period support"""
     try:
-        db = current_app.extensions['sqlalchemy']
         period = request.args.get('period', 'last_month')
         
         # Define date ranges (same logic as summary)
@@ -414,11 +473,10 @@ def get_chinese_sales():
             ORDER BY period DESC
         """)
         
-        result = db.session.execute(monthly_query, {
+        rows = fetch_all(monthly_query, {
             'start_date': start_date, 
             'end_date': end_date
         })
-        rows = result.fetchall()
         
         data = []
         for row in rows:
@@ -444,105 +502,43 @@ def get_chinese_sales():
 def get_top_products():
     """Get top selling products from both tables with type filtering"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         limit = request.args.get('limit', 10, type=int)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         table_type = request.args.get('type', 'both')
         
+        window = resolve_window(start_date=start_date, end_date=end_date)
+        ttl = current_app.config.get('ANALYTICS_FRAME_TTL', 60)
         results = {}
         
         if table_type in ['main', 'both']:
-            # Build where clause for Main table
-            main_where = "WHERE Status = 'مشحون'"
-            main_params = {}
-            
-            if start_date:
-                main_where += " AND Date3 >= :start_date"
-                main_params['start_date'] = start_date
-            if end_date:
-                main_where += " AND Date3 <= :end_date"
-                main_params['end_date'] = end_date
-            
-            # Top Main products
-            main_query = text(f"""
-                SELECT TOP {limit}
-                    Desan,
-                    COUNT(*) as total_pieces,
-                    SUM(Long2) as total_meters,
-                    COUNT(DISTINCT Customer) as unique_customers
-                FROM Main {main_where}
-                GROUP BY Desan
-                ORDER BY COUNT(*) DESC
-            """)
-            
-            main_result = db.session.execute(main_query, main_params)
-            main_rows = main_result.fetchall()
-            
-            # Convert results
-            main_products = []
-            main_total = sum(row[1] for row in main_rows) if main_rows else 1
+            # Top Main products from the shared shipped-pieces frame
+            frame = load_frame('main', window, ttl)
+            ranked, _ = with_percentages(frame.rank('desan', limit, distinct='order'))
             
-            for row in main_rows:
-                pieces = row[1] if len(row) > 1 else 0
-                main_products.append({
-                    'name': row[0] if row[0] else '',
-                    'total_pieces': pieces,
-                    'total_meters': float(row[2]) if len(row) > 2 and row[2] else 0.0,
-                    'unique_customers': row[3] if len(row) > 3 else 0,
-                    'percentage': round((pieces / main_total) * 100, 1) if main_total > 0 else 0,
-                    'table': 'main'
-                })
-            
-            results['main'] = main_products
+            results['main'] = [{
+                'name': item['key'][0] or '',
+                'total_pieces': item['total_pieces'],
+                'total_meters': item['total_meters'],
+                'unique_customers': item['distinct'],
+                'percentage': item['percentage'],
+                'table': 'main'
+            } for item in ranked]
         
         if table_type in ['chinese', 'both']:
-            # Build where clause for Chinese table
-            chinese_where = "WHERE Status = 'مشحون'"
-            chinese_params = {}
-            
-            if start_date:
-                chinese_where += " AND Date >= :start_date"
-                chinese_params['start_date'] = start_date
-            if end_date:
-                chinese_where += " AND Date <= :end_date"
-                chinese_params['end_date'] = end_date
-            
             # Top Chinese products with Type and Color
-            chinese_query = text(f"""
-                SELECT TOP {limit}
-                    Type,
-                    Color,
-                    COUNT(*) as total_pieces,
-                    SUM(Long) as total_meters,
-                    COUNT(DISTINCT Customer) as unique_customers
-                FROM Chines {chinese_where}
-                GROUP BY Type, Color
-                ORDER BY COUNT(*) DESC
-            """)
+            frame = load_frame('chinese', window, ttl)
+            ranked, _ = with_percentages(frame.rank(('type', 'color'), limit, distinct='customer'))
             
-            chinese_result = db.session.execute(chinese_query, chinese_params)
-            chinese_rows = chinese_result.fetchall()
-            
-            # Convert results
-            chinese_products = []
-            chinese_total = sum(row[2] for row in chinese_rows) if chinese_rows else 1
-            
-            for row in chinese_rows:
-                pieces = row[2] if len(row) > 2 else 0
-                chinese_products.append({
-                    'type': row[0] if row[0] else '',
-                    'color': row[1] if len(row) > 1 and row[1] else '',
-                    'total_pieces': pieces,
-                    'total_meters': float(row[3]) if len(row) > 3 and row[3] else 0.0,
-                    'unique_customers': row[4] if len(row) > 4 else 0,
-                    'percentage': round((pieces / chinese_total) * 100, 1) if chinese_total > 0 else 0,
-                    'table': 'chinese'
-                })
-            
-            results['chinese'] = chinese_products
+            results['chinese'] = [{
+                'type': item['key'][0] or '',
+                'color': item['key'][1] or '',
+                'total_pieces': item['total_pieces'],
+                'total_meters': item['total_meters'],
+                'unique_customers': item['distinct'],
+                'percentage': item['percentage'],
+                'table': 'chinese'
+            } for item in ranked]
         
         return jsonify({
             'success': True,
@@ -559,67 +555,42 @@ def get_top_products():
 def get_chinese_customer_sales():
     """Get Chinese sales grouped by customer for analysis"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         limit = request.args.get('limit', 10, type=int)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         period = request.args.get('period')
         
-        # Build where clause
-        where_clause = "WHERE Status = 'مشحون'"
-        params = {}
-        
-        # Handle special period filters
-        if period == 'yesterday':
-            where_clause = "WHERE Status = 'مشحون' AND CONVERT(date, Date) = CONVERT(date, DATEADD(day, -1, GETDATE()))"
-        elif period == 'last_week' or period == 'week':
-            where_clause = "WHERE Status = 'مشحون' AND Date >= DATEADD(week, -1, GETDATE()) AND Date < GETDATE()"
-        elif period == 'last_month' or period == 'month':
-            where_clause = "WHERE Status = 'مشحون' AND Date >= DATEADD(month, -1, GETDATE()) AND Date < GETDATE()"
-        elif period == 'last_3_months':
-            where_clause = "WHERE Status = 'مشحون' AND Date >= DATEADD(month, -3, GETDATE()) AND Date < GETDATE()"
+        # Rank customers by meters from the shared shipped-pieces frame
+        window = resolve_window(period, start_date, end_date)
+        approx = request.args.get('approx') == '1'
+        if approx:
+            # Whole days from the pre-aggregated sales cube, partial days from small frame loads
+            ranked = current_cube().rank_customers('chinese', window, limit,
+                                                   current_app.config.get('ANALYTICS_FRAME_TTL', 60))
+            customers = [dict(item, customer=item['customer'] or 'غير محدد') for item in ranked]
         else:
-            # Use traditional date filters
-            if start_date:
-                where_clause += " AND Date >= :start_date"
-                params['start_date'] = start_date
-            if end_date:
-                where_clause += " AND Date <= :end_date"
-                params['end_date'] = end_date
-          # Query for customer sales analysis
-        sql_query = text(f"""
-            SELECT TOP {limit}
-                Customer,
-                COUNT(*) as total_pieces,
-                SUM(Long) as total_meters,
-                COUNT(DISTINCT CONCAT(Type, '-', Color)) as unique_products
-            FROM Chines {where_clause}
-            GROUP BY Customer
-            ORDER BY SUM(Long) DESC
-        """)
-        
-        result = db.session.execute(sql_query, params)
-        rows = result.fetchall()
+            frame = load_frame('chinese', window, current_app.config.get('ANALYTICS_FRAME_TTL', 60))
+            ranked = frame.rank('customer', limit, order_by='meters', distinct=('type', 'color'), distinct_nulls=True)
         
-        # Convert results
-        customers = []
-        
-        for row in rows:
-            customers.append({
-                'customer': row[0] if row[0] else 'غير محدد',
-                'total_pieces': row[1] if len(row) > 1 else 0,
-                'total_meters': float(row[2]) if len(row) > 2 and row[2] else 0.0,
-                'unique_products': row[3] if len(row) > 3 else 0
-            })
+            customers = [{
+                'customer': item['key'][0] if item['key'][0] else 'غير محدد',
+                'total_pieces': item['total_pieces'],
+                'total_meters': item['total_meters'],
+                'unique_products': item['distinct']
+            } for item in ranked]
         
         return jsonify({
             'success': True,
             'data': customers,
-            'count': len(customers)
+            'count': len(customers),
+            'approx': approx
         }), 200
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -630,14 +601,12 @@ def get_chinese_customer_sales():
 def get_chinese_sales_detailed():
     """Get detailed Chinese sales data with all fields as requested"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Get query parameters
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         period = request.args.get('period')
         limit = request.args.get('limit', 1000, type=int)
+        record_cls = ChinesPiece.project(request.args.get('fields'))
           # Build where clause for filtering
         where_clause = "WHERE Status = 'مشحون'"
         params = {}
@@ -661,34 +630,29 @@ def get_chinese_sales_detailed():
         # Your exact query structure with additional filtering
         sql_query = text(f"""
             SELECT TOP {limit}
-                Number, Type, Color, Long, Customer, Date 
+                {record_cls.select_list()}
             FROM Chines 
             {where_clause}
             ORDER BY Date DESC
         """)
         
-        result = db.session.execute(sql_query, params)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, params)
         
-        # Convert to list of dictionaries
-        sales_data = []
-        for row in rows:
-            sales_data.append({
-                'number': row[0] if row[0] else '',
-                'type': row[1] if len(row) > 1 and row[1] else '',
-                'color': row[2] if len(row) > 2 and row[2] else '',
-                'length': float(row[3]) if len(row) > 3 and row[3] else 0.0,
-                'customer': row[4] if len(row) > 4 and row[4] else '',
-                'date': row[5].strftime('%Y-%m-%d') if len(row) > 5 and row[5] else ''
-            })
+        # Convert to compact records
+        sales_data = [record_cls.from_row(row) for row in rows]
         
-        return jsonify({
-            'success': True,
-            'data': sales_data,
-            'count': len(sales_data),
-            'query_used': 'SELECT Number, Type, Color, Long, Customer, Date FROM Chines WHERE Status = "مشحون"'
-        }), 200
+        return records_response(
+            sales_data,
+            success=True,
+            count=len(sales_data),
+            query_used=f'SELECT {record_cls.select_list()} FROM Chines WHERE Status = "مشحون"'
+        ), 200
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -699,79 +663,24 @@ def get_chinese_sales_detailed():
 def get_chinese_top_products():
     """Get top Chinese products with Type and Color breakdown"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         limit = request.args.get('limit', 10, type=int)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         period = request.args.get('period')
-          # Build where clause
-        where_clause = "WHERE Status = 'مشحون'"
-        params = {}        # Handle special period filters
-        if period == 'yesterday':
-            where_clause = "WHERE Status = 'مشحون' AND CONVERT(date, Date) = CONVERT(date, DATEADD(day, -1, GETDATE()))"
-        elif period == 'last_week' or period == 'week':
-            where_clause = "WHERE Status = 'مشحون' AND Date >= DATEADD(week, -1, GETDATE()) AND Date < GETDATE()"
-        elif period == 'last_month' or period == 'month':
-            where_clause = "WHERE Status = 'مشحون' AND Date >= DATEADD(month, -1, GETDATE()) AND Date < GETDATE()"
-        elif period == 'last_3_months':
-            where_clause = "WHERE Status = 'مشحون' AND Date >= DATEADD(month, -3, GETDATE()) AND Date < GETDATE()"
-            # Filter for last month data (30 days)
-            where_clause = "WHERE Status = 'مشحون' AND Date >= DATEADD(month, -1, GETDATE()) AND Date < GETDATE()"
-            date_format = "FORMAT(Date, 'yyyy-MM-dd')"
-            group_by = "FORMAT(Date, 'yyyy-MM-dd')"
-            params = {}
-        else:
-            # Base query for Chinese sales with custom dates
-            if period == 'day':
-                date_format = "FORMAT(Date, 'yyyy-MM-dd')"
-                group_by = "FORMAT(Date, 'yyyy-MM-dd')"
-            else:  # default month format
-                date_format = "FORMAT(Date, 'yyyy-MM')"
-                group_by = "FORMAT(Date, 'yyyy-MM')"
-            
-            # Build where clause
-            where_clause = "WHERE Status = 'مشحون'"
-            params = {}
-            
-            if start_date:
-                where_clause += " AND Date >= :start_date"
-                params['start_date'] = start_date
-            if end_date:
-                where_clause += " AND Date <= :end_date"
-                params['end_date'] = end_date
-        
-        # Query for top products with Type and Color
-        sql_query = text(f"""
-            SELECT TOP {limit}
-                Type,
-                Color,
-                COUNT(*) as total_pieces,
-                SUM(Long) as total_meters,
-                COUNT(DISTINCT Customer) as unique_customers
-            FROM Chines {where_clause}
-            GROUP BY Type, Color
-            ORDER BY COUNT(*) DESC
-        """)
         
-        result = db.session.execute(sql_query, params)
-        rows = result.fetchall()
-        
-        # Convert results
-        products = []
-        total_pieces_sum = sum(row[2] for row in rows) if rows else 1  # Avoid division by zero
+        # Top products with Type and Color from the shared shipped-pieces frame
+        window = resolve_window(period, start_date, end_date)
+        frame = load_frame('chinese', window, current_app.config.get('ANALYTICS_FRAME_TTL', 60))
+        ranked, total_pieces_sum = with_percentages(frame.rank(('type', 'color'), limit, distinct='customer'))
         
-        for row in rows:
-            pieces = row[2] if len(row) > 2 else 0
-            products.append({
-                'type': row[0] if row[0] else '',
-                'color': row[1] if len(row) > 1 and row[1] else '',
-                'total_pieces': pieces,
-                'total_meters': float(row[3]) if len(row) > 3 and row[3] else 0.0,
-                'unique_customers': row[4] if len(row) > 4 else 0,
-                'percentage': round((pieces / total_pieces_sum) * 100, 1) if total_pieces_sum > 0 else 0
-            })
+        products = [{
+            'type': item['key'][0] or '',
+            'color': item['key'][1] or '',
+            'total_pieces': item['total_pieces'],
+            'total_meters': item['total_meters'],
+            'unique_customers': item['distinct'],
+            'percentage': item['percentage']
+        } for item in ranked]
         
         return jsonify({
             'success': True,
@@ -790,14 +699,12 @@ def get_chinese_top_products():
 def get_main_sales_detailed():
     """Get detailed Main sales data using the provided SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Get query parameters
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         period = request.args.get('period')
         limit = request.args.get('limit', 1000, type=int)
+        record_cls = MainPiece.project(request.args.get('fields'))
         
         # Build where clause for filtering
         where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000'"
@@ -817,39 +724,40 @@ def get_main_sales_detailed():
                 where_clause += " AND Date3 <= :end_date"
                 params['end_date'] = end_date
         
+        # Without customer_name the join only has to keep pieces whose customer exists
+        if record_cls.uses_table('Customers'):
+            customers_join = "JOIN Customers ON Main.customerNumber = Customers.Number"
+        else:
+            customers_join = ""
+            where_clause += " AND EXISTS (SELECT 1 FROM Customers WHERE Customers.Number = Main.customerNumber)"
+        
         # Your exact query structure with additional filtering based on the provided SQL
         sql_query = text(f"""
             SELECT TOP {limit}
-                Main.Number, Main.Desan, Main.Color, Main.Long2, Main.Date3, Main.customerNumber, Customers.Name
+                {record_cls.select_list()}
             FROM Main 
-            JOIN Customers ON Main.customerNumber = Customers.Number
+            {customers_join}
             {where_clause}
             ORDER BY Main.Date3 DESC
         """)
         
-        result = db.session.execute(sql_query, params)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, params)
         
-        # Convert to list of dictionaries
-        sales_data = []
-        for row in rows:
-            sales_data.append({
-                'number': row[0] if row[0] else '',
-                'desan': row[1] if len(row) > 1 and row[1] else '',
-                'color': row[2] if len(row) > 2 and row[2] else '',
-                'length': float(row[3]) if len(row) > 3 and row[3] else 0.0,
-                'date': row[4].strftime('%Y-%m-%d') if len(row) > 4 and row[4] else '',
-                'customer_number': row[5] if len(row) > 5 and row[5] else '',
-                'customer_name': row[6] if len(row) > 6 and row[6] else ''
-            })
+        # Convert to compact records
+        sales_data = [record_cls.from_row(row) for row in rows]
         
-        return jsonify({
-            'success': True,
-            'data': sales_data,
-            'count': len(sales_data),
-            'query_used': 'SELECT Main.Number, Main.Desan, Main.Color, Main.Long2, Main.Date3, Main.customerNumber, Customers.Name FROM Main JOIN Customers WHERE Status = "مشحون" AND customerNumber != "6000"'
-        }), 200
+        return records_response(
+            sales_data,
+            success=True,
+            count=len(sales_data),
+            query_used=f'SELECT {record_cls.select_list()} FROM Main {"JOIN Customers " if customers_join else ""}WHERE Status = "مشحون" AND customerNumber != "6000"'
+        ), 200
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -860,68 +768,46 @@ def get_main_sales_detailed():
 def get_main_customer_sales():
     """Get Main sales grouped by customer for analysis"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         limit = request.args.get('limit', 10, type=int)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        period = request.args.get('period')        # Build where clause
-        where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000'"
-        params = {}
+        period = request.args.get('period')
         
-        # Handle special period filters
-        if period == 'yesterday':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND CONVERT(date, Date3) = CONVERT(date, DATEADD(day, -1, GETDATE()))"
-        elif period == 'last_week' or period == 'week':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND Date3 >= DATEADD(week, -1, GETDATE()) AND Date3 < GETDATE()"
-        elif period == 'last_month' or period == 'month':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND Date3 >= DATEADD(month, -1, GETDATE()) AND Date3 < GETDATE()"
-        elif period == 'last_3_months':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND Date3 >= DATEADD(month, -3, GETDATE()) AND Date3 < GETDATE()"
+        # Rank customers by meters from the shared shipped-pieces frame,
+        # keeping only pieces shipped to a known customer (not stock '6000')
+        window = resolve_window(period, start_date, end_date)
+        approx = request.args.get('approx') == '1'
+        if approx:
+            # Whole days from the pre-aggregated sales cube, partial days from small frame loads
+            ranked = current_cube().rank_customers('main', window, limit,
+                                                   current_app.config.get('ANALYTICS_FRAME_TTL', 60))
+            customers = [dict(item, customer=item['customer'] or 'غير محدد') for item in ranked]
         else:
-            # Use traditional date filters
-            if start_date:
-                where_clause += " AND Date3 >= :start_date"
-                params['start_date'] = start_date
-            if end_date:
-                where_clause += " AND Date3 <= :end_date"
-                params['end_date'] = end_date
-        
-        # Query for customer sales analysis
-        sql_query = text(f"""
-            SELECT TOP {limit}
-                Customers.Name,
-                COUNT(*) as total_pieces,
-                SUM(Main.Long2) as total_meters,
-                COUNT(DISTINCT CONCAT(Main.Desan, '-', Main.Color)) as unique_products
-            FROM Main 
-            JOIN Customers ON Main.customerNumber = Customers.Number
-            {where_clause}
-            GROUP BY Customers.Name
-            ORDER BY SUM(Main.Long2) DESC
-        """)
-        
-        result = db.session.execute(sql_query, params)
-        rows = result.fetchall()
-        
-        # Convert results
-        customers = []
-        
-        for row in rows:
-            customers.append({
-                'customer': row[0] if row[0] else 'غير محدد',
-                'total_pieces': row[1] if len(row) > 1 else 0,
-                'total_meters': float(row[2]) if len(row) > 2 and row[2] else 0.0,
-                'unique_products': row[3] if len(row) > 3 else 0
-            })
+            frame = load_frame('main', window, current_app.config.get('ANALYTICS_FRAME_TTL', 60))
+            ranked = frame.rank(
+                'customer_name', limit, order_by='meters', distinct=('desan', 'color'), distinct_nulls=True,
+                where=frame.to_customer & frame.is_known('customer_name')
+            )
+        
+            customers = [{
+                'customer': item['key'][0] if item['key'][0] else 'غير محدد',
+                'total_pieces': item['total_pieces'],
+                'total_meters': item['total_meters'],
+                'unique_products': item['distinct']
+            } for item in ranked]
         
         return jsonify({
             'success': True,
             'data': customers,
-            'count': len(customers)
+            'count': len(customers),
+            'approx': approx
         }), 200
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -932,73 +818,33 @@ def get_main_customer_sales():
 def get_main_top_products():
     """Get top Main products with Desan and Color breakdown using the provided query logic"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         limit = request.args.get('limit', 10, type=int)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         period = request.args.get('period')
         
-        # Build where clause based on the provided SQL query
-        where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000'"
-        params = {}
+        # Top products with Desan and Color from the shared shipped-pieces frame
+        window = resolve_window(period, start_date, end_date)
+        frame = load_frame('main', window, current_app.config.get('ANALYTICS_FRAME_TTL', 60))
+        ranked, total_pieces_sum = with_percentages(
+            frame.rank(('desan', 'color'), limit, distinct='customer_number', where=frame.to_customer)
+        )
+        
+        products = [{
+            'type': item['key'][0] or '',
+            'color': item['key'][1] or '',
+            'total_pieces': item['total_pieces'],
+            'total_meters': item['total_meters'],
+            'unique_customers': item['distinct'],
+            'percentage': item['percentage']
+        } for item in ranked]
         
-        # Handle special period filters
-        if period == 'yesterday':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND CONVERT(date, Date3) = CONVERT(date, DATEADD(day, -1, GETDATE()))"
-        elif period == 'last_week' or period == 'week':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND Date3 >= DATEADD(week, -1, GETDATE()) AND Date3 < GETDATE()"
-        elif period == 'last_month' or period == 'month':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND Date3 >= DATEADD(month, -1, GETDATE()) AND Date3 < GETDATE()"
-        elif period == 'last_3_months':
-            where_clause = "WHERE Status = 'مشحون' AND customerNumber != '6000' AND Date3 >= DATEADD(month, -3, GETDATE()) AND Date3 < GETDATE()"
-        else:
-            # Use traditional date filters
-            if start_date:
-                where_clause += " AND Date3 >= :start_date"
-                params['start_date'] = start_date
-            if end_date:
-                where_clause += " AND Date3 <= :end_date"
-                params['end_date'] = end_date
-        
-        # Query for top products with Desan and Color (similar to the provided SQL structure)
-        sql_query = text(f"""
-            SELECT TOP {limit}
-                Desan,
-                Color,
-                COUNT(*) as total_pieces,
-                SUM(Long2) as total_meters,
-                COUNT(DISTINCT customerNumber) as unique_customers
-            FROM Main {where_clause}
-            GROUP BY Desan, Color
-            ORDER BY COUNT(*) DESC
-        """)
-        
-        result = db.session.execute(sql_query, params)
-        rows = result.fetchall()
-        
-        # Convert results
-        products = []
-        total_pieces_sum = sum(row[2] for row in rows) if rows else 1  # Avoid division by zero
-        
-        for row in rows:
-            pieces = row[2] if len(row) > 2 else 0
-            products.append({
-                'type': row[0] if row[0] else '',
-                'color': row[1] if len(row) > 1 and row[1] else '',
-                'total_pieces': pieces,
-                'total_meters': float(row[3]) if len(row) > 3 and row[3] else 0.0,
-                'unique_customers': row[4] if len(row) > 4 else 0,
-                'percentage': round((pieces / total_pieces_sum) * 100, 1) if total_pieces_sum > 0 else 0
-            })
-        
-        return jsonify({
-            'success': True,
-            'data': products,
-            'count': len(products),
-            'total_pieces': total_pieces_sum
-        }), 200
+        return jsonify({
+            'success': True,
+            'data': products,
+            'count': len(products),
+            'total_pieces': total_pieces_sum
+        }), 200
         
     except Exception as e:
         return jsonify({
@@ -1010,56 +856,16 @@ def get_main_top_products():
 def get_orders_in_progress():
     """Get orders in progress with aggregated status counts and invoice"""
     try:
-        db = current_app.extensions['sqlalchemy']
-        sql_query = text("""
-            SELECT
-                Main.Customer,
-                Main.customerNumber,
-                Customers.name,
-                MAX(Main.Invoice) AS Invoice,
-                COUNT(CASE WHEN Main.Status = 'مستودع' THEN 1 END) AS [في مستودع],
-                COUNT(CASE WHEN Main.Status = 'تصنيع' THEN 1 END) AS [في تصنيع],
-                COUNT(CASE WHEN Main.Status = 'مصبغة' THEN 1 END) AS [في مصبغة],
-                COUNT(CASE WHEN Main.Status = 'مستودع الخام' THEN 1 END) AS [في مستودع الخام],
-                COUNT(CASE WHEN Main.Status = 'مشحون' THEN 1 END) AS [مشحون],
-                (COUNT(CASE WHEN Main.Status = 'مستودع' THEN 1 END)
-                 + COUNT(CASE WHEN Main.Status = 'تصنيع' THEN 1 END)
-                 + COUNT(CASE WHEN Main.Status = 'مصبغة' THEN 1 END)
-                 + COUNT(CASE WHEN Main.Status = 'مستودع الخام' THEN 1 END)
-                 + COUNT(CASE WHEN Main.Status = 'مشحون' THEN 1 END)) AS Totals,
-                MAX(Main.endDate) AS MaxEndDate
-            FROM Main
-            JOIN Customers ON Main.customerNumber = Customers.Number
-            WHERE Main.Status IN ('مستودع', 'تصنيع', 'مصبغة', 'مشحون', 'مستودع الخام')
-              AND Main.customerNumber != '6000'
-              AND Main.Customer NOT IN (
-                  SELECT Customer FROM Main
-                  GROUP BY Customer
-                  HAVING COUNT(DISTINCT CASE WHEN Status != 'مشحون' THEN Status END) = 0
-              )
-            GROUP BY Main.Customer, Main.customerNumber, Customers.name
-            ORDER BY MaxEndDate DESC
-        """)
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        sql_query = text(OPEN_ORDERS_SQL)
+        rows = fetch_all(sql_query)
 
-        orders = []
-        for row in rows:
-            orders.append({
-                'customer': row[0] or '',
-                'customer_number': row[1] or '',
-                'customer_name': row[2] or '',
-                'invoice': row[3] or '',
-                'في_مستودع': row[4] or 0,
-                'في_تصنيع': row[5] or 0,
-                'في_مصبغة': row[6] or 0,
-                'في_مستودع_الخام': row[7] or 0,
-                'مشحون': row[8] or 0,
-                'totals': row[9] or 0,
-                'max_end_date': row[10].isoformat() if row[10] else None
-            })
+        orders = [OrderAggregate.from_row(row) for row in rows]
+
+        # Warm the details cache for the rows most likely to be opened next
+        prefetch_top_orders(orders)
 
-        return jsonify({ 'success': True, 'data': orders }), 200
+        return delta_response('orders_in_progress', orders, key=order_key,
+                              since=request.args.get('since'), success=True), 200
 
     except Exception as e:
         return jsonify({ 'success': False, 'error': str(e) }), 500
@@ -1068,7 +874,6 @@ def get_orders_in_progress():
 def get_late_orders():
     """Get late orders - orders that are past their due date and not completed"""
     try:
-        db = current_app.extensions['sqlalchemy']
         sql_query = text("""
             SELECT
                 Main.Customer,
@@ -1103,26 +908,15 @@ def get_late_orders():
                    OR COUNT(CASE WHEN Main.Status = 'مستودع الخام' THEN 1 END) > 0)  -- Not completed orders
             ORDER BY MaxEndDate DESC
         """)
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query)
 
-        orders = []
-        for row in rows:
-            orders.append({
-                'customer': row[0] or '',
-                'customer_number': row[1] or '',
-                'customer_name': row[2] or '',
-                'invoice': row[3] or '',
-                'في_مستودع': row[4] or 0,
-                'في_تصنيع': row[5] or 0,
-                'في_مصبغة': row[6] or 0,
-                'في_مستودع_الخام': row[7] or 0,
-                'مشحون': row[8] or 0,
-                'totals': row[9] or 0,
-                'max_end_date': row[10].isoformat() if row[10] else None
-            })
+        orders = [OrderAggregate.from_row(row) for row in rows]
+
+        # Warm the details cache for the rows most likely to be opened next
+        prefetch_top_orders(orders)
 
-        return jsonify({ 'success': True, 'data': orders }), 200
+        return delta_response('orders_late', orders, key=order_key,
+                              since=request.args.get('since'), success=True), 200
 
     except Exception as e:
         return jsonify({ 'success': False, 'error': str(e) }), 500
@@ -1131,53 +925,29 @@ def get_late_orders():
 def get_all_orders():
     """Get all orders data from multiple sources using various SQL queries"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
+        # ?fields=customer,status selects only those columns
+        record_cls = MainOrderLine.project(request.args.get('fields'))
         
         # Query to get all orders with their status
-        sql_query = text("""
-            SELECT 
-                Customer as customer,
-                Desan as desan,
-                Long as length,
-                Date1 as order_date,
-                Date2 as start_date,
-                Date3 as end_date,
-                في_تصنيع as in_manufacturing,
-                في_مصبغة as in_dyeing,
-                في_مستودع_الخام as in_raw_warehouse,
-                Status as status
+        sql_query = text(f"""
+            SELECT {record_cls.select_list()}
             FROM Main
             ORDER BY Date1 DESC
         """)
         
         # Execute the query
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query)
         
-        # Convert rows to list of dictionaries
-        orders = []
-        for row in rows:
-            order = {
-                'customer': row[0] if row[0] else '',
-                'desan': row[1] if row[1] else '',
-                'length': float(row[2]) if row[2] else 0.0,
-                'order_date': row[3].strftime('%Y-%m-%d') if row[3] else '',
-                'start_date': row[4].strftime('%Y-%m-%d') if row[4] else '',
-                'end_date': row[5].strftime('%Y-%m-%d') if row[5] else '',
-                'in_manufacturing': row[6] if row[6] is not None else 0,
-                'in_dyeing': row[7] if row[7] is not None else 0,
-                'in_raw_warehouse': row[8] if row[8] is not None else 0,
-                'status': row[9] if row[9] else ''
-            }
-            orders.append(order)
+        # Convert rows to compact records
+        orders = [record_cls.from_row(row) for row in rows]
         
-        return jsonify({
-            'success': True,
-            'data': orders,
-            'count': len(orders)
-        }), 200
+        return records_response(orders, success=True, count=len(orders)), 200
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1188,9 +958,6 @@ def get_all_orders():
 def get_orders_summary():
     """Get summary statistics for orders"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Query to get order summary with enhanced calculations
         sql_query = text("""
             SELECT 
@@ -1204,8 +971,7 @@ def get_orders_summary():
         """)
         
         # Execute the query
-        result = db.session.execute(sql_query)
-        row = result.fetchone()
+        row = fetch_one(sql_query)
         
         if row:
             summary = {
@@ -1241,15 +1007,11 @@ def get_orders_summary():
 def get_classic_warehouse_details(desan):
     """Get classic warehouse details by desan using the provided SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # SQL query using the provided format with desan parameter
-        sql_query = text("SELECT Desan, Color, COUNT(*) as Desan_Count, Format(SUM(Long2), 'N1') AS TotalLong FROM Main WHERE Status = 'مستودع' and Customer = '6000' and customerNumber = '6000' AND Desan = :desan GROUP BY Desan, Color ORDER BY Color DESC")
+        sql_query = inventory_query('classic_details')
         
         # Execute the query with the desan parameter
-        result = db.session.execute(sql_query, {'desan': desan})
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, {'desan': desan})
         
         # Convert rows to list of dictionaries
         details = []
@@ -1258,16 +1020,17 @@ def get_classic_warehouse_details(desan):
                 'desan': row[0] if row[0] else '',
                 'color': row[1] if row[1] else '',
                 'desan_count': row[2] if len(row) > 2 else 0,
-                'total_long': row[3] if len(row) > 3 else '0.0'
+                'total_long': row[3] if len(row) > 3 else 0.0
             }
             details.append(detail)
         
         return jsonify({
             'success': True,
-            'data': details,
+            'data': format_totals(details),
             'warehouse_type': 'classic',
             'desan': desan,
-            'count': len(details)
+            'count': len(details),
+            'snapshot': snapshot_status()
         }), 200
         
     except Exception as e:
@@ -1280,35 +1043,23 @@ def get_classic_warehouse_details(desan):
 def get_classic_color_details(desan, color):
     """Get classic warehouse color details by desan and color using the provided SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # SQL query using the provided format with desan and color parameters
         sql_query = text("SELECT Number, Long2, Date3, Nots FROM Main WHERE Status = 'مستودع' AND Customer = '6000' and customerNumber = '6000' AND Desan = :desan AND Color = :color ORDER BY Number DESC")
         
         # Execute the query with the desan and color parameters
-        result = db.session.execute(sql_query, {'desan': desan, 'color': color})
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, {'desan': desan, 'color': color})
         
-        # Convert rows to list of dictionaries
-        details = []
-        for row in rows:
-            detail = {
-                'number': row[0] if row[0] else '',
-                'long2': float(row[1]) if row[1] else 0.0,
-                'date3': row[2].strftime('%Y-%m-%d') if row[2] else '',
-                'notes': row[3] if row[3] else ''
-            }
-            details.append(detail)
+        # Convert rows to compact records
+        details = [MainStockPiece.from_row(row) for row in rows]
         
-        return jsonify({
-            'success': True,
-            'data': details,
-            'warehouse_type': 'classic',
-            'desan': desan,
-            'color': color,
-            'count': len(details)
-        }), 200
+        return records_response(
+            details,
+            success=True,
+            warehouse_type='classic',
+            desan=desan,
+            color=color,
+            count=len(details)
+        ), 200
         
     except Exception as e:
         return jsonify({
@@ -1320,15 +1071,11 @@ def get_classic_color_details(desan, color):
 def get_scrap_warehouse_details(desan):
     """Get scrap warehouse details by desan using the provided SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # SQL query using the provided format with desan parameter
-        sql_query = text("SELECT Desan, Color, COUNT(*) as Desan_Count, Format(SUM(Long2), 'N1') AS TotalLong FROM Main WHERE Status = 'سقط' AND Desan = :desan GROUP BY Desan, Color ORDER BY Color DESC")
+        sql_query = inventory_query('scrap_details')
         
         # Execute the query with the desan parameter
-        result = db.session.execute(sql_query, {'desan': desan})
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, {'desan': desan})
         
         # Convert rows to list of dictionaries
         details = []
@@ -1337,16 +1084,17 @@ def get_scrap_warehouse_details(desan):
                 'desan': row[0] if row[0] else '',
                 'color': row[1] if row[1] else '',
                 'desan_count': row[2] if len(row) > 2 else 0,
-                'total_long': row[3] if len(row) > 3 else '0.0'
+                'total_long': row[3] if len(row) > 3 else 0.0
             }
             details.append(detail)
         
         return jsonify({
             'success': True,
-            'data': details,
+            'data': format_totals(details),
             'warehouse_type': 'scrap',
             'desan': desan,
-            'count': len(details)
+            'count': len(details),
+            'snapshot': snapshot_status()
         }), 200
         
     except Exception as e:
@@ -1359,35 +1107,23 @@ def get_scrap_warehouse_details(desan):
 def get_scrap_color_details(desan, color):
     """Get scrap warehouse color details by desan and color"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # SQL query for Level 3 scrap warehouse details
         sql_query = text("SELECT Number, Long2, Date3, Nots FROM Main WHERE Status = 'سقط' AND Desan = :desan AND Color = :color ORDER BY Number DESC")
         
         # Execute the query with the desan and color parameters
-        result = db.session.execute(sql_query, {'desan': desan, 'color': color})
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, {'desan': desan, 'color': color})
         
-        # Convert rows to list of dictionaries
-        details = []
-        for row in rows:
-            detail = {
-                'number': row[0] if row[0] else '',
-                'long2': float(row[1]) if row[1] else 0.0,
-                'date3': row[2].strftime('%Y-%m-%d') if row[2] else '',
-                'notes': row[3] if row[3] else ''
-            }
-            details.append(detail)
+        # Convert rows to compact records
+        details = [MainStockPiece.from_row(row) for row in rows]
         
-        return jsonify({
-            'success': True,
-            'data': details,
-            'warehouse_type': 'scrap',
-            'desan': desan,
-            'color': color,
-            'count': len(details)
-        }), 200
+        return records_response(
+            details,
+            success=True,
+            warehouse_type='scrap',
+            desan=desan,
+            color=color,
+            count=len(details)
+        ), 200
         
     except Exception as e:
         return jsonify({
@@ -1399,15 +1135,11 @@ def get_scrap_color_details(desan, color):
 def get_chinese_warehouse_details(type):
     """Get Chinese warehouse details by type using the provided SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # SQL query using the provided format with type parameter
-        sql_query = text("SELECT Color, COUNT(*) as Count FROM Chines WHERE Type = :type AND Status = 'مستودع' GROUP BY Color ORDER BY Color")
+        sql_query = inventory_query('chinese_details')
         
         # Execute the query with the type parameter
-        result = db.session.execute(sql_query, {'type': type})
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, {'type': type})
         
         # Convert rows to list of dictionaries
         details = []
@@ -1424,7 +1156,8 @@ def get_chinese_warehouse_details(type):
             'data': details,
             'warehouse_type': 'chinese',
             'type': type,
-            'count': len(details)
+            'count': len(details),
+            'snapshot': snapshot_status()
         }), 200
         
     except Exception as e:
@@ -1437,35 +1170,23 @@ def get_chinese_warehouse_details(type):
 def get_chinese_color_details(type, color):
     """Get Chinese warehouse color details by type and color using the provided SQL query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # SQL query using the provided format with type and color parameters
         sql_query = text("SELECT Number, Color, Type, Long FROM Chines WHERE Type = :type AND Color = :color AND Status = 'مستودع' ORDER BY Number")
         
         # Execute the query with the type and color parameters
-        result = db.session.execute(sql_query, {'type': type, 'color': color})
-        rows = result.fetchall()
+        rows = fetch_all(sql_query, {'type': type, 'color': color})
         
-        # Convert rows to list of dictionaries
-        details = []
-        for row in rows:
-            detail = {
-                'number': row[0] if row[0] else '',
-                'color': row[1] if row[1] else '',
-                'type': row[2] if row[2] else '',
-                'long': float(row[3]) if row[3] else 0.0
-            }
-            details.append(detail)
+        # Convert rows to compact records
+        details = [ChinesStockPiece.from_row(row) for row in rows]
         
-        return jsonify({
-            'success': True,
-            'data': details,
-            'warehouse_type': 'chinese',
-            'type': type,
-            'color': color,
-            'count': len(details)
-        }), 200
+        return records_response(
+            details,
+            success=True,
+            warehouse_type='chinese',
+            type=type,
+            color=color,
+            count=len(details)
+        ), 200
         
     except Exception as e:
         return jsonify({
@@ -1477,14 +1198,10 @@ def get_chinese_color_details(type, color):
 def test_chinese_connection():
     """Test Chinese table connection and basic query"""
     try:
-        # Get database instance from current_app
-        db = current_app.extensions['sqlalchemy']
-        
         # Simple test query
         sql_query = text("SELECT TOP 5 Type, Color, Long FROM Chines WHERE Status = 'مشحون'")
         
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query)
         
         # Convert results
         test_data = []
@@ -1513,7 +1230,6 @@ def test_chinese_connection():
 def get_ready_orders():
     """Get ready orders - orders that are completed and ready for shipping"""
     try:
-        db = current_app.extensions['sqlalchemy']
         sql_query = text("""
             SELECT
                 Main.Customer,
@@ -1548,94 +1264,410 @@ def get_ready_orders():
               AND COUNT(CASE WHEN Main.Status = 'مستودع' THEN 1 END) > 0  -- Has items in warehouse
             ORDER BY MaxEndDate DESC
         """)
-        result = db.session.execute(sql_query)
-        rows = result.fetchall()
+        rows = fetch_all(sql_query)
 
-        orders = []
-        for row in rows:
-            orders.append({
-                'customer': row[0] or '',
-                'customer_number': row[1] or '',
-                'customer_name': row[2] or '',
-                'invoice': row[3] or '',
-                'في_مستودع': row[4] or 0,
-                'في_تصنيع': row[5] or 0,
-                'في_مصبغة': row[6] or 0,
-                'في_مستودع_الخام': row[7] or 0,
-                'مشحون': row[8] or 0,
-                'totals': row[9] or 0,                'max_end_date': row[10].isoformat() if row[10] else None
-            })
+        orders = [OrderAggregate.from_row(row) for row in rows]
+
+        # Warm the details cache for the rows most likely to be opened next
+        prefetch_top_orders(orders)
 
-        print(f"Ready Orders: Found {len(orders)} orders")  # Debug log
+        current_app.logger.debug(f"Ready Orders: Found {len(orders)} orders")
         if orders:
-            print(f"Sample invoice values: {[order['invoice'] for order in orders[:3]]}")  # Debug log
+            current_app.logger.debug(f"Sample invoice values: {[order.invoice for order in orders[:3]]}")
 
-        return jsonify({ 'success': True, 'data': orders }), 200
+        return delta_response('orders_ready', orders, key=order_key,
+                              since=request.args.get('since'), success=True), 200
 
     except Exception as e:
-        print(f"Error in get_ready_orders: {str(e)}")
+        current_app.logger.error(f"Error in get_ready_orders: {str(e)}")
         return jsonify({ 'success': False, 'error': str(e) }), 500
 
 @warehouse_bp.route('/orders/details', methods=['GET'])
 def get_order_details():
     """Get order details by order number"""
     try:
-        db = current_app.extensions['sqlalchemy']
         order_number = request.args.get('orderNumber')
         
         if not order_number:
             return jsonify({
                 'success': False,
                 'error': 'Order number is required'
-            }), 400        # Query to get order details
-        sql_query = text("""
-            SELECT 
-                Customers.Name AS customerName,
-                Main.Number,
-                Main.Desan,
-                Main.Color,
-                Main.Long2,
-                Main.Status,
-                Main.customerNumber,
-                Main.Customer,
-                Main.Date,
-                Main.Date4,
-                Main.endDate
-            FROM Main
-            JOIN Customers ON Main.customerNumber = Customers.Number
-            WHERE Customer = :order_number
-            ORDER BY Date DESC
-        """)
+            }), 400
         
-        result = db.session.execute(sql_query, {'order_number': order_number})
-        rows = result.fetchall()        # Convert rows to list of dictionaries
-        details = []
-        for row in rows:
-            detail = {
-                'customerName': row[0] if row[0] else 'غير معروف',  # Customers.Name
-                'Number': row[1] if row[1] else '',  # Main.Number
-                'Desan': row[2] if row[2] else '',   # Main.Desan
-                'Color': row[3] if row[3] else '',   # Main.Color
-                'Long2': str(row[4]) if row[4] else '0',  # Main.Long2
-                'Status': row[5] if row[5] else '',  # Main.Status
-                'customerNumber': str(row[6]) if row[6] else '',  # Main.customerNumber
-                'Customer': str(row[7]) if row[7] else '',  # Main.Customer
-                'Date': row[8].isoformat() if row[8] else None,   # Main.Date
-                'Date4': row[9].isoformat() if row[9] else None,  # Main.Date4
-                'endDate': row[10].isoformat() if row[10] else None  # Main.endDate
-            }
-            details.append(detail)
+        # ?fields=Number,Color,Long2 returns (and selects) only those columns
+        record_cls = MainOrderDetail.project(request.args.get('fields'))
+        
+        # Served from the per-order cache when the order was loaded recently
+        details = load_order_details([order_number], record_cls)[order_number]
+        
+        return records_response(details, success=True, order_number=order_number, count=len(details)), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f"Error in get_order_details: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@warehouse_bp.route('/orders/details/batch', methods=['GET', 'POST'])
+def get_order_details_batch():
+    """Get details for several orders in one query, grouped by order number"""
+    try:
+        # Accept ?orderNumbers=a,b,c or a JSON body {"orderNumbers": [...]}
+        if request.method == 'POST':
+            payload = request.get_json(silent=True) or {}
+            order_numbers = payload.get('orderNumbers') or []
+            fields = payload.get('fields')
+            if isinstance(fields, list):
+                fields = ','.join(str(field) for field in fields)
+        else:
+            order_numbers = request.args.get('orderNumbers', '').split(',')
+            fields = None
+        record_cls = MainOrderDetail.project(request.args.get('fields') or fields)
+        order_numbers = [str(number).strip() for number in order_numbers if str(number).strip()]
+        
+        if not order_numbers:
+            return jsonify({
+                'success': False,
+                'error': 'At least one order number is required'
+            }), 400
+        
+        limit = current_app.config.get('ORDER_DETAILS_BATCH_LIMIT', 50)
+        if len(set(order_numbers)) > limit:
+            return jsonify({
+                'success': False,
+                'error': f'At most {limit} order numbers per request'
+            }), 400
+        
+        details = load_order_details(order_numbers, record_cls)
         
         return jsonify({
             'success': True,
-            'data': details,
-            'order_number': order_number,
+            'data': {number: [record.to_dict() for record in records] for number, records in details.items()},
             'count': len(details)
         }), 200
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f"Error in get_order_details_batch: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@warehouse_bp.route('/cube', methods=['GET'])
+def query_sales_cube():
+    """Slice, dice and roll up shipped sales from the pre-aggregated cube"""
+    try:
+        # group_by=source,month  measures=pieces,meters  sort=meters&order=desc  top=10
+        group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+        measures = [name for name in request.args.get('measures', '').split(',') if name] or list(CUBE_MEASURES)
+        sort = request.args.get('sort')
+        descending = request.args.get('order', 'desc') != 'asc'
+        top = request.args.get('top', type=int)
+        
+        # Filters: product=D001,D002 keeps those values, customer=!6000 drops them
+        filters = {}
+        for name in CUBE_DIMENSIONS:
+            value = request.args.get(name)
+            if value:
+                filters[name] = ([v for v in value.lstrip('!').split(',') if v], value.startswith('!'))
+        
+        window = resolve_window(
+            period=request.args.get('period'),
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date')
+        )
+        
+        cube = current_cube()
+        rows, level = cube.query(group_by, filters, window, measures, sort, descending, top)
+        
+        return jsonify({
+            'success': True,
+            'data': rows,
+            'count': len(rows),
+            'group_by': group_by,
+            'measures': measures,
+            'level': list(level.dimensions),
+            'built_at': cube.built_at.isoformat()
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f"Error in query_sales_cube: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@warehouse_bp.route('/search', methods=['GET'])
+def search_names():
+    """Autocomplete Desan, Type, color, customer and order names from the in-memory index"""
+    try:
+        query = request.args.get('q', '')
+        limit = min(request.args.get('limit', 10, type=int), 100)
+        kinds = [kind for kind in request.args.get('kinds', '').split(',') if kind]
+        
+        unknown = [kind for kind in kinds if kind not in SEARCH_KINDS]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown kind '{unknown[0]}', expected one of: {', '.join(SEARCH_KINDS)}"
+            }), 400
+        
+        # Served from memory; SQL Server is only read when the index is first built
+        results = get_search_index().search(query, kinds or None, limit)
+        
+        return jsonify({
+            'success': True,
+            'data': results,
+            'count': len(results),
+            'query': query
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Error in search_names: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@warehouse_bp.route('/jobs', methods=['POST'])
+def submit_report_job():
+    """Queue a heavy report as a background job (identical specs share one job)"""
+    try:
+        queue = job_queue()
+        job = queue.submit(request.get_json(silent=True))
+        
+        return jsonify({
+            'success': True,
+            'data': job.status(queue.position(job))
+        }), 200 if job.finished else 202
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f"Error in submit_report_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@warehouse_bp.route('/jobs', methods=['GET'])
+def get_report_jobs():
+    """List recent report jobs, newest first"""
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        jobs = job_queue().recent(limit)
+        
+        return jsonify({
+            'success': True,
+            'data': jobs,
+            'count': len(jobs),
+            'reports': list(JOB_REPORTS)
+        }), 200
+    
+    except Exception as e:
+        current_app.logger.error(f"Error in get_report_jobs: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@warehouse_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """Poll the state and progress of a report job"""
+    queue = job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f"Job '{job_id}' not found"
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': job.status(queue.position(job))
+    }), 200
+
+@warehouse_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_report_job(job_id):
+    """Stream the progress of a report job as server-sent events until it finishes"""
+    queue = job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f"Job '{job_id}' not found"
+        }), 404
+    
+    return Response(
+        queue.events(job, current_app.config.get('LIVE_HEARTBEAT', 15)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@warehouse_bp.route('/jobs/<job_id>/result', methods=['GET'])
+def download_report_job(job_id):
+    """Download the JSON result of a finished report job"""
+    queue = job_queue()
+    path = queue.open_result(job_id)
+    if path is None:
+        job = queue.get(job_id)
+        return jsonify({
+            'success': False,
+            'error': f"Job '{job_id}' is {job.state}" if job is not None and not job.finished
+                     else f"No result for job '{job_id}' (unknown, failed or evicted)"
+        }), 409 if job is not None and not job.finished else 404
+    
+    return send_from_directory(queue.directory, f'{job_id}.json', mimetype='application/json')
+
+@warehouse_bp.route('/profiles', methods=['GET'])
+def get_request_profiles():
+    """List the most recent request profiles (speedscope files)"""
+    try:
+        if not profiles_authorized():
+            return jsonify({
+                'success': False,
+                'error': 'A valid X-Profile header is required'
+            }), 403
+        
+        limit = min(request.args.get('limit', 20, type=int), 200)
+        profiles = list_profiles(limit)
+        
+        return jsonify({
+            'success': True,
+            'data': profiles,
+            'count': len(profiles)
+        }), 200
+    
     except Exception as e:
-        print(f"Error in get_order_details: {str(e)}")
+        current_app.logger.error(f"Error in get_request_profiles: {str(e)}")
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@warehouse_bp.route('/profiles/<name>', methods=['GET'])
+def download_request_profile(name):
+    """Download one request profile; open it at https://www.speedscope.app"""
+    if not profiles_authorized():
+        return jsonify({
+            'success': False,
+            'error': 'A valid X-Profile header is required'
+        }), 403
+    
+    if name not in profile_files():
+        return jsonify({
+            'success': False,
+            'error': f"Profile '{name}' not found"
+        }), 404
+    
+    return send_from_directory(profile_dir(), name, mimetype='application/json', as_attachment=True)
+
+@warehouse_bp.route('/export/<source>', methods=['GET'])
+def export_sales(source):
+    """Stream shipped pieces for a date range as Arrow IPC or Parquet"""
+    try:
+        if not export_available():
+            return jsonify({
+                'success': False,
+                'error': 'Columnar export requires pyarrow to be installed'
+            }), 501
+        
+        if source not in EXPORT_SOURCES:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown export source '{source}', expected one of: {', '.join(EXPORT_SOURCES)}"
+            }), 404
+        
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        fmt = request.args.get('format', 'arrow')
+        
+        if not start_date or not end_date:
+            return jsonify({
+                'success': False,
+                'error': 'start_date and end_date are required'
+            }), 400
+        
+        # Malformed dates are a 400 here, not a 500 halfway through the stream
+        from datetime import datetime
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+        
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown export format '{fmt}', expected one of: {', '.join(EXPORT_FORMATS)}"
+            }), 400
+        
+        db = current_app.extensions['sqlalchemy']
+        batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 10000)
+        filename = f"{source}_sales_{start_date}_{end_date}.{EXPORT_FORMATS[fmt]['extension']}"
+        
+        # Rows are fetched and encoded batch by batch while the response is sent
+        return Response(
+            stream_with_context(stream_export(db.engine, source, fmt, start_date, end_date, batch_size)),
+            mimetype=EXPORT_FORMATS[fmt]['mimetype'],
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f"Invalid date, expected YYYY-MM-DD: {str(e)}"
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@warehouse_bp.route('/live', methods=['GET'])
+def live_updates():
+    """Stream order and inventory changes as server-sent events"""
+    channels = [channel for channel in request.args.get('channels', ','.join(LIVE_CHANNELS)).split(',') if channel]
+    unknown = [channel for channel in channels if channel not in LIVE_CHANNELS]
+    if not channels or unknown:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown channel(s): {', '.join(unknown)}. Use any of: {', '.join(LIVE_CHANNELS)}"
+        }), 400
+
+    try:
+        app = current_app._get_current_object()
+        client, snapshot = live_hub.connect(app, channels)
+    except TooManyClients as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503, {'Retry-After': '30'}
+    except Exception as e:
+        current_app.logger.error(f"Error in live_updates: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    return Response(
+        live_hub.stream(client, snapshot, app.config.get('LIVE_HEARTBEAT', 15)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
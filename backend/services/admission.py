@@ -0,0 +1,271 @@
+"""Admission control: per-route cost classes in front of the database pool.
+
+Production runs with ``pool_size=2, max_overflow=1``: three connections. One
+``/orders/all`` or a 10,000-row ``/sales/*/detailed`` holds a connection for
+seconds, and two of them leave the orders screens waiting out the 60 s
+``pool_timeout``. Every warehouse route therefore gets a cost class:
+
+* ``light`` - inventory, order and detail screens; may use every connection
+  the other classes leave free;
+* ``heavy`` - sales reports, ``/cube`` and ``/orders/all``;
+* ``export`` - the streaming ``/export`` downloads (held until the body is sent);
+* ``job`` - report jobs (``services.jobs``) running any of the routes above.
+
+Each class has its own concurrency limit, a bounded queue of waiting requests
+and a maximum wait (``ADMISSION_CLASSES``). ``heavy``, ``export`` and ``job``
+together never hold more than the pool capacity minus
+``ADMISSION_RESERVED_SLOTS``, so the interactive routes always find a connection, and all classes together
+never hold more than the pool capacity. A request that cannot start is shed
+with ``503`` and a ``Retry-After`` estimated from the class's recent durations
+when its class's queue is full or its wait times out; heavy and export
+requests are also shed at once when every pooled connection is already
+checked out, while light requests and jobs queue for a connection instead.
+
+Sales reports answered by the analytics mirror do not touch the pool and are
+not admitted; neither are the SSE stream, profiles and the pricing proxy.
+"""
+import math
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+
+# Cost class per route (first rule substring that matches; None is not admitted)
+ROUTE_CLASSES = (
+    ('/export/', 'export'),
+    ('/orders/all', 'heavy'),
+    ('/sales/', 'heavy'),
+    ('/cube', 'heavy'),
+    ('/live', None),
+    ('/jobs', None),
+    ('/profiles', None),
+    ('/pricing/', None),
+    ('/tasaneef-details-proxy/', None),
+)
+
+DEFAULT_CLASS = 'light'
+
+# Classes that share the pool minus the reserved slots
+BULK_CLASSES = ('heavy', 'export', 'job')
+
+# Class of report jobs, whatever route they run
+JOB_CLASS = 'job'
+
+# Weight of the newest request in a class's average duration
+_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of queued."""
+
+    def __init__(self, cost_class, reason, retry_after):
+        super().__init__(f"Server busy ({reason}), retry the {cost_class} request in {retry_after} s")
+        self.cost_class = cost_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Lane:
+    __slots__ = ('limit', 'queue', 'wait', 'active', 'waiting', 'admitted', 'queued', 'shed', 'avg_seconds')
+
+    def __init__(self, limit, queue, wait):
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.avg_seconds = None
+
+
+class Ticket:
+    """An admitted request's slot; released once, when the response is closed."""
+
+    def __init__(self, controller, cost_class):
+        self.controller = controller
+        self.cost_class = cost_class
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller.release(self)
+
+
+class AdmissionController:
+    """Concurrency limits and bounded queues per cost class."""
+
+    def __init__(self, classes, capacity, reserved=1, retry_after=5):
+        self._cond = threading.Condition()
+        self.capacity = capacity
+        self.bulk_limit = max(capacity - reserved, 1)
+        self.bulk_active = 0
+        self.active = 0
+        self.retry_after = retry_after
+        self.lanes = {
+            name: _Lane(spec.get('limit') or capacity, spec.get('queue', 0), spec.get('wait', 0))
+            for name, spec in classes.items()
+        }
+
+    def _fits(self, cost_class):
+        lane = self.lanes[cost_class]
+        if lane.active >= lane.limit or self.active >= self.capacity:
+            return False
+        return cost_class not in BULK_CLASSES or self.bulk_active < self.bulk_limit
+
+    def _retry_after(self, lane):
+        if lane.avg_seconds is None:
+            return self.retry_after
+        return max(1, math.ceil(lane.avg_seconds * (lane.waiting + 1) / lane.limit))
+
+    def _reject(self, cost_class, reason):
+        lane = self.lanes[cost_class]
+        lane.shed += 1
+        return AdmissionRejected(cost_class, reason, self._retry_after(lane))
+
+    def acquire(self, cost_class, pool_saturated=None):
+        """Wait for a slot of ``cost_class``; raises ``AdmissionRejected`` when shed."""
+        lane = self.lanes[cost_class]
+        with self._cond:
+            if not self._fits(cost_class):
+                if lane.waiting >= lane.queue:
+                    raise self._reject(cost_class, 'queue full')
+                if cost_class in BULK_CLASSES and pool_saturated is not None and pool_saturated():
+                    raise self._reject(cost_class, 'connection pool saturated')
+                lane.waiting += 1
+                lane.queued += 1
+                deadline = time.monotonic() + lane.wait
+                try:
+                    while not self._fits(cost_class):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject(cost_class, 'wait timed out')
+                        self._cond.wait(remaining)
+                finally:
+                    lane.waiting -= 1
+            lane.active += 1
+            lane.admitted += 1
+            self.active += 1
+            if cost_class in BULK_CLASSES:
+                self.bulk_active += 1
+        return Ticket(self, cost_class)
+
+    def release(self, ticket):
+        elapsed = time.monotonic() - ticket.started
+        with self._cond:
+            lane = self.lanes[ticket.cost_class]
+            lane.active -= 1
+            self.active -= 1
+            if ticket.cost_class in BULK_CLASSES:
+                self.bulk_active -= 1
+            lane.avg_seconds = elapsed if lane.avg_seconds is None else (
+                (1 - _SMOOTHING) * lane.avg_seconds + _SMOOTHING * elapsed)
+            self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            return {
+                'capacity': self.capacity,
+                'bulk_limit': self.bulk_limit,
+                'bulk_active': self.bulk_active,
+                'active': self.active,
+                'classes': {
+                    name: {
+                        'limit': lane.limit, 'active': lane.active, 'waiting': lane.waiting,
+                        'admitted': lane.admitted, 'queued': lane.queued, 'shed': lane.shed,
+                        'avg_seconds': None if lane.avg_seconds is None else round(lane.avg_seconds, 3),
+                    }
+                    for name, lane in self.lanes.items()
+                },
+            }
+
+
+def route_class(rule):
+    """The cost class of a URL rule, or None when it is not admitted."""
+    for pattern, cost_class in ROUTE_CLASSES:
+        if pattern in rule:
+            return cost_class
+    return DEFAULT_CLASS
+
+
+def pool_capacity(config):
+    """Connections the primary pool can hand out (``pool_size + max_overflow``)."""
+    options = config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    return options.get('pool_size', 5) + max(options.get('max_overflow', 10), 0)
+
+
+def _pool_saturated():
+    pool = current_app.extensions['sqlalchemy'].engine.pool
+    checkedout = getattr(pool, 'checkedout', None)
+    return checkedout is not None and checkedout() >= pool_capacity(current_app.config)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """The process-wide controller, built from the config on first use."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            config = current_app.config
+            _controller = AdmissionController(
+                config['ADMISSION_CLASSES'],
+                pool_capacity(config),
+                config.get('ADMISSION_RESERVED_SLOTS', 1),
+                config.get('ADMISSION_RETRY_AFTER', 5),
+            )
+        return _controller
+
+
+def admit_request():
+    """``before_request`` hook: take a slot of the route's cost class or shed the request."""
+    if not current_app.config.get('ADMISSION_ENABLED', False) or request.url_rule is None or request.method == 'OPTIONS':
+        return
+    cost_class = route_class(request.url_rule.rule)
+    # Reports served from the analytics mirror leave the pool alone
+    if cost_class is None or g.get('query_engine') is not None:
+        return
+    pool_saturated = _pool_saturated
+    if g.get('background_job'):
+        # Nobody is waiting on a job, so it queues for a bulk slot rather than being shed
+        cost_class, pool_saturated = JOB_CLASS, None
+    try:
+        g.admission = get_admission_controller().acquire(cost_class, pool_saturated)
+    except AdmissionRejected as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e),
+            'cost_class': e.cost_class,
+            'retry_after': e.retry_after
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+
+def release_on_close(response):
+    """``after_request`` hook: free the slot when the response (or its stream) is closed."""
+    ticket = g.pop('admission', None)
+    if ticket is not None:
+        response.call_on_close(ticket.release)
+    return response
+
+
+def release_admission(error=None):
+    """``teardown_request`` hook: free the slot of a request that never produced a response."""
+    ticket = g.pop('admission', None)
+    if ticket is not None:
+        ticket.release()
+
+
+def admission_status():
+    """Per-class counters for the health endpoint (None while disabled)."""
+    if not current_app.config.get('ADMISSION_ENABLED', False):
+        return None
+    return get_admission_controller().status()
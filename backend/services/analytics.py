@@ -0,0 +1,352 @@
+"""Shared, vectorized sales analytics for the ranking routes.
+
+The top-products and customer routes used to send one ``GROUP BY ... TOP n``
+query each for the same date window. Here the shipped-piece columns for a
+window are pulled once into NumPy arrays (a ``SalesFrame``), cached briefly,
+and every ranking is computed from that frame with vectorized group-bys.
+
+String columns are factorized at load time: each column is stored as an
+``int64`` code array plus the list of distinct labels, with code 0 reserved for
+NULL. Grouping, distinct counting and ordering then only touch integers.
+
+Requests missing either date bound (only ``start_date``, only ``end_date``, or
+neither) could pull most of the shipping history into Python, so for those
+``load_frame`` returns a ``SalesQuery`` instead: same ``rank`` interface,
+answered by a ``TOP n ... GROUP BY`` on the database.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from services.changes import change_feed
+from services.query import fetch_all
+
+
+SHIPPED_STATUS = 'مشحون'
+STOCK_CUSTOMER = '6000'
+
+_FRAME_QUERIES = {
+    'main': {
+        'sql': """
+            SELECT Main.Desan, Main.Color, Main.Long2, Main.customerNumber, Main.Customer, Customers.Name
+            FROM Main
+            LEFT JOIN Customers ON Main.customerNumber = Customers.Number
+            WHERE Main.Status = :status {window}
+        """,
+        'date_column': 'Main.Date3',
+        'columns': ('desan', 'color', 'meters', 'customer_number', 'order', 'customer_name'),
+        'expressions': ('Main.Desan', 'Main.Color', 'Main.Long2', 'Main.customerNumber', 'Main.Customer',
+                        'Customers.Name'),
+        'status_column': 'Main.Status',
+        'from': 'Main LEFT JOIN Customers ON Main.customerNumber = Customers.Number',
+    },
+    'chinese': {
+        'sql': """
+            SELECT Type, Color, Long, Customer
+            FROM Chines
+            WHERE Status = :status {window}
+        """,
+        'date_column': 'Date',
+        'columns': ('type', 'color', 'meters', 'customer'),
+        'expressions': ('Type', 'Color', 'Long', 'Customer'),
+        'status_column': 'Status',
+        'from': 'Chines',
+    },
+}
+
+
+def resolve_window(period=None, start_date=None, end_date=None, now=None):
+    """Translate the routes' ``period``/``start_date``/``end_date`` into a date window.
+
+    Returns ``(start, end, end_inclusive)``; either bound may be ``None``. The
+    named periods mirror the ``DATEADD(..., GETDATE())`` filters the routes used,
+    with "now" truncated to the minute so concurrent requests share a window.
+    """
+    now = (now or datetime.now()).replace(second=0, microsecond=0)
+    if period == 'yesterday':
+        today = now.replace(hour=0, minute=0)
+        return today - timedelta(days=1), today, False
+    if period in ('last_week', 'week'):
+        return now - timedelta(weeks=1), now, False
+    if period in ('last_month', 'month'):
+        return _shift_months(now, -1), now, False
+    if period == 'last_3_months':
+        return _shift_months(now, -3), now, False
+
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = datetime.fromisoformat(end_date) if end_date else None
+    return start, end, True
+
+
+def _shift_months(moment, months):
+    """Shift by calendar months, clamping the day like SQL Server's DATEADD."""
+    month_index = moment.month - 1 + months
+    year = moment.year + month_index // 12
+    month = month_index % 12 + 1
+    for day in (moment.day, 30, 29, 28):
+        try:
+            return moment.replace(year=year, month=month, day=day)
+        except ValueError:
+            continue
+
+
+def _factorize(values):
+    """Return ``(codes, labels)`` with code 0 reserved for NULL."""
+    lookup = {}
+    labels = [None]
+    codes = np.empty(len(values), dtype=np.int64)
+    for index, value in enumerate(values):
+        if value is None:
+            codes[index] = 0
+            continue
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(labels)
+            labels.append(value)
+        codes[index] = code
+    return codes, labels
+
+
+class SalesFrame:
+    """Column arrays for the shipped pieces of one source and date window."""
+
+    def __init__(self, source, columns, size):
+        self.source = source
+        self.size = size
+        self.codes = {}
+        self.labels = {}
+        self.meters = np.zeros(size, dtype=np.float64)
+        for name, values in columns.items():
+            if name == 'meters':
+                self.meters = np.array([float(v) if v else 0.0 for v in values], dtype=np.float64)
+            else:
+                self.codes[name], self.labels[name] = _factorize(values)
+
+    @classmethod
+    def from_rows(cls, source, rows):
+        names = _FRAME_QUERIES[source]['columns']
+        columns = {name: [row[index] for row in rows] for index, name in enumerate(names)}
+        frame = cls(source, columns, len(rows))
+        if source == 'main':
+            # Pieces shipped to real customers, i.e. customerNumber != '6000'
+            # (NULL customer numbers fail that comparison in SQL as well)
+            stock = [index for index, label in enumerate(frame.labels['customer_number'])
+                     if label is not None and str(label) == STOCK_CUSTOMER]
+            customer_codes = frame.codes['customer_number']
+            frame.to_customer = (customer_codes != 0) & ~np.isin(customer_codes, stock)
+        return frame
+
+    def is_known(self, column):
+        """Boolean mask of rows where ``column`` is not NULL."""
+        return self.codes[column] != 0
+
+    def _combined(self, columns):
+        """Combine several code columns into one code array and a decoder."""
+        combined = np.zeros(self.size, dtype=np.int64)
+        radices = []
+        for name in columns:
+            radix = len(self.labels[name])
+            combined = combined * radix + self.codes[name]
+            radices.append(radix)
+        return combined, radices
+
+    def _decode(self, columns, radices, code):
+        values = []
+        for name, radix in zip(reversed(columns), reversed(radices)):
+            code, part = divmod(int(code), radix)
+            values.append(self.labels[name][part])
+        return tuple(reversed(values))
+
+    def rank(self, by, limit, order_by='pieces', distinct=None, distinct_nulls=False, where=None):
+        """Rank the groups of ``by`` columns.
+
+        ``distinct`` names the column(s) counted per group (``COUNT(DISTINCT ...)``);
+        NULL values are skipped unless ``distinct_nulls`` is set, which matches
+        ``COUNT(DISTINCT CONCAT(...))``. ``where`` is an optional row mask.
+        Returns dicts with ``key`` (tuple of labels), ``total_pieces``,
+        ``total_meters`` and ``distinct``, ordered by ``order_by`` descending.
+        """
+        by = (by,) if isinstance(by, str) else tuple(by)
+        group_codes, radices = self._combined(by)
+        meters = self.meters
+        if where is not None:
+            group_codes = group_codes[where]
+            meters = meters[where]
+
+        groups, group_ids = np.unique(group_codes, return_inverse=True)
+        group_count = len(groups)
+        pieces = np.bincount(group_ids, minlength=group_count)
+        totals = np.bincount(group_ids, weights=meters, minlength=group_count)
+
+        distinct_counts = np.zeros(group_count, dtype=np.int64)
+        if distinct:
+            distinct = (distinct,) if isinstance(distinct, str) else tuple(distinct)
+            distinct_codes, _ = self._combined(distinct)
+            if where is not None:
+                distinct_codes = distinct_codes[where]
+            keep = slice(None) if distinct_nulls else distinct_codes != 0
+            radix = int(distinct_codes.max()) + 1 if len(distinct_codes) else 1
+            pairs = np.unique(group_ids[keep] * radix + distinct_codes[keep])
+            distinct_counts = np.bincount(pairs // radix, minlength=group_count)
+
+        ordering = pieces if order_by == 'pieces' else totals
+        top = np.argsort(-ordering, kind='stable')[:limit]
+        return [{
+            'key': self._decode(by, radices, groups[index]),
+            'total_pieces': int(pieces[index]),
+            'total_meters': float(totals[index]),
+            'distinct': int(distinct_counts[index]),
+        } for index in top]
+
+
+class _Condition:
+    """SQL stand-in for a ``SalesFrame`` row mask; combine with ``&``."""
+
+    def __init__(self, *clauses):
+        self.clauses = clauses
+
+    def __and__(self, other):
+        return _Condition(*self.clauses, *other.clauses)
+
+
+def _window_clauses(source, window):
+    """``AND`` clauses and parameters restricting ``source`` to ``window``."""
+    start, end, end_inclusive = window
+    date_column = _FRAME_QUERIES[source]['date_column']
+    clauses = []
+    params = {}
+    if start is not None:
+        clauses.append(f"AND {date_column} >= :start_date")
+        params['start_date'] = start
+    if end is not None:
+        clauses.append(f"AND {date_column} {'<=' if end_inclusive else '<'} :end_date")
+        params['end_date'] = end
+    return clauses, params
+
+
+class SalesQuery:
+    """``SalesFrame.rank`` for an open-ended window, grouped by the database.
+
+    ``to_customer`` and ``is_known`` give conditions instead of masks, so the
+    routes call it exactly like a frame.
+    """
+
+    def __init__(self, source, window=(None, None, True)):
+        self.source = source
+        self.window = window
+        spec = _FRAME_QUERIES[source]
+        self._columns = dict(zip(spec['columns'], spec['expressions']))
+        if source == 'main':
+            # NULL customer numbers fail the comparison, as in the frame
+            self.to_customer = _Condition(f"Main.customerNumber <> '{STOCK_CUSTOMER}'")
+
+    def is_known(self, column):
+        return _Condition(f"{self._columns[column]} IS NOT NULL")
+
+    def rank(self, by, limit, order_by='pieces', distinct=None, distinct_nulls=False, where=None):
+        by = (by,) if isinstance(by, str) else tuple(by)
+        spec = _FRAME_QUERIES[self.source]
+        keys = [self._columns[name] for name in by]
+        if not distinct:
+            distinct_sql = '0'
+        elif isinstance(distinct, str):
+            distinct_sql = f"COUNT(DISTINCT {self._columns[distinct]})"
+        else:
+            # CONCAT treats NULL as '', like the routes' COUNT(DISTINCT CONCAT(...))
+            parts = ", '-', ".join(self._columns[name] for name in distinct)
+            combined = f"CONCAT({parts})"
+            distinct_sql = f"COUNT(DISTINCT {combined})"
+            if not distinct_nulls:
+                # The frame only skips rows where every distinct column is NULL
+                known = ' OR '.join(f"{self._columns[name]} IS NOT NULL" for name in distinct)
+                distinct_sql = f"COUNT(DISTINCT CASE WHEN {known} THEN {combined} END)"
+        filters = ''.join(f" AND {clause}" for clause in (where.clauses if where is not None else ()))
+        window_clauses, params = _window_clauses(self.source, self.window)
+        filters += ''.join(f" {clause}" for clause in window_clauses)
+        ordering = 'COUNT(*)' if order_by == 'pieces' else f"SUM({self._columns['meters']})"
+        sql_query = text(f"""
+            SELECT TOP {int(limit)} {', '.join(keys)}, COUNT(*), SUM({self._columns['meters']}), {distinct_sql}
+            FROM {spec['from']}
+            WHERE {spec['status_column']} = :status{filters}
+            GROUP BY {', '.join(keys)}
+            ORDER BY {ordering} DESC
+        """)
+        return [{
+            'key': tuple(row[:len(by)]),
+            'total_pieces': int(row[len(by)]),
+            'total_meters': float(row[len(by) + 1] or 0.0),
+            'distinct': int(row[len(by) + 2] or 0),
+        } for row in fetch_all(sql_query, dict(params, status=SHIPPED_STATUS))]
+
+
+def with_percentages(ranked):
+    """Add each group's share of the returned pieces, as the routes always reported it."""
+    total = sum(item['total_pieces'] for item in ranked) if ranked else 1
+    for item in ranked:
+        item['percentage'] = round((item['total_pieces'] / total) * 100, 1) if total > 0 else 0
+    return ranked, total
+
+
+class _FrameCache:
+    """Small TTL cache of loaded frames keyed by (source, window)."""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < ttl:
+                return entry[1]
+            return None
+
+    def put(self, key, frame):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.monotonic(), frame)
+
+    def clear(self, source=None):
+        with self._lock:
+            for key in [k for k in self._entries if source is None or k[0] == source]:
+                del self._entries[key]
+
+
+frame_cache = _FrameCache()
+
+
+def _on_change(event):
+    # Frames only hold shipped pieces; other status moves leave them valid
+    if SHIPPED_STATUS in event.statuses:
+        frame_cache.clear(event.source)
+
+
+change_feed.subscribe(_on_change)
+
+
+def load_frame(source, window, ttl=60):
+    """Return the ``SalesFrame`` for ``source`` and ``window``, loading it once per TTL.
+
+    Without a start or an end date a ``SalesQuery`` is returned instead.
+    """
+    start, end, _ = window
+    if start is None or end is None:
+        return SalesQuery(source, window)
+
+    key = (source,) + tuple(window)
+    frame = frame_cache.get(key, ttl)
+    if frame is not None:
+        return frame
+
+    clauses, params = _window_clauses(source, window)
+    rows = fetch_all(text(_FRAME_QUERIES[source]['sql'].format(window=' '.join(clauses))),
+                     dict(params, status=SHIPPED_STATUS))
+    frame = SalesFrame.from_rows(source, rows)
+    frame_cache.put(key, frame)
+    return frame
@@ -0,0 +1,265 @@
+"""Circuit breaker around the SQL Server connection, with stale-on-error serving.
+
+The backend talks to one remote SQL Server over the internet. When the link
+degrades every query blocks for the connect or ``pool_timeout`` and the route
+finally answers a bare 500, with all worker threads stuck meanwhile. Every
+``fetch_all`` on the primary database goes through ``database_breaker()``:
+
+* closed - statements run; ``DB_BREAKER_THRESHOLD`` consecutive connectivity
+  failures (pool timeouts, invalidated connections, DB-Lib connection and
+  timeout errors, statement timeouts) open the circuit. Any other database
+  error means the server answered and resets the count;
+* open - statements fail at once with ``CircuitOpen`` for
+  ``DB_BREAKER_RESET`` seconds, without touching the pool;
+* half-open - afterwards one statement is let through as a probe; success
+  closes the circuit, failure opens it again for another period.
+
+The inventory and sales routes (``STALE_ROUTES``) remember their last good
+response per URL. While the circuit is open, or when a request fails on the
+database, they answer that response with ``stale: true`` (and its age) instead
+of an error; other routes answer ``503`` with ``Retry-After``. Reports served
+by the analytics mirror do not use the breaker.
+"""
+import json
+import re
+import threading
+import time
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import exc
+
+from services.timeouts import StatementTimeout
+from services.ttl_cache import TTLCache
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Routes that may answer with their last good response during an outage
+STALE_ROUTES = (
+    '/api/warehouse/scrap',
+    '/api/warehouse/classic',
+    '/api/warehouse/chinese',
+    '/api/warehouse/summary',
+    '/api/warehouse/sales/',
+    '/api/warehouse/cube',
+)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of running a statement while the circuit is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Database unavailable, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+# DB-Lib errors raised when the server cannot be reached or stops answering:
+# 20002 connection failed, 20003 timed out, 20004 read failed, 20006 write failed,
+# 20009 server unavailable, 20017 unexpected EOF, 20047 DBPROCESS is dead
+OUTAGE_ERROR_CODES = frozenset((20002, 20003, 20004, 20006, 20009, 20017, 20047))
+
+_DBLIB_MESSAGE = re.compile(r'DB-Lib error message (\d+)')
+
+
+def _error_codes(error):
+    """Numeric codes a pymssql error carries: its first argument and any DB-Lib message numbers."""
+    args = getattr(error, 'args', ())
+    codes = {args[0]} if args and isinstance(args[0], int) else set()
+    codes.update(int(code) for code in _DBLIB_MESSAGE.findall(str(error)))
+    return codes
+
+
+def is_outage(error):
+    """Whether ``error`` says the database is unreachable rather than the statement is wrong."""
+    if isinstance(error, (StatementTimeout, exc.TimeoutError)):
+        return True
+    if not isinstance(error, exc.DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return True
+    # Deadlocks, constraint violations or bad SQL mean the server answered
+    return isinstance(error, (exc.OperationalError, exc.InterfaceError)) and \
+        bool(_error_codes(error.orig) & OUTAGE_ERROR_CODES)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 1
+        return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at) + 0.999))
+
+    def rejecting(self):
+        """Whether a call made now would be rejected (does not take the probe)."""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == HALF_OPEN and self._probing
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+                self.rejected += 1
+                raise CircuitOpen(self.retry_after())
+            if self.state == HALF_OPEN:
+                self._probing = True
+
+    def _on_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def _on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, fn):
+        """Run ``fn`` through the breaker; connectivity failures count towards opening it."""
+        self._before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            if is_outage(e):
+                self._on_failure()
+            else:
+                # The database answered, the statement was wrong
+                self._on_success()
+            raise
+        self._on_success()
+        return result
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'retry_after': self.retry_after() if self.state != CLOSED else None,
+            }
+
+
+_breaker = None
+_stale_cache = None
+_setup_lock = threading.Lock()
+
+
+def database_breaker():
+    """The process-wide breaker for the primary database, or None when disabled."""
+    global _breaker
+    config = current_app.config
+    if not config.get('DB_BREAKER_ENABLED', True):
+        return None
+    with _setup_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(config.get('DB_BREAKER_THRESHOLD', 5), config.get('DB_BREAKER_RESET', 30))
+        return _breaker
+
+
+def guarded(fn):
+    """Run ``fn`` through the breaker, flagging the request when the database is out."""
+    breaker = database_breaker()
+    if breaker is None:
+        return fn()
+    try:
+        return breaker.call(fn)
+    except Exception as e:
+        if (isinstance(e, CircuitOpen) or is_outage(e)) and has_request_context():
+            g.database_outage = True
+        raise
+
+
+def _stale_cache_for(config):
+    global _stale_cache
+    with _setup_lock:
+        if _stale_cache is None:
+            _stale_cache = TTLCache(config.get('DB_STALE_CACHE_SIZE', 256), config.get('DB_STALE_MAX_AGE', 86400))
+        return _stale_cache
+
+
+def _stale_eligible():
+    return (request.method == 'GET' and request.url_rule is not None
+            and request.url_rule.rule.startswith(STALE_ROUTES))
+
+
+def _stale_response(cache):
+    entry = cache.get_entry(request.full_path)
+    if entry is None or entry[1] > cache.ttl:
+        return None
+    body, age = entry
+    payload = json.loads(body)
+    payload['stale'] = True
+    payload['stale_age_seconds'] = int(age)
+    response = jsonify(payload)
+    response.headers['X-Cache'] = 'STALE'
+    return response
+
+
+def _unavailable(breaker):
+    retry_after = breaker.retry_after() if breaker is not None else 1
+    response = jsonify({
+        'success': False,
+        'error': f"Database unavailable, retry in {retry_after} s",
+        'circuit': breaker.state if breaker is not None else None,
+        'retry_after': retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def serve_stale_when_open():
+    """``before_request`` hook: answer from the last good response while the circuit is open."""
+    breaker = database_breaker()
+    if breaker is None or g.get('query_engine') is not None or not _stale_eligible():
+        return None
+    if breaker.rejecting():
+        return _stale_response(_stale_cache_for(current_app.config))
+
+
+def remember_or_fall_back(response):
+    """``after_request`` hook: keep good responses, replace outage errors with stale data or a 503."""
+    config = current_app.config
+    if not config.get('DB_BREAKER_ENABLED', True):
+        return response
+    eligible = _stale_eligible()
+    if eligible and response.status_code == 200 and not response.is_streamed and response.is_json \
+            and 'stale' not in response.headers.get('X-Cache', '').lower():
+        _stale_cache_for(config).put(request.full_path, response.get_data())
+        return response
+    if not g.pop('database_outage', False) or response.status_code < 500:
+        return response
+    stale = _stale_response(_stale_cache_for(config)) if eligible else None
+    if stale is not None:
+        return stale
+    # Keep a structured statement-timeout 504; replace bare 500s
+    return _unavailable(database_breaker()) if response.status_code == 500 else response
+
+
+def breaker_status():
+    """Circuit state for the health endpoint (None while disabled)."""
+    breaker = database_breaker()
+    return breaker.status() if breaker is not None else None
@@ -0,0 +1,191 @@
+"""Change detection for the ``Main`` and ``Chines`` tables.
+
+A background poller reads a cheap watermark per table and status bucket (row
+count, highest ``Number`` and latest date per ``Status``) and publishes a
+``ChangeEvent`` naming the statuses whose bucket moved. Caches subscribe and
+drop only the keys those statuses affect, so they can keep long TTLs and still
+pick up a shipment within one poll interval.
+
+The per-status query scans the table, so it does not run on every poll:
+
+* with SQL Server change tracking enabled for the watched tables, it runs
+  once the database's change-tracking version has moved;
+* otherwise each poll reads ``MAX(Number)`` (a seek on the key) per table and
+  scans only when new pieces arrived, or when ``CHANGE_FEED_SCAN_INTERVAL``
+  seconds have passed since the last scan, which is how status-only moves
+  (a shipment) are noticed without change tracking.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import text
+
+from services.query import fetch_all, fetch_one
+
+
+WATCHED_TABLES = {
+    'main': {'table': 'Main', 'date_column': 'Date3'},
+    'chinese': {'table': 'Chines', 'date_column': 'Date'},
+}
+
+_WATERMARK_SQL = """
+    SELECT Status, COUNT(*) AS pieces, MAX(Number) AS max_number, MAX({date_column}) AS max_date
+    FROM {table}
+    GROUP BY Status
+"""
+
+_HIGH_WATER_SQL = "SELECT MAX(Number) AS max_number FROM {table}"
+
+
+class ChangeEvent:
+    """Statuses of one source whose watermark moved between two polls."""
+    __slots__ = ('source', 'statuses', 'version')
+
+    def __init__(self, source, statuses, version):
+        self.source = source
+        self.statuses = frozenset(statuses)
+        self.version = version
+
+    def affects(self, source, status=None):
+        return self.source == source and (status is None or status in self.statuses)
+
+    def __repr__(self):
+        return f'ChangeEvent({self.source!r}, {sorted(self.statuses)!r}, version={self.version})'
+
+
+class ChangeFeed:
+    """Poll table watermarks and publish in-process invalidation events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.watermarks = {}
+        # Bumped once per published event; lets consumers tell whether anything changed
+        self.version = 0
+        # None until probed, then True/False
+        self.change_tracking = None
+        self._tracking_version = None
+        # Without change tracking: last MAX(Number) and scan time per source
+        self._high_water = {}
+        self._scanned_at = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback):
+        """Call ``callback(event)`` for every change; returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Change subscriber {callback!r} failed for {event!r}: {str(e)}")
+
+    def _tracking_unchanged(self):
+        """True when change tracking says nothing changed since the last poll."""
+        if self.change_tracking is None:
+            db = current_app.extensions['sqlalchemy']
+            self.change_tracking = False
+            if db.engine.dialect.name == 'mssql':
+                try:
+                    row = fetch_one(text("""
+                        SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version,
+                               CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('Main')) AS main_version,
+                               CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('Chines')) AS chines_version
+                    """))
+                    self.change_tracking = bool(row and row.main_version is not None and row.chines_version is not None)
+                except Exception as e:
+                    print(f"Change tracking unavailable, polling watermarks: {str(e)}")
+        if not self.change_tracking:
+            return False
+
+        row = fetch_one(text("SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version"))
+        version = row.version if row else None
+        unchanged = version is not None and version == self._tracking_version
+        self._tracking_version = version
+        return unchanged
+
+    def _scan_due(self, source, spec):
+        """Without change tracking: whether new pieces or the scan interval call for a per-status scan."""
+        row = fetch_one(text(_HIGH_WATER_SQL.format(**spec)))
+        high_water = row.max_number if row else None
+        moved = source not in self._high_water or high_water != self._high_water[source]
+        self._high_water[source] = high_water
+        interval = current_app.config.get('CHANGE_FEED_SCAN_INTERVAL', 60)
+        return moved or time.monotonic() - self._scanned_at.get(source, float('-inf')) >= interval
+
+    def poll_once(self):
+        """Read the watermarks and publish an event per changed source; needs an app context."""
+        if self._tracking_unchanged():
+            return []
+
+        events = []
+        for source, spec in WATCHED_TABLES.items():
+            if not self.change_tracking and not self._scan_due(source, spec):
+                continue
+            self._scanned_at[source] = time.monotonic()
+            rows = fetch_all(text(_WATERMARK_SQL.format(**spec)))
+            current = {row.Status: (row.pieces, row.max_number, row.max_date) for row in rows}
+            previous = self.watermarks.get(source)
+            self.watermarks[source] = current
+            if previous is None:
+                # First poll only establishes the baseline
+                continue
+
+            changed = {status for status in set(current) | set(previous) if current.get(status) != previous.get(status)}
+            if changed:
+                with self._lock:
+                    self.version += 1
+                    version = self.version
+                events.append(ChangeEvent(source, changed, version))
+
+        for event in events:
+            self.publish(event)
+        return events
+
+    def start(self, app, interval=5.0):
+        """Poll every ``interval`` seconds on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while True:
+                try:
+                    with app.app_context():
+                        self.poll_once()
+                except Exception as e:
+                    print(f"Change feed poll failed: {str(e)}")
+                if self._stop.wait(interval):
+                    break
+
+        self._thread = threading.Thread(target=run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+change_feed = ChangeFeed()
+
+
+def start_change_feed(app):
+    """Start the shared feed when ``CHANGE_FEED_ENABLED`` is set."""
+    if app.config.get('CHANGE_FEED_ENABLED', False):
+        change_feed.start(app, app.config.get('CHANGE_FEED_INTERVAL', 5))
+    return change_feed
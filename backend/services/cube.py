@@ -0,0 +1,489 @@
+"""Pre-aggregated sales cube behind the generic ``/cube`` endpoint.
+
+Each sales question used to need its own route and its own scan of ``Main``
+or ``Chines``. The cube aggregates every shipped piece once, with one
+``GROUP BY`` per source, into pieces and meters per
+
+    source × day × product (Desan or Type) × color × customer
+
+and keeps a few smaller roll-ups of that base level. A query names its
+group-by dimensions, filters, measures and top-N; it is answered from the
+smallest level that still holds every dimension it touches, with NumPy
+group-bys over integer codes, so new questions cost no database scan.
+
+Besides the stored dimensions a query may group by ``month`` (derived from
+``day``). Windows are whole days: ``period`` or ``start_date``/``end_date``
+select the days they overlap (the approx customer rankings read the partial
+days at either end exactly, see ``split_window``). Main customers are customer numbers (names are
+attached when grouping by customer); Chinese customers are the stored names.
+The cube is rebuilt after ``CUBE_TTL`` seconds or when the change feed reports
+newly shipped pieces. Only the first build makes a request wait: later
+rebuilds run on a background thread while the previous cube keeps answering
+(``built_at`` says how old it is).
+
+Next to the aggregates the cube keeps HyperLogLog sketches per source and day
+of the customers, products and colors sold (see ``services.hll``), so the
+``?approx=1`` summary merges them into distinct counts for any range of days
+instead of running ``COUNT(DISTINCT ...)``.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app, g
+from sqlalchemy import text
+
+from services.analytics import SHIPPED_STATUS, STOCK_CUSTOMER, _factorize, load_frame
+from services.changes import change_feed
+from services.hll import DEFAULT_PRECISION, DailySketches, hash_labels
+from services.query import fetch_all, query_engine
+from services.singleflight import SingleFlight
+
+
+DIMENSIONS = ('source', 'day', 'month', 'product', 'color', 'customer')
+MEASURES = ('pieces', 'meters')
+
+# Stored dimensions of each pre-aggregated level; the first one is the base
+LEVELS = (
+    ('source', 'day', 'product', 'color', 'customer'),
+    ('source', 'day', 'product', 'color'),
+    ('source', 'day', 'customer'),
+    ('source', 'day', 'product'),
+    ('source', 'day'),
+)
+
+_LABEL_DIMENSIONS = ('source', 'product', 'color', 'customer')
+
+# HyperLogLog sketch per source and day of each metric's dimension (see ``approx_summary``)
+SKETCH_METRICS = {'customers': 'customer', 'products': 'product', 'colors': 'color'}
+
+_CUBE_QUERIES = {
+    'main': """
+        SELECT CONVERT(date, Date3) AS day, Desan, Color, customerNumber, COUNT(*) AS pieces, SUM(Long2) AS meters
+        FROM Main
+        WHERE Status = :status
+        GROUP BY CONVERT(date, Date3), Desan, Color, customerNumber
+    """,
+    'chinese': """
+        SELECT CONVERT(date, Date) AS day, Type, Color, Customer, COUNT(*) AS pieces, SUM(Long) AS meters
+        FROM Chines
+        WHERE Status = :status
+        GROUP BY CONVERT(date, Date), Type, Color, Customer
+    """,
+}
+
+_CUSTOMER_NAMES_SQL = "SELECT Number, Name FROM Customers"
+
+
+_NO_DAY = np.datetime64('NaT', 'D').view(np.int64)
+
+
+def day_bounds(window):
+    """First and last day number (inclusive) covered by a ``resolve_window`` window; None is open."""
+    start, end, end_inclusive = window or (None, None, True)
+    first_day = np.datetime64(start.date(), 'D').view(np.int64) if start is not None else None
+    last_day = None
+    if end is not None:
+        # An exclusive bound at midnight leaves that day out; any other end includes its day
+        last = end.date()
+        if not end_inclusive and end.time() == datetime.min.time():
+            last -= timedelta(days=1)
+        last_day = np.datetime64(last, 'D').view(np.int64)
+    return first_day, last_day
+
+
+def _day(value):
+    # pymssql returns a date, the SQLite shim the ISO text
+    if value is None:
+        return np.datetime64('NaT', 'D')
+    return np.datetime64(str(value)[:10], 'D')
+
+
+class _Level:
+    """Pieces and meters per distinct combination of ``dimensions``."""
+
+    def __init__(self, dimensions, codes, pieces, meters):
+        self.dimensions = dimensions
+        self.codes = codes
+        self.pieces = pieces
+        self.meters = meters
+        self.size = len(pieces)
+
+
+def _group(columns, size):
+    """Group ids per row and the code columns of each group."""
+    if not columns:
+        return np.zeros(size, dtype=np.int64), [], 1
+    stacked = np.stack([column.astype(np.int64) for column in columns], axis=1)
+    if not size:
+        return np.zeros(0, dtype=np.int64), [np.zeros(0, dtype=np.int64) for _ in columns], 0
+    keys, group_ids = np.unique(stacked, axis=0, return_inverse=True)
+    return group_ids.reshape(-1), [keys[:, index] for index in range(keys.shape[1])], len(keys)
+
+
+def _rollup(base, dimensions):
+    group_ids, keys, count = _group([base.codes[name] for name in dimensions], base.size)
+    pieces = np.bincount(group_ids, weights=base.pieces, minlength=count).astype(np.int64)
+    meters = np.bincount(group_ids, weights=base.meters, minlength=count)
+    return _Level(dimensions, dict(zip(dimensions, keys)), pieces, meters)
+
+
+class SalesCube:
+    """The base level, its roll-ups and the labels of the coded dimensions."""
+
+    def __init__(self, rows, customer_names=None, precision=DEFAULT_PRECISION):
+        self.built_at = datetime.now().replace(microsecond=0)
+        self.customer_names = customer_names or {}
+        columns = {name: [row[index] for row in rows] for index, name in enumerate(LEVELS[0])}
+
+        self.labels = {}
+        codes = {}
+        for name in _LABEL_DIMENSIONS:
+            codes[name], self.labels[name] = _factorize(columns[name])
+        self._lookup = {name: {str(label): code for code, label in enumerate(labels) if label is not None}
+                        for name, labels in self.labels.items()}
+        codes['day'] = np.array([_day(value) for value in columns['day']], dtype='datetime64[D]').view(np.int64)
+        pieces = np.array([int(row[5] or 0) for row in rows], dtype=np.int64)
+        meters = np.array([float(row[6]) if row[6] else 0.0 for row in rows], dtype=np.float64)
+
+        base = _Level(LEVELS[0], codes, pieces, meters)
+        self.levels = [base] + [_rollup(base, dimensions) for dimensions in LEVELS[1:]]
+        self.sketches = self._build_sketches(base, precision)
+
+    @classmethod
+    def load(cls, precision=DEFAULT_PRECISION):
+        rows = []
+        for source, statement in _CUBE_QUERIES.items():
+            for day, product, color, customer, pieces, meters in fetch_all(text(statement), {'status': SHIPPED_STATUS}):
+                rows.append((source, day, product, color, customer, pieces, meters))
+        customer_names = {str(number): name for number, name in fetch_all(text(_CUSTOMER_NAMES_SQL))}
+        return cls(rows, customer_names, precision)
+
+    def _build_sketches(self, base, precision):
+        """``DailySketches`` per (source, metric) over the sales rows of the base level."""
+        hashes = {dimension: hash_labels(self.labels[dimension]) for dimension in SKETCH_METRICS.values()}
+        sketches = {}
+        for source in _CUBE_QUERIES:
+            rows = self._sales_mask(base, source)
+            for metric, dimension in SKETCH_METRICS.items():
+                codes = base.codes[dimension]
+                # COUNT(DISTINCT ...) skips NULL
+                keep = rows & (codes != 0)
+                sketches[(source, metric)] = DailySketches(base.codes['day'][keep], hashes[dimension][codes[keep]], precision)
+        return sketches
+
+    @property
+    def size(self):
+        return self.levels[0].size
+
+    def level_for(self, dimensions):
+        """The smallest level holding every stored dimension in ``dimensions``."""
+        stored = {'day' if name == 'month' else name for name in dimensions}
+        candidates = [level for level in self.levels if stored <= set(level.dimensions)]
+        return min(candidates, key=lambda level: level.size)
+
+    def _window_mask(self, level, first_day, last_day):
+        mask = np.ones(level.size, dtype=bool)
+        if first_day is None and last_day is None:
+            return mask
+        days = level.codes['day']
+        mask &= days != _NO_DAY
+        if first_day is not None:
+            mask &= days >= first_day
+        if last_day is not None:
+            mask &= days <= last_day
+        return mask
+
+    def _sales_mask(self, level, source):
+        """Rows of ``source`` that count as sales: Main pieces shipped to a real customer, every Chinese piece."""
+        mask = level.codes['source'] == self._lookup['source'].get(source, -1)
+        if source == 'main':
+            # customerNumber != '6000', which NULL customer numbers fail as well
+            customers = level.codes['customer']
+            mask &= (customers != 0) & (customers != self._lookup['customer'].get(STOCK_CUSTOMER, -1))
+        return mask
+
+    def _filter_mask(self, level, dimension, values, exclude):
+        if dimension in ('day', 'month'):
+            raise ValueError(f"Filter '{dimension}' with start_date/end_date or period instead")
+        lookup = self._lookup[dimension]
+        codes = [lookup[value] for value in values if value in lookup]
+        mask = np.isin(level.codes[dimension], codes)
+        return ~mask if exclude else mask
+
+    def query(self, group_by=(), filters=None, window=None, measures=MEASURES, sort=None, descending=True, top=None):
+        """Aggregate ``measures`` per ``group_by`` combination.
+
+        ``filters`` maps a dimension to ``(values, exclude)``; ``window`` is
+        ``(start, end, end_inclusive)`` as returned by ``resolve_window``.
+        Returns ``(rows, level)``: dicts of dimension labels and measures,
+        sorted by ``sort`` (the first measure by default) and cut to ``top``.
+        """
+        filters = filters or {}
+        for name in group_by:
+            if name not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension '{name}', expected one of: {', '.join(DIMENSIONS)}")
+        for name in filters:
+            if name not in DIMENSIONS:
+                raise ValueError(f"Unknown filter '{name}', expected one of: {', '.join(DIMENSIONS)}")
+        for name in measures:
+            if name not in MEASURES:
+                raise ValueError(f"Unknown measure '{name}', expected one of: {', '.join(MEASURES)}")
+        sort = sort or measures[0]
+        if sort not in measures and sort not in group_by:
+            raise ValueError(f"Cannot sort by '{sort}': it is neither a measure nor a group-by dimension")
+
+        first_day, last_day = day_bounds(window)
+        windowed = first_day is not None or last_day is not None
+        level = self.level_for(set(group_by) | set(filters) | ({'day'} if windowed else set()))
+
+        mask = self._window_mask(level, first_day, last_day)
+        for name, (values, exclude) in filters.items():
+            mask &= self._filter_mask(level, name, values, exclude)
+
+        columns = []
+        for name in group_by:
+            codes = level.codes['day' if name == 'month' else name][mask]
+            if name == 'month':
+                codes = codes.view('datetime64[D]').astype('datetime64[M]').view(np.int64)
+            columns.append(codes)
+        group_ids, keys, count = _group(columns, int(mask.sum()))
+        totals = {
+            'pieces': np.bincount(group_ids, weights=level.pieces[mask], minlength=count).astype(np.int64),
+            'meters': np.bincount(group_ids, weights=level.meters[mask], minlength=count),
+        }
+        if not group_by and not mask.any():
+            count = 0
+
+        if sort in totals:
+            ordering = np.argsort(-totals[sort] if descending else totals[sort], kind='stable')
+        else:
+            sort_keys = keys[group_by.index(sort)]
+            if sort in _LABEL_DIMENSIONS:
+                # Codes follow first appearance; order by the labels they stand for
+                sort_keys = self._label_ranks(sort)[sort_keys]
+            ordering = np.argsort(sort_keys, kind='stable')
+            if descending:
+                ordering = ordering[::-1]
+        if top is not None:
+            ordering = ordering[:top]
+
+        rows = []
+        for index in ordering[:count]:
+            row = {}
+            for name, key in zip(group_by, keys):
+                row[name] = self._label(name, key[index])
+                if name == 'customer':
+                    row['customer_name'] = self.customer_names.get(str(row[name]))
+            for name in measures:
+                value = totals[name][index]
+                row[name] = int(value) if name == 'pieces' else float(value)
+            rows.append(row)
+        return rows, level
+
+    def _label_ranks(self, dimension):
+        """Position of each code of ``dimension`` in label order (NULL first, like SQL Server)."""
+        labels = self.labels[dimension]
+        order = sorted(range(len(labels)), key=lambda code: (labels[code] is not None, str(labels[code])))
+        ranks = np.empty(len(labels), dtype=np.int64)
+        ranks[order] = np.arange(len(labels))
+        return ranks
+
+    def _label(self, dimension, code):
+        if dimension == 'day':
+            return None if code == _NO_DAY else str(np.int64(code).view('datetime64[D]'))
+        if dimension == 'month':
+            return None if code == np.datetime64('NaT', 'M').view(np.int64) else str(np.int64(code).view('datetime64[M]'))
+        return self.labels[dimension][int(code)]
+
+
+    def approx_summary(self, source, window=None):
+        """Pieces and meters of ``source`` sales in ``window`` plus sketch-estimated distinct counts."""
+        level = self.level_for({'source', 'day', 'customer'})
+        first_day, last_day = day_bounds(window)
+        mask = self._sales_mask(level, source) & self._window_mask(level, first_day, last_day)
+        summary = {
+            'total_pieces': int(level.pieces[mask].sum()),
+            'total_meters': float(level.meters[mask].sum()),
+        }
+        for metric in SKETCH_METRICS:
+            summary[metric] = self.sketches[(source, metric)].merge(first_day, last_day).estimate()
+        return summary
+
+    @property
+    def sketch_error(self):
+        """Relative standard error of the distinct-count estimates."""
+        return 1.04 / np.sqrt(1 << next(iter(self.sketches.values())).precision)
+
+    def rank_customers(self, source, window=None, limit=10, ttl=60):
+        """Customers of ``source`` by meters, like the ``/sales/<source>/customers`` routes.
+
+        Main customers are ranked by name (pieces whose number has no
+        ``Customers`` row are left out); Chinese ones by the stored name.
+        ``unique_products`` counts distinct product/color pairs, read from the
+        base level, which keeps both keys. The cube answers the whole days of
+        ``window``; pieces of partly covered days come from small
+        ``load_frame`` loads (``split_window``), so totals match the exact route.
+        """
+        base = self.levels[0]
+        days, edges = split_window(window)
+        mask = self._sales_mask(base, source)
+        mask &= self._window_mask(base, *day_bounds(days)) if days is not None else False
+        if source == 'main':
+            names = [self.customer_names.get(str(label)) if label is not None else None
+                     for label in self.labels['customer']]
+            name_codes, customer_labels = _factorize(names)
+            customers = name_codes[base.codes['customer']]
+            mask &= customers != 0
+        else:
+            customers, customer_labels = base.codes['customer'], self.labels['customer']
+
+        labels = {'customer': list(customer_labels), 'product': list(self.labels['product']),
+                  'color': list(self.labels['color'])}
+        columns = {'customer': [customers[mask]], 'product': [base.codes['product'][mask]],
+                   'color': [base.codes['color'][mask]], 'pieces': [base.pieces[mask]],
+                   'meters': [base.meters[mask]]}
+        for edge in edges:
+            frame = load_frame(source, edge, ttl)
+            if source == 'main':
+                rows = frame.to_customer & frame.is_known('customer_name')
+                names = {'customer': 'customer_name', 'product': 'desan', 'color': 'color'}
+            else:
+                rows = np.ones(frame.size, dtype=bool)
+                names = {'customer': 'customer', 'product': 'type', 'color': 'color'}
+            for name, column in names.items():
+                # Translate the frame's codes into the cube's, adding labels the cube has not seen
+                lookup = {label: code for code, label in enumerate(labels[name])}
+                translate = np.empty(len(frame.labels[column]), dtype=np.int64)
+                for code, label in enumerate(frame.labels[column]):
+                    if label not in lookup:
+                        lookup[label] = len(labels[name])
+                        labels[name].append(label)
+                    translate[code] = lookup[label]
+                columns[name].append(translate[frame.codes[column][rows]])
+            columns['pieces'].append(np.ones(int(rows.sum()), dtype=np.int64))
+            columns['meters'].append(frame.meters[rows])
+        keys, products, colors, pieces, meters = (np.concatenate(columns[name]) for name in
+                                                  ('customer', 'product', 'color', 'pieces', 'meters'))
+
+        groups, group_ids = np.unique(keys, return_inverse=True)
+        count = len(groups)
+        pieces = np.bincount(group_ids, weights=pieces, minlength=count)
+        meters = np.bincount(group_ids, weights=meters, minlength=count)
+        radix = len(labels['product']) * len(labels['color'])
+        pairs = products * len(labels['color']) + colors
+        distinct = np.bincount(np.unique(group_ids * radix + pairs) // radix, minlength=count)
+
+        top = np.argsort(-meters, kind='stable')[:limit]
+        return [{
+            'customer': labels['customer'][groups[index]],
+            'total_pieces': int(pieces[index]),
+            'total_meters': float(meters[index]),
+            'unique_products': int(distinct[index]),
+        } for index in top]
+
+
+def split_window(window):
+    """Split a ``resolve_window`` window into the whole days the cube can answer and the partial days around them.
+
+    Returns ``(days, edges)``: ``days`` is a window of whole days (None when the
+    window lies within a single day) and ``edges`` the windows left over at
+    either end, each within one day.
+    """
+    start, end, end_inclusive = window or (None, None, True)
+    first = start
+    if start is not None and start.time() != datetime.min.time():
+        first = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+    last = datetime.combine(end.date(), datetime.min.time()) if end is not None else None
+    if first is not None and last is not None and first >= last:
+        return None, [(start, end, end_inclusive)]
+
+    edges = []
+    if start is not None and start != first:
+        edges.append((start, first, False))
+    if end is not None and (end_inclusive or end != last):
+        edges.append((last, end, end_inclusive))
+    return (first, last, False), edges
+
+
+_cube = None
+_cube_loaded = 0.0
+# Set by the change feed; the next use rebuilds the cube
+_cube_changed = False
+_rebuilding = False
+_cube_lock = threading.Lock()
+_builds = SingleFlight()
+
+
+def _on_change(event):
+    # Only newly shipped pieces change the cube
+    global _cube_changed
+    if SHIPPED_STATUS in event.statuses:
+        with _cube_lock:
+            _cube_changed = True
+
+
+change_feed.subscribe(_on_change)
+
+
+def _build(precision):
+    global _cube, _cube_loaded, _cube_changed
+    with _cube_lock:
+        # Shipments published while loading mark the new cube changed again
+        _cube_changed = False
+    try:
+        cube = SalesCube.load(precision)
+    except Exception:
+        with _cube_lock:
+            _cube_changed = True
+        raise
+    with _cube_lock:
+        _cube, _cube_loaded = cube, time.monotonic()
+    return cube
+
+
+def _rebuild_in_background(app, engine, precision):
+    def run():
+        global _rebuilding
+        try:
+            with app.app_context():
+                # Read from the same database (mirror, read mode) as the request that asked
+                if engine is not None:
+                    g.query_engine = engine
+                _builds.do('cube', lambda: _build(precision))
+        except Exception as e:
+            print(f"Sales cube rebuild failed: {str(e)}")
+        finally:
+            with _cube_lock:
+                _rebuilding = False
+
+    threading.Thread(target=run, name='sales-cube-rebuild', daemon=True).start()
+
+
+def get_cube(ttl=600, precision=DEFAULT_PRECISION):
+    """The current cube; built on first use, then rebuilt in the background when older than ``ttl`` or changed.
+
+    Until a background rebuild finishes, callers keep getting the previous cube.
+    """
+    global _rebuilding
+    with _cube_lock:
+        cube = _cube
+        if cube is not None and not _cube_changed and time.monotonic() - _cube_loaded < ttl:
+            return cube
+        start = cube is not None and not _rebuilding
+        if start:
+            _rebuilding = True
+
+    if cube is None:
+        # Nothing to answer with yet: build it once for all waiting callers
+        return _builds.do('cube', lambda: _build(precision))
+    if start:
+        _rebuild_in_background(current_app._get_current_object(), query_engine(), precision)
+    return cube
+
+
+def current_cube():
+    """``get_cube`` with the app's ``CUBE_TTL`` and ``HLL_PRECISION``."""
+    config = current_app.config
+    return get_cube(config.get('CUBE_TTL', 600), config.get('HLL_PRECISION', DEFAULT_PRECISION))
@@ -0,0 +1,57 @@
+"""Display formatting for numeric totals, applied when a response is built.
+
+The inventory SQL used to wrap its sums in ``Format(SUM(...), 'N1')``, which
+SQL Server evaluates through the CLR and which hands back localized strings
+that cannot be summed, merged or cached as numbers. The queries now return
+typed sums and the routes format them here, once, as the response is built.
+
+``NUMBER_STRING_COMPAT`` (on by default) keeps the ``'1,234.5'`` strings the
+frontend parses today; a client can ask for either shape per request with
+``?numbers=display`` or ``?numbers=typed`` (floats rounded the same way).
+
+``FORMAT`` runs on .NET: a float is first cut to 15 significant digits and
+then rounded half away from zero, so ``0.25`` shows as ``0.3`` where Python's
+own formatting gives ``0.2``. ``rounded`` does the same, and a NULL sum stays
+``None`` as ``FORMAT(NULL, 'N1')`` did.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from flask import current_app, has_request_context, request
+
+
+NUMBER_STYLES = ('display', 'typed')
+
+
+def rounded(value, decimals=1):
+    """``value`` as a ``Decimal`` rounded the way ``FORMAT(value, 'N<decimals>')`` rounds it."""
+    if not isinstance(value, Decimal):
+        value = Decimal(f'{float(value):.15g}')
+    # Adding 0 turns a rounded -0.0 into 0.0, which .NET Framework prints unsigned
+    return value.quantize(Decimal(1).scaleb(-decimals), rounding=ROUND_HALF_UP) + 0
+
+
+def format_number(value, decimals=1):
+    """``value`` as SQL Server's ``FORMAT(value, 'N<decimals>')`` renders it (en-US)."""
+    return f'{rounded(value, decimals):,.{decimals}f}'
+
+
+def number_style():
+    """``'display'`` or ``'typed'`` for the current request."""
+    if has_request_context():
+        requested = request.args.get('numbers')
+        if requested in NUMBER_STYLES:
+            return requested
+    return 'display' if current_app.config.get('NUMBER_STRING_COMPAT', True) else 'typed'
+
+
+def format_totals(rows, fields=('total_long',), decimals=1, style=None):
+    """Render ``fields`` of each row dict in ``style`` (the request's by default), in place."""
+    style = style or number_style()
+    for row in rows:
+        for field in fields:
+            value = row.get(field)
+            if value is None:
+                continue
+            number = rounded(value, decimals)
+            row[field] = format_number(number, decimals) if style == 'display' else float(number)
+    return rows
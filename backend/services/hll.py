@@ -0,0 +1,103 @@
+"""HyperLogLog sketches for mergeable approximate distinct counts.
+
+``COUNT(DISTINCT ...)`` cannot be summed across days: two days with 40 unique
+customers each may share all of them. A HyperLogLog sketch can be merged
+(register-wise maximum), so one sketch per day answers "unique customers"
+for any range of days with a relative standard error of ``1.04 / sqrt(m)``
+(``m = 2 ** precision`` registers; about 0.8% at the default precision 14).
+
+``DailySketches`` keeps the per-day sketches of one metric sparse, as
+``(day, register, rank)`` triples: a day holds at most as many triples as it
+has distinct values, so years of history stay small and a range merges with
+one ``np.maximum.at`` over the slice of its days.
+"""
+import hashlib
+
+import numpy as np
+
+
+DEFAULT_PRECISION = 14
+
+
+def hash_labels(labels):
+    """Stable 64-bit hashes of ``labels`` (as text)."""
+    return np.array([
+        int.from_bytes(hashlib.blake2b(str(label).encode('utf-8'), digest_size=8).digest(), 'little')
+        for label in labels
+    ], dtype=np.uint64)
+
+
+def _bit_length(values):
+    length = np.zeros(values.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = values >= (np.uint64(1) << np.uint64(shift))
+        length[wide] += shift
+        values = np.where(wide, values >> np.uint64(shift), values)
+    return length + (values > 0)
+
+
+def split_hashes(hashes, precision=DEFAULT_PRECISION):
+    """Register index (top bits) and rank (position of the first set bit in the rest) per hash."""
+    shift = np.uint64(64 - precision)
+    index = (hashes >> shift).astype(np.int64)
+    rest = hashes & ((np.uint64(1) << shift) - np.uint64(1))
+    rank = (64 - precision) - _bit_length(rest) + 1
+    return index, rank.astype(np.uint8)
+
+
+class HyperLogLog:
+    """Dense sketch: one rank register per hash bucket."""
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def standard_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add(self, index, rank):
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def add_hashes(self, hashes):
+        return self.add(*split_hashes(hashes, self.precision))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+
+class DailySketches:
+    """Sparse per-day sketches of one metric, mergeable over any day range."""
+
+    def __init__(self, days, hashes, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        index, rank = split_hashes(hashes, precision)
+        # Keep the highest rank per (day, register)
+        order = np.lexsort((-rank.astype(np.int64), index, days))
+        days, index, rank = days[order], index[order], rank[order]
+        first = np.ones(len(days), dtype=bool)
+        first[1:] = (days[1:] != days[:-1]) | (index[1:] != index[:-1])
+        self.days = days[first]
+        self.index = index[first]
+        self.rank = rank[first]
+
+    def __len__(self):
+        return len(self.days)
+
+    def merge(self, first_day=None, last_day=None):
+        """One sketch for every day in ``[first_day, last_day]`` (day numbers; None is open)."""
+        low = 0 if first_day is None else np.searchsorted(self.days, first_day, 'left')
+        high = len(self.days) if last_day is None else np.searchsorted(self.days, last_day, 'right')
+        return HyperLogLog(self.precision).add(self.index[low:high], self.rank[low:high])
@@ -0,0 +1,219 @@
+"""Inventory aggregates, live or from the ``inventory_snapshot`` table.
+
+The inventory routes count pieces and sum meters per Desan/Color/Type. Read
+live, that scans every piece in the status on each call. With
+``INVENTORY_SNAPSHOT_ENABLED`` they read a compact ``inventory_snapshot``
+table instead (one row per source, status, stock flags, desan/type and color),
+which is rebuilt set-based on the server by ``refresh_inventory_snapshot`` —
+from the ``flask refresh-inventory`` command or the in-app refresher, which
+runs every ``INVENTORY_SNAPSHOT_INTERVAL`` seconds and whenever the change
+feed reports a status move. Responses then carry a ``snapshot`` block with
+its refresh time and whether it is older than ``INVENTORY_SNAPSHOT_MAX_AGE``.
+That time is kept in memory from the last refresh this process ran; the table
+is only asked again when the remembered time looks stale (another process may
+have refreshed it), at most every ``_STATUS_RECHECK`` seconds.
+
+``stock`` marks factory stock orders (``Customer = '6000'``) and
+``stock_customer`` pieces booked to the factory itself (``customerNumber =
+'6000'``); the classic details need both. Shipped pieces are not part of the
+inventory and are left out.
+"""
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import inspect, text
+
+from services.query import fetch_one
+from services.refresher import Refresher
+
+
+_CREATE_TABLE = {
+    'mssql': """
+        IF OBJECT_ID('dbo.inventory_snapshot', 'U') IS NULL
+        BEGIN
+            CREATE TABLE dbo.inventory_snapshot (
+                source NVARCHAR(16) NOT NULL,
+                status NVARCHAR(50) NOT NULL,
+                stock BIT NOT NULL,
+                stock_customer BIT NOT NULL,
+                desan_or_type NVARCHAR(100) NULL,
+                color NVARCHAR(100) NULL,
+                pieces INT NOT NULL,
+                meters FLOAT NULL,
+                refreshed_at DATETIME NOT NULL
+            );
+            CREATE CLUSTERED INDEX IX_inventory_snapshot
+                ON dbo.inventory_snapshot (source, status, stock, stock_customer, desan_or_type, color);
+        END
+    """,
+    'sqlite': """
+        CREATE TABLE IF NOT EXISTS inventory_snapshot (
+            source TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stock INTEGER NOT NULL,
+            stock_customer INTEGER NOT NULL,
+            desan_or_type TEXT,
+            color TEXT,
+            pieces INTEGER NOT NULL,
+            meters REAL,
+            refreshed_at TIMESTAMP NOT NULL
+        )
+    """,
+}
+
+_REFRESH_STATEMENTS = (
+    "DELETE FROM inventory_snapshot",
+    """
+    INSERT INTO inventory_snapshot (source, status, stock, stock_customer, desan_or_type, color, pieces, meters, refreshed_at)
+    SELECT 'main', Status, CASE WHEN Customer = '6000' THEN 1 ELSE 0 END, CASE WHEN customerNumber = '6000' THEN 1 ELSE 0 END,
+           Desan, Color, COUNT(*), SUM(Long2), :refreshed_at
+    FROM Main
+    WHERE Status <> 'مشحون'
+    GROUP BY Status, CASE WHEN Customer = '6000' THEN 1 ELSE 0 END, CASE WHEN customerNumber = '6000' THEN 1 ELSE 0 END, Desan, Color
+    """,
+    """
+    INSERT INTO inventory_snapshot (source, status, stock, stock_customer, desan_or_type, color, pieces, meters, refreshed_at)
+    SELECT 'chinese', Status, 0, 0, Type, Color, COUNT(*), SUM(Long), :refreshed_at
+    FROM Chines
+    WHERE Status <> 'مشحون'
+    GROUP BY Status, Type, Color
+    """,
+)
+
+# (live SQL, snapshot SQL) per inventory view; both return the same columns
+INVENTORY_QUERIES = {
+    'scrap': (
+        "SELECT Desan , COUNT(*) as Desan_Count , SUM(Long2) AS TotalLong FROM Main WHERE Status = 'سقط' GROUP BY Desan ORDER BY Desan DESC",
+        "SELECT desan_or_type, SUM(pieces), SUM(meters) FROM inventory_snapshot WHERE source = 'main' AND status = 'سقط' GROUP BY desan_or_type ORDER BY desan_or_type DESC",
+    ),
+    'classic': (
+        "SELECT Desan , COUNT(*) as Desan_Count , SUM(Long2) AS TotalLong FROM Main WHERE Status = 'مستودع' AND Customer = '6000' GROUP BY Desan ORDER BY Desan DESC",
+        "SELECT desan_or_type, SUM(pieces), SUM(meters) FROM inventory_snapshot WHERE source = 'main' AND status = 'مستودع' AND stock = 1 GROUP BY desan_or_type ORDER BY desan_or_type DESC",
+    ),
+    'chinese': (
+        "SELECT Type, COUNT(*) as Type_Count, SUM(Long) AS TotalLong FROM Chines WHERE Status = 'مستودع' GROUP BY Type ORDER BY Type",
+        "SELECT desan_or_type, SUM(pieces), SUM(meters) FROM inventory_snapshot WHERE source = 'chinese' AND status = 'مستودع' GROUP BY desan_or_type ORDER BY desan_or_type",
+    ),
+    'summary_scrap': (
+        "SELECT COUNT(DISTINCT Desan) as unique_desans, SUM(Long2) as total_length FROM Main WHERE Status = 'سقط'",
+        "SELECT COUNT(DISTINCT desan_or_type), SUM(meters) FROM inventory_snapshot WHERE source = 'main' AND status = 'سقط'",
+    ),
+    'summary_classic': (
+        "SELECT COUNT(DISTINCT Desan) as unique_desans, SUM(Long2) as total_length FROM Main WHERE Status = 'مستودع'",
+        "SELECT COUNT(DISTINCT desan_or_type), SUM(meters) FROM inventory_snapshot WHERE source = 'main' AND status = 'مستودع'",
+    ),
+    'summary_chinese': (
+        "SELECT COUNT(DISTINCT Type) as unique_types, COUNT(*) as total_pieces FROM Chines WHERE Status = 'مستودع'",
+        "SELECT COUNT(DISTINCT desan_or_type), SUM(pieces) FROM inventory_snapshot WHERE source = 'chinese' AND status = 'مستودع'",
+    ),
+    'classic_details': (
+        "SELECT Desan, Color, COUNT(*) as Desan_Count, SUM(Long2) AS TotalLong FROM Main WHERE Status = 'مستودع' and Customer = '6000' and customerNumber = '6000' AND Desan = :desan GROUP BY Desan, Color ORDER BY Color DESC",
+        "SELECT desan_or_type, color, SUM(pieces), SUM(meters) FROM inventory_snapshot WHERE source = 'main' AND status = 'مستودع' AND stock = 1 AND stock_customer = 1 AND desan_or_type = :desan GROUP BY desan_or_type, color ORDER BY color DESC",
+    ),
+    'scrap_details': (
+        "SELECT Desan, Color, COUNT(*) as Desan_Count, SUM(Long2) AS TotalLong FROM Main WHERE Status = 'سقط' AND Desan = :desan GROUP BY Desan, Color ORDER BY Color DESC",
+        "SELECT desan_or_type, color, SUM(pieces), SUM(meters) FROM inventory_snapshot WHERE source = 'main' AND status = 'سقط' AND desan_or_type = :desan GROUP BY desan_or_type, color ORDER BY color DESC",
+    ),
+    'chinese_details': (
+        "SELECT Color, COUNT(*) as Count FROM Chines WHERE Type = :type AND Status = 'مستودع' GROUP BY Color ORDER BY Color",
+        "SELECT color, SUM(pieces) FROM inventory_snapshot WHERE source = 'chinese' AND desan_or_type = :type AND status = 'مستودع' GROUP BY color ORDER BY color",
+    ),
+}
+
+
+def snapshot_enabled():
+    return current_app.config.get('INVENTORY_SNAPSHOT_ENABLED', False)
+
+
+def inventory_query(name):
+    """The statement for inventory view ``name``, from the snapshot when it is enabled."""
+    live, snapshot = INVENTORY_QUERIES[name]
+    return text(snapshot if snapshot_enabled() else live)
+
+
+# Seconds between re-reads of a refresh time that looks stale
+_STATUS_RECHECK = 30
+
+_refreshed_at = None
+_checked_at = None
+_status_lock = threading.Lock()
+
+
+def _remember_refresh(refreshed_at):
+    global _refreshed_at, _checked_at
+    with _status_lock:
+        _refreshed_at, _checked_at = refreshed_at, time.monotonic()
+
+
+def _last_refresh(max_age):
+    """The snapshot's refresh time: remembered, or read from the table when unknown or stale."""
+    with _status_lock:
+        refreshed_at, checked_at = _refreshed_at, _checked_at
+    known_fresh = refreshed_at is not None and (datetime.now() - refreshed_at).total_seconds() <= max_age
+    if known_fresh or (checked_at is not None and time.monotonic() - checked_at < _STATUS_RECHECK):
+        return refreshed_at
+    row = fetch_one(text("SELECT MAX(refreshed_at) FROM inventory_snapshot"))
+    refreshed_at = row[0] if row else None
+    if isinstance(refreshed_at, str):
+        refreshed_at = datetime.fromisoformat(refreshed_at)
+    _remember_refresh(refreshed_at)
+    return refreshed_at
+
+
+def snapshot_status():
+    """``{'refreshed_at', 'age_seconds', 'stale'}`` of the snapshot, or None when reading live."""
+    if not snapshot_enabled():
+        return None
+    max_age = current_app.config.get('INVENTORY_SNAPSHOT_MAX_AGE', 600)
+    refreshed_at = _last_refresh(max_age)
+    if refreshed_at is None:
+        return {'refreshed_at': None, 'age_seconds': None, 'stale': True}
+    age = max(0.0, (datetime.now() - refreshed_at).total_seconds())
+    return {
+        'refreshed_at': refreshed_at.isoformat(),
+        'age_seconds': round(age, 1),
+        'stale': age > max_age,
+    }
+
+
+def ensure_snapshot_table(engine):
+    dialect = 'mssql' if engine.dialect.name == 'mssql' else 'sqlite'
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        if inspector.has_table('inventory_snapshot'):
+            columns = {column['name'] for column in inspector.get_columns('inventory_snapshot')}
+            if 'stock_customer' not in columns:
+                # Snapshot from before the customer-number flag; it is rebuilt right after
+                connection.execute(text("DROP TABLE inventory_snapshot"))
+        connection.execute(text(_CREATE_TABLE[dialect]))
+
+
+def refresh_inventory_snapshot(engine=None):
+    """Rebuild ``inventory_snapshot`` in one transaction; returns the number of rows written."""
+    engine = engine or current_app.extensions['sqlalchemy'].engine
+    ensure_snapshot_table(engine)
+    refreshed_at = datetime.now().replace(microsecond=0)
+    with engine.begin() as connection:
+        for statement in _REFRESH_STATEMENTS:
+            connection.execute(text(statement), {'refreshed_at': refreshed_at})
+        count = connection.execute(text("SELECT COUNT(*) FROM inventory_snapshot")).scalar()
+    _remember_refresh(refreshed_at)
+    return count
+
+
+def _status_moved(event):
+    # Newly shipped pieces alone do not touch the inventory
+    return bool(event.statuses - {'مشحون'})
+
+
+inventory_refresher = Refresher('inventory-refresher', refresh_inventory_snapshot, 'Inventory snapshot refresh', wake_on=_status_moved)
+
+
+def start_inventory_refresher(app):
+    """Start the in-app refresher when the snapshot is enabled and an interval is set."""
+    interval = app.config.get('INVENTORY_SNAPSHOT_INTERVAL', 0)
+    if app.config.get('INVENTORY_SNAPSHOT_ENABLED', False) and interval > 0:
+        inventory_refresher.start(app, interval)
+    return inventory_refresher
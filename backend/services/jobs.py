@@ -0,0 +1,318 @@
+"""Background jobs for heavy reports, with results cached on disk.
+
+A year of ``detailed`` sales, the full ``/orders/all`` or multi-month rankings
+used to run inside the HTTP request, holding a worker thread and a pooled
+connection for as long as they took. Instead a client can ``POST /jobs`` a
+report spec (``{"report": "sales_main_detailed", "params": {...}}``, see
+``REPORTS``), then poll ``/jobs/<id>``, or follow ``/jobs/<id>/events``
+(server-sent events), and download ``/jobs/<id>/result``.
+
+* Jobs run on a pool of ``JOB_WORKERS`` threads; the rest wait in order.
+* The job id is a hash of the normalized spec, so posting a spec that is
+  already queued or running returns that job, and a result younger than
+  ``JOB_RESULT_TTL`` seconds is served from disk without running it again
+  (``"refresh": true`` forces a new run).
+* Results are the report route's JSON, written to ``JOB_CACHE_DIR``. The
+  least recently written or downloaded files are deleted once the directory
+  grows past ``JOB_CACHE_MAX_BYTES``.
+
+A job runs the report's route view in a request context of its own, so the
+mirror, read-mode and circuit-breaker hooks apply as for a direct call. Two
+differ: statements get ``JOB_STATEMENT_TIMEOUT`` rather than the route's
+interactive limit, and admission counts the job in its own ``job`` class,
+which shares the bulk slots with heavy requests and waits instead of being
+shed. A stale response served during a database outage fails the job rather
+than being stored as its result.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app, g
+
+
+# Report name -> route it runs (under the warehouse blueprint prefix)
+REPORTS = {
+    'sales_summary': '/api/warehouse/sales/summary',
+    'sales_main_detailed': '/api/warehouse/sales/main/detailed',
+    'sales_chinese_detailed': '/api/warehouse/sales/chinese/detailed',
+    'sales_top_products': '/api/warehouse/sales/top-products',
+    'sales_main_top_products': '/api/warehouse/sales/main/top-products',
+    'sales_chinese_top_products': '/api/warehouse/sales/chinese/top-products',
+    'sales_main_customers': '/api/warehouse/sales/main/customers',
+    'sales_chinese_customers': '/api/warehouse/sales/chinese/customers',
+    'orders_all': '/api/warehouse/orders/all',
+    'cube': '/api/warehouse/cube',
+}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Finished jobs kept in memory for polling (their results stay on disk)
+_MAX_FINISHED = 200
+
+
+def normalize_spec(spec):
+    """Validate a posted spec; returns ``(report, params)`` with params as sorted strings."""
+    if not isinstance(spec, dict):
+        raise ValueError('Expected a JSON object with "report" and "params"')
+    report = spec.get('report')
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report '{report}', expected one of: {', '.join(REPORTS)}")
+    params = spec.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValueError('"params" must be an object of query parameters')
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, (list, tuple)):
+            value = ','.join(str(item) for item in value)
+        elif isinstance(value, dict) or value is None:
+            raise ValueError(f"Parameter '{name}' must be a string, number or list")
+        normalized[str(name)] = str(value)
+    return report, dict(sorted(normalized.items()))
+
+
+def spec_id(report, params):
+    """Stable job id of a normalized spec."""
+    canonical = json.dumps({'report': report, 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:24]
+
+
+class Job:
+    """One report run and its progress."""
+
+    def __init__(self, job_id, report, params):
+        self.id = job_id
+        self.report = report
+        self.params = params
+        self.state = QUEUED
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.error = None
+        self.size = None
+        self.cached = False
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def update(self, **changes):
+        with self.changed:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def status(self, position=None):
+        status = {
+            'id': self.id,
+            'report': self.report,
+            'params': self.params,
+            'state': self.state,
+            'progress': self.progress,
+            'message': self.message,
+            'cached': self.cached,
+            'created_at': self.created_at.isoformat(timespec='seconds'),
+            'started_at': self.started_at.isoformat(timespec='seconds') if self.started_at else None,
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+        }
+        if position is not None:
+            status['position'] = position
+        if self.state == DONE:
+            status['size'] = self.size
+            status['result'] = f'/api/warehouse/jobs/{self.id}/result'
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+
+class JobQueue:
+    """Worker pool, in-memory job registry and the on-disk result cache."""
+
+    def __init__(self, app, workers, directory, max_bytes, result_ttl):
+        self.app = app
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+        self._jobs = {}
+        # Result file -> last time it was written or read (file mtimes after a restart)
+        self._used = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _fresh_result(self, job_id):
+        path = self.result_path(job_id)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            return None
+        return path if time.time() - modified <= self.result_ttl else None
+
+    def submit(self, spec):
+        """Queue ``spec`` (or join the identical job in flight); returns the job."""
+        report, params = normalize_spec(spec)
+        job_id = spec_id(report, params)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.finished:
+                return job
+            path = None if spec.get('refresh') else self._fresh_result(job_id)
+            job = Job(job_id, report, params)
+            if path is not None:
+                job.state, job.progress, job.message = DONE, 1.0, 'Served from the result cache'
+                job.cached = True
+                job.size = os.path.getsize(path)
+                job.finished_at = datetime.fromtimestamp(os.path.getmtime(path))
+            self._jobs[job_id] = job
+            self._forget_finished()
+        if not job.finished:
+            self._executor.submit(self._run, job)
+        return job
+
+    def _forget_finished(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(len(finished) - _MAX_FINISHED, 0)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """How many queued jobs are ahead of ``job`` (None once it runs)."""
+        if job.state != QUEUED:
+            return None
+        with self._lock:
+            return sum(1 for other in self._jobs.values() if other.state == QUEUED and other.created_at < job.created_at)
+
+    def recent(self, limit=50):
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)[:limit]
+        return [job.status(self.position(job)) for job in jobs]
+
+    def _run(self, job):
+        job.update(state=RUNNING, progress=0.1, message='Running report', started_at=datetime.now())
+        try:
+            with self.app.test_request_context(REPORTS[job.report], query_string=job.params):
+                # Selects the job admission class and JOB_STATEMENT_TIMEOUT
+                g.background_job = True
+                response = self.app.full_dispatch_request()
+                try:
+                    body = response.get_data()
+                    status_code = response.status_code
+                    stale = response.headers.get('X-Cache') == 'STALE'
+                finally:
+                    response.close()
+            if stale:
+                # The breaker answered the last good response; caching it would outlive the outage
+                raise RuntimeError('Database unavailable, the report only had a stale cached response')
+            if status_code != 200:
+                try:
+                    error = json.loads(body).get('error')
+                except ValueError:
+                    error = None
+                raise RuntimeError(error or f'Report answered HTTP {status_code}')
+
+            job.update(progress=0.9, message='Writing result')
+            path = self.result_path(job.id)
+            partial = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(partial, 'wb') as handle:
+                handle.write(body)
+            os.replace(partial, path)
+            self.evict(keep=os.path.basename(path))
+            job.update(state=DONE, progress=1.0, message='Done', size=len(body), finished_at=datetime.now())
+        except Exception as e:
+            print(f"Report job {job.id} ({job.report}) failed: {str(e)}")
+            job.update(state=FAILED, message='Failed', error=str(e), finished_at=datetime.now())
+
+    def open_result(self, job_id):
+        """Path of a stored result, marked as recently used; None when evicted or unknown."""
+        if len(job_id) != 24 or any(char not in '0123456789abcdef' for char in job_id):
+            return None
+        path = self.result_path(job_id)
+        if not os.path.isfile(path):
+            return None
+        # The file's mtime stays the run time, which JOB_RESULT_TTL counts from
+        with self._lock:
+            self._used[os.path.basename(path)] = time.time()
+        return path
+
+    def evict(self, keep=None):
+        """Delete least recently used results (never ``keep``) until the cache fits ``max_bytes``."""
+        with self._lock:
+            used = self._used
+            files = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((max(stat.st_mtime, used.get(name, 0)), stat.st_size, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                os.remove(os.path.join(self.directory, name))
+                used.pop(name, None)
+                total -= size
+
+    def events(self, job, heartbeat=15):
+        """Yield the job's status as SSE messages until it finishes."""
+        yield 'retry: 5000\n\n'
+        seen = -1
+        while True:
+            with job.changed:
+                if job.version == seen:
+                    job.changed.wait(heartbeat)
+                changed = job.version != seen
+                seen = job.version
+            if changed:
+                status = job.status(self.position(job))
+                yield f"event: {'progress' if not job.finished else job.state}\ndata: {json.dumps(status, ensure_ascii=False)}\n\n"
+                if job.finished:
+                    return
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                yield ': keepalive\n\n'
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def job_queue():
+    """The process-wide job queue, created from the config on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            app = current_app._get_current_object()
+            config = app.config
+            _queue = JobQueue(
+                app,
+                config.get('JOB_WORKERS', 2),
+                config.get('JOB_CACHE_DIR') or os.path.join(app.root_path, 'data', 'jobs'),
+                config.get('JOB_CACHE_MAX_BYTES', 500 * 1024 * 1024),
+                config.get('JOB_RESULT_TTL', 600),
+            )
+        return _queue
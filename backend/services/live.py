@@ -0,0 +1,246 @@
+"""Shared poll of the order and inventory aggregates for server-sent events.
+
+Every connected ``/live`` client used to need its own polling of each table
+endpoint. Instead one ``LiveHub`` thread re-reads the aggregates while at
+least one client is connected, diffs them against the previous poll and pushes
+only the rows that changed. Each client gets a full snapshot when it connects
+and deltas afterwards.
+
+Channels:
+
+``orders``
+    Open customer orders keyed by ``[customer, customer_number,
+    customer_name]`` (``order_key``), each flagged ``late`` and ``ready``
+    exactly when ``/orders/late`` and ``/orders/ready`` would list them
+    (see ``services.orders``).
+``inventory``
+    Pieces and meters per desan (classic stock and scrap) and per Chinese
+    type, keyed ``<warehouse>/<name>``.
+
+The hub wakes early when the change feed reports a move, so pushes follow a
+shipment within one feed interval; otherwise it polls every
+``LIVE_POLL_INTERVAL`` seconds. Each open stream holds a server thread, so at
+most ``LIVE_MAX_CLIENTS`` are connected at once; further clients get
+``TooManyClients``.
+"""
+import queue
+import threading
+
+from sqlalchemy import text
+
+from services.changes import change_feed
+from services.orders import OPEN_ORDERS_SQL, is_late, is_ready, order_key
+from services.query import fetch_all
+from services.records import OrderAggregate
+
+
+CHANNELS = ('orders', 'inventory')
+
+_INVENTORY_SQL = {
+    'main': """
+        SELECT CASE WHEN Status = 'سقط' THEN 'scrap' ELSE 'classic' END AS warehouse,
+               Desan, COUNT(*) AS pieces, SUM(Long2) AS meters
+        FROM Main
+        WHERE Status = 'سقط' OR (Status = 'مستودع' AND Customer = '6000')
+        GROUP BY CASE WHEN Status = 'سقط' THEN 'scrap' ELSE 'classic' END, Desan
+    """,
+    'chinese': """
+        SELECT 'chinese' AS warehouse, Type, COUNT(*) AS pieces, SUM(Long) AS meters
+        FROM Chines
+        WHERE Status = 'مستودع'
+        GROUP BY Type
+    """,
+}
+
+
+def _order_rows():
+    rows = {}
+    for row in fetch_all(text(OPEN_ORDERS_SQL)):
+        order = OrderAggregate.from_row(row)
+        data = order.to_dict()
+        data['late'] = is_late(order)
+        data['ready'] = is_ready(order)
+        rows[order_key(order)] = data
+    return rows
+
+
+def _inventory_rows():
+    rows = {}
+    for statement in _INVENTORY_SQL.values():
+        for warehouse, name, pieces, meters in fetch_all(text(statement)):
+            key = f'{warehouse}/{name or ""}'
+            rows[key] = {
+                'warehouse': warehouse,
+                'name': name or '',
+                'pieces': pieces or 0,
+                'total_long': round(float(meters), 1) if meters else 0.0,
+            }
+    return rows
+
+
+_LOADERS = {'orders': _order_rows, 'inventory': _inventory_rows}
+
+
+def diff_rows(previous, current):
+    """Rows added or changed in ``current`` and keys that disappeared."""
+    upserted = [dict(row, key=key) for key, row in current.items() if previous.get(key) != row]
+    removed = [key for key in previous if key not in current]
+    return upserted, removed
+
+
+def format_event(event, data, dumps, event_id=None):
+    """Encode one SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class TooManyClients(Exception):
+    """Raised by ``LiveHub.connect`` when ``LIVE_MAX_CLIENTS`` streams are already open."""
+
+    def __init__(self, limit):
+        super().__init__(f"Too many live clients (limit {limit}), retry later")
+        self.limit = limit
+
+
+class _Client:
+    __slots__ = ('channels', 'messages', 'closed')
+
+    def __init__(self, channels, max_pending):
+        self.channels = channels
+        self.messages = queue.Queue(maxsize=max_pending)
+        self.closed = False
+
+
+class LiveHub:
+    """One poller fanning aggregate deltas out to every connected client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._state = {}
+        self.version = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._unsubscribe = None
+        self.polls = 0
+
+    @property
+    def client_count(self):
+        with self._lock:
+            return len(self._clients)
+
+    def connect(self, app, channels=CHANNELS):
+        """Register a client and return it with its initial snapshot messages."""
+        client = _Client(tuple(channels), app.config.get('LIVE_MAX_PENDING', 100))
+        limit = app.config.get('LIVE_MAX_CLIENTS', 50)
+        with self._lock:
+            if len(self._clients) >= limit:
+                raise TooManyClients(limit)
+            self._clients.add(client)
+            needs_state = any(channel not in self._state for channel in client.channels)
+        if needs_state:
+            self.poll(app)
+
+        with self._lock:
+            snapshot = [
+                format_event('snapshot', {
+                    'version': self.version,
+                    'channel': channel,
+                    'rows': [dict(row, key=key) for key, row in self._state.get(channel, {}).items()],
+                }, app.json.dumps, self.version)
+                for channel in client.channels
+            ]
+        self._ensure_thread(app)
+        return client, snapshot
+
+    def disconnect(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def poll(self, app):
+        """Reload the aggregates and push the deltas; needs an app context."""
+        with self._lock:
+            wanted = {channel for client in self._clients for channel in client.channels} or set(CHANNELS)
+        current = {channel: _LOADERS[channel]() for channel in wanted}
+        self.polls += 1
+
+        messages = []
+        with self._lock:
+            # Channels nobody watches any more would otherwise go stale
+            for channel in [channel for channel in self._state if channel not in current]:
+                del self._state[channel]
+            for channel, rows in current.items():
+                previous = self._state.get(channel)
+                self._state[channel] = rows
+                if previous is None:
+                    continue
+                upserted, removed = diff_rows(previous, rows)
+                if upserted or removed:
+                    self.version += 1
+                    messages.append((channel, format_event('delta', {
+                        'version': self.version,
+                        'channel': channel,
+                        'upserted': upserted,
+                        'removed': removed,
+                    }, app.json.dumps, self.version)))
+            clients = list(self._clients)
+
+        for channel, message in messages:
+            for client in clients:
+                if channel not in client.channels:
+                    continue
+                try:
+                    client.messages.put_nowait(message)
+                except queue.Full:
+                    # Too far behind to catch up with deltas; make it reconnect for a snapshot
+                    self.disconnect(client)
+                    client.closed = True
+        return len(messages)
+
+    def stream(self, client, snapshot, heartbeat=15):
+        """Yield the SSE body for ``client`` until it disconnects or falls behind."""
+        try:
+            yield 'retry: 5000\n\n'
+            for message in snapshot:
+                yield message
+            while not client.closed:
+                try:
+                    yield client.messages.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+        finally:
+            self.disconnect(client)
+
+    def _ensure_thread(self, app):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._unsubscribe is None:
+                self._unsubscribe = change_feed.subscribe(lambda event: self._wake.set())
+            self._thread = threading.Thread(target=self._run, args=(app,), name='live-hub', daemon=True)
+            self._thread.start()
+
+    def _run(self, app):
+        interval = app.config.get('LIVE_POLL_INTERVAL', 10)
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            with self._lock:
+                if not self._clients:
+                    # Last client left: stop polling and forget the state
+                    self._state = {}
+                    self._thread = None
+                    return
+            try:
+                with app.app_context():
+                    self.poll(app)
+            except Exception as e:
+                print(f"Live poll failed: {str(e)}")
+
+
+live_hub = LiveHub()
@@ -0,0 +1,314 @@
+"""Local SQLite mirror of the columns the sales reports read.
+
+The ``/sales/*`` routes scan date windows of ``Main`` and ``Chines`` and
+compete with the warehouse screens for the shared SQL Server. The mirror keeps
+a copy of only the columns those reports use in a local SQLite file
+(``ANALYTICS_MIRROR_PATH``). With ``ANALYTICS_MIRROR_ENABLED`` the sales
+routes and the ``/cube`` build read from it instead; their T-SQL runs
+unchanged through the ``sqlite_compat`` shim and responses carry
+``X-Analytics-Source: mirror`` and the ``X-Mirror-Synced-At`` of the copy.
+Until the first sync completes they keep reading the primary.
+
+``sync_mirror`` is incremental and only reads rows that changed:
+
+* with SQL Server change tracking enabled on a table, the table is synced
+  from the change-tracking version of its last sync: ``CHANGETABLE(CHANGES
+  ...)`` names the inserted, updated and deleted pieces; the first two are
+  re-read by number and the deleted ones dropped;
+* without it, two high-water marks kept in ``mirror_state`` stand in: pieces
+  above the highest ``Number`` copied are new, and shipped pieces whose
+  shipping date is at or past the latest one copied have just been shipped
+  (both are seeks on indexed columns). Edits to other columns, pieces that
+  are un-shipped and deletes are only picked up by the full recopy every
+  ``ANALYTICS_MIRROR_FULL_INTERVAL`` seconds.
+
+``Customers`` is small and copied whole. ``flask sync-mirror --full``
+recopies everything. The copy is written in one transaction in WAL mode, so
+report queries keep reading the previous state until it commits.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app, g, request
+from sqlalchemy import bindparam, create_engine, event, text
+
+from services import sqlite_compat
+from services.refresher import Refresher
+
+
+SHIPPED_STATUS = 'مشحون'
+
+# Routes whose reads move to the mirror (rule substrings)
+MIRRORED_ROUTES = ('/sales/', '/cube')
+
+# Columns copied per table (only what the sales reports read), and the indexes they filter on
+MIRROR_TABLES = {
+    'Customers': {
+        'columns': (('Number', 'TEXT PRIMARY KEY'), ('Name', 'TEXT')),
+        'indexes': (),
+        'incremental': False,
+    },
+    'Main': {
+        'columns': (
+            ('Number', 'INTEGER PRIMARY KEY'), ('Desan', 'TEXT'), ('Color', 'TEXT'), ('Long', 'REAL'),
+            ('Long2', 'REAL'), ('Status', 'TEXT'), ('Customer', 'TEXT'), ('customerNumber', 'TEXT'),
+            ('Date', 'TIMESTAMP'), ('Date3', 'TIMESTAMP'),
+        ),
+        'indexes': (('Status', 'Date3'), ('Date',)),
+        'incremental': True,
+        'shipped_date': 'Date3',
+    },
+    'Chines': {
+        'columns': (
+            ('Number', 'INTEGER PRIMARY KEY'), ('Type', 'TEXT'), ('Color', 'TEXT'), ('Long', 'REAL'),
+            ('Status', 'TEXT'), ('Customer', 'TEXT'), ('Date', 'TIMESTAMP'),
+        ),
+        'indexes': (('Status', 'Date'),),
+        'incremental': True,
+        'shipped_date': 'Date',
+    },
+}
+
+_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS mirror_state (
+        table_name TEXT PRIMARY KEY,
+        high_water INTEGER,
+        shipped_through TEXT,
+        tracking_version INTEGER,
+        full_copy_at REAL,
+        row_count INTEGER NOT NULL,
+        synced_at TIMESTAMP NOT NULL
+    )
+"""
+_STATE_COLUMNS = ('high_water', 'shipped_through', 'tracking_version', 'full_copy_at')
+
+_TRACKING_SQL = """
+    SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version,
+           CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID(:table)) AS min_valid_version
+"""
+
+# Keys per re-read query; stays well under SQL Server's 2100 parameters
+_REREAD_CHUNK = 1000
+
+_engines = {}
+_engines_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    # Readers keep their snapshot while a sync writes
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+    dbapi_connection.execute('PRAGMA busy_timeout=5000')
+
+
+def mirror_engine(path=None):
+    """The SQLite engine for the mirror file (one per path)."""
+    path = os.path.abspath(path or current_app.config['ANALYTICS_MIRROR_PATH'])
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            engine = create_engine(f'sqlite:///{path}')
+            event.listen(engine, 'connect', _on_connect)
+            sqlite_compat.install(engine)
+            _engines[path] = engine
+        return engine
+
+
+def ensure_mirror_schema(engine):
+    with engine.begin() as connection:
+        state_columns = {row[1] for row in connection.exec_driver_sql('PRAGMA table_info(mirror_state)')}
+        if state_columns and not set(_STATE_COLUMNS) <= state_columns:
+            # Mirror from before the change marks: start over with a full copy
+            connection.exec_driver_sql('DROP TABLE mirror_state')
+        connection.exec_driver_sql(_STATE_TABLE)
+        for table, spec in MIRROR_TABLES.items():
+            columns = ', '.join(f'{name} {kind}' for name, kind in spec['columns'])
+            connection.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+            for index in spec['indexes']:
+                name = f'IX_{table}_{"_".join(index)}'
+                connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(index)})')
+
+
+def _values(row):
+    # sqlite3 cannot bind the Decimals pymssql returns for numeric columns
+    return tuple(float(value) if isinstance(value, Decimal) else value for value in row)
+
+
+def _copy(source, mirror, table, statement, params, batch_size):
+    """Stream ``statement`` from the primary into ``table``; returns the copied keys."""
+    spec = MIRROR_TABLES[table]
+    names = [name for name, _ in spec['columns']]
+    insert = f'INSERT OR REPLACE INTO {table} ({", ".join(names)}) VALUES ({", ".join("?" for _ in names)})'
+    keys = set()
+    with source.connect() as connection:
+        result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(statement, params)
+        for rows in result.partitions(batch_size):
+            values = [_values(row) for row in rows]
+            mirror.exec_driver_sql(insert, values)
+            keys.update(row[0] for row in values)
+    return keys
+
+
+def _tracking(source, table):
+    """``(current_version, min_valid_version)`` when SQL Server change tracking covers ``table``, else None."""
+    if source.dialect.name != 'mssql':
+        return None
+    try:
+        with source.connect() as connection:
+            row = connection.execute(text(_TRACKING_SQL), {'table': table}).one()
+    except Exception as e:
+        print(f"Change tracking unavailable for {table}, syncing by high-water marks: {str(e)}")
+        return None
+    return (row.version, row.min_valid_version) if row.min_valid_version is not None else None
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def _reread(source, mirror, table, select, numbers, batch_size, stats):
+    """Copy ``numbers`` from the primary again; those no longer there are dropped."""
+    reread = text(f'{select} WHERE Number IN :numbers').bindparams(bindparam('numbers', expanding=True))
+    for offset in range(0, len(numbers), _REREAD_CHUNK):
+        chunk = numbers[offset:offset + _REREAD_CHUNK]
+        found = _copy(source, mirror, table, reread, {'numbers': chunk}, batch_size)
+        gone = [(number,) for number in chunk if number not in found]
+        if gone:
+            mirror.exec_driver_sql(f'DELETE FROM {table} WHERE Number = ?', gone)
+        stats['reread'] += len(found)
+        stats['deleted'] += len(gone)
+
+
+def _sync_table(source, mirror, table, spec, state, batch_size, full_interval):
+    """Sync one table; returns its stats and the new ``mirror_state`` values."""
+    columns = ', '.join(name for name, _ in spec['columns'])
+    select = f'SELECT {columns} FROM {table}'
+    stats = {'mode': 'full copy', 'copied': 0, 'reread': 0, 'deleted': 0}
+    tracking = _tracking(source, table) if spec['incremental'] else None
+    version = state.get('tracking_version')
+
+    if tracking is not None and version is not None and version >= tracking[1]:
+        stats['mode'] = 'change tracking'
+        changes = text(f'SELECT CT.Number, CT.SYS_CHANGE_OPERATION FROM CHANGETABLE(CHANGES {table}, :version) AS CT')
+        with source.connect() as connection:
+            changed = connection.execute(changes, {'version': version}).fetchall()
+        deleted = [(number,) for number, operation in changed if operation == 'D']
+        if deleted:
+            mirror.exec_driver_sql(f'DELETE FROM {table} WHERE Number = ?', deleted)
+            stats['deleted'] += len(deleted)
+        _reread(source, mirror, table, select, [number for number, operation in changed if operation != 'D'],
+                batch_size, stats)
+        return stats, dict(state, tracking_version=tracking[0])
+
+    full_due = full_interval > 0 and time.time() - (state.get('full_copy_at') or 0) >= full_interval
+    if tracking is None and state.get('high_water') is not None and not full_due:
+        stats['mode'] = 'high-water marks'
+        copied = _copy(source, mirror, table, text(f'{select} WHERE Number > :high_water'),
+                       {'high_water': state['high_water']}, batch_size)
+        shipped_through = _as_datetime(state.get('shipped_through'))
+        if shipped_through is not None:
+            # At or past the mark: pieces shipped later in the same second are not missed
+            copied |= _copy(source, mirror, table,
+                            text(f"{select} WHERE Status = :shipped AND {spec['shipped_date']} >= :shipped_through"),
+                            {'shipped': SHIPPED_STATUS, 'shipped_through': shipped_through}, batch_size)
+        stats['copied'] = len(copied)
+        return stats, _marks(mirror, table, spec, state)
+
+    # First sync, a full recopy, or change tracking lost our version: copy everything.
+    # The version is read first, so changes made during the copy are applied next time.
+    mirror.exec_driver_sql(f'DELETE FROM {table}')
+    stats['copied'] = len(_copy(source, mirror, table, text(select), {}, batch_size))
+    return stats, _marks(mirror, table, spec, dict(
+        state, tracking_version=tracking[0] if tracking is not None else None, full_copy_at=time.time()
+    ))
+
+
+def _marks(mirror, table, spec, state):
+    """``state`` with the high-water marks of what the mirror now holds."""
+    if not spec['incremental']:
+        return state
+    high_water, shipped_through = mirror.exec_driver_sql(
+        f"SELECT MAX(Number), (SELECT MAX({spec['shipped_date']}) FROM {table} WHERE Status = ?) FROM {table}",
+        (SHIPPED_STATUS,)
+    ).one()
+    shipped_through = _as_datetime(shipped_through)
+    return dict(state, high_water=high_water,
+                shipped_through=shipped_through.isoformat(sep=' ') if shipped_through else None)
+
+
+def sync_mirror(source=None, path=None, full=False):
+    """Bring the mirror up to date with the primary; returns per-table stats."""
+    source = source or current_app.extensions['sqlalchemy'].engine
+    engine = mirror_engine(path)
+    config = current_app.config
+    batch_size = config.get('EXPORT_BATCH_SIZE', 10000)
+    full_interval = config.get('ANALYTICS_MIRROR_FULL_INTERVAL', 86400)
+    ensure_mirror_schema(engine)
+
+    results = {}
+    with _sync_lock, engine.begin() as mirror:
+        states = {}
+        if not full:
+            for row in mirror.exec_driver_sql(f'SELECT table_name, {", ".join(_STATE_COLUMNS)} FROM mirror_state'):
+                states[row[0]] = dict(zip(_STATE_COLUMNS, row[1:]))
+        synced_at = datetime.now().replace(microsecond=0)
+        for table, spec in MIRROR_TABLES.items():
+            state = states.get(table, {}) if spec['incremental'] else {}
+            stats, state = _sync_table(source, mirror, table, spec, state, batch_size, full_interval)
+            stats['rows'] = mirror.exec_driver_sql(f'SELECT COUNT(*) FROM {table}').scalar()
+            mirror.exec_driver_sql(
+                f'INSERT OR REPLACE INTO mirror_state (table_name, {", ".join(_STATE_COLUMNS)}, row_count, synced_at) '
+                f'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (table, *(state.get(name) for name in _STATE_COLUMNS), stats['rows'], synced_at),
+            )
+            results[table] = stats
+    return results
+
+
+def mirror_synced_at(engine):
+    """When every table was last synced, or None before the first complete sync."""
+    try:
+        with engine.connect() as connection:
+            count, synced_at = connection.exec_driver_sql('SELECT COUNT(*), MIN(synced_at) FROM mirror_state').one()
+    except Exception:
+        return None
+    return synced_at if count == len(MIRROR_TABLES) else None
+
+
+def use_mirror_for_sales():
+    """``before_request`` hook: point the sales reports at the mirror when enabled."""
+    if not current_app.config.get('ANALYTICS_MIRROR_ENABLED', False):
+        return
+    if request.url_rule is None or not any(route in request.url_rule.rule for route in MIRRORED_ROUTES):
+        return
+    engine = mirror_engine()
+    synced_at = mirror_synced_at(engine)
+    if synced_at is not None:
+        g.query_engine = engine
+        g.mirror_synced_at = synced_at
+
+
+def tag_mirror_response(response):
+    """``after_request`` hook: say which database answered a sales report."""
+    synced_at = g.get('mirror_synced_at')
+    if synced_at is not None:
+        response.headers['X-Analytics-Source'] = 'mirror'
+        response.headers['X-Mirror-Synced-At'] = synced_at.isoformat() if isinstance(synced_at, datetime) else str(synced_at)
+    return response
+
+
+mirror_sync = Refresher('analytics-mirror-sync', sync_mirror, 'Analytics mirror sync')
+
+
+def start_mirror_sync(app):
+    """Start the in-app sync when the mirror is enabled and an interval is set."""
+    interval = app.config.get('ANALYTICS_MIRROR_INTERVAL', 0)
+    if app.config.get('ANALYTICS_MIRROR_ENABLED', False) and interval > 0:
+        mirror_sync.start(app, interval)
+    return mirror_sync
@@ -0,0 +1,186 @@
+"""Per-order piece details with a shared cache.
+
+``/orders/details`` and its batch variant resolve order numbers here. Cached
+orders are served from memory; the misses are loaded together with one
+``WHERE Customer IN (...)`` query and cached one entry per order, so expanding
+an order again (or one that was prefetched) costs no query. The change feed
+drops the cache whenever ``Main`` moves. SQL Server's ``IN`` ignores trailing
+spaces and, under a case-insensitive collation (``ORDER_NUMBER_CASE_INSENSITIVE``),
+case, so the rows are matched back to the requested numbers by the same rules
+rather than by their exact ``Customer`` text.
+
+With ``?fields=`` the details are a projection of ``MainOrderDetail``: cached
+orders are cut down to those fields, and misses are loaded with only their
+columns (and no ``Customers`` join unless ``customerName`` is asked for).
+Projected rows are not cached, since they cannot answer a full request.
+
+After an order list is served, ``prefetch_top_orders`` hands the first
+``ORDER_DETAILS_PREFETCH`` orders (latest ``MaxEndDate`` first) to a single
+background worker, so the row a user usually opens next is already cached.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import bindparam, text
+
+from services.changes import change_feed
+from services.query import fetch_all
+from services.records import MainOrderDetail
+from services.ttl_cache import TTLCache
+
+
+ORDER_DETAILS_SQL = text("""
+    SELECT
+        Customers.Name AS customerName,
+        Main.Number,
+        Main.Desan,
+        Main.Color,
+        Main.Long2,
+        Main.Status,
+        Main.customerNumber,
+        Main.Customer,
+        Main.Date,
+        Main.Date4,
+        Main.endDate
+    FROM Main
+    JOIN Customers ON Main.customerNumber = Customers.Number
+    WHERE Main.Customer IN :order_numbers
+    ORDER BY Main.Customer, Main.Date DESC
+""").bindparams(bindparam('order_numbers', expanding=True))
+
+# Projected record class -> its details query
+_projected_sql = {}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# One worker keeps prefetching from competing with requests for connections
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='order-prefetch')
+_prefetch_pending = set()
+
+
+def _get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = current_app.config
+            _cache = TTLCache(config.get('ORDER_DETAILS_CACHE_SIZE', 512), config.get('ORDER_DETAILS_CACHE_TTL', 120))
+        return _cache
+
+
+def _on_change(event):
+    if event.source == 'main' and _cache is not None:
+        _cache.clear()
+
+
+change_feed.subscribe(_on_change)
+
+
+def cached_orders(order_numbers):
+    """The subset of ``order_numbers`` whose details are cached and fresh."""
+    cache = _get_cache()
+    return [number for number in order_numbers if cache.get(number) is not None]
+
+
+def _details_sql(record_cls):
+    """The details query selecting only ``record_cls``'s columns, led by the order number."""
+    sql_query = _projected_sql.get(record_cls)
+    if sql_query is None:
+        if record_cls.uses_table('Customers'):
+            customers_join, customer_exists = "JOIN Customers ON Main.customerNumber = Customers.Number", ""
+        else:
+            # Keep the join's row set: pieces whose customer exists
+            customers_join = ""
+            customer_exists = "AND EXISTS (SELECT 1 FROM Customers WHERE Customers.Number = Main.customerNumber)"
+        sql_query = text(f"""
+            SELECT Main.Customer, {record_cls.select_list()}
+            FROM Main
+            {customers_join}
+            WHERE Main.Customer IN :order_numbers {customer_exists}
+            ORDER BY Main.Customer, Main.Date DESC
+        """).bindparams(bindparam('order_numbers', expanding=True))
+        _projected_sql[record_cls] = sql_query
+    return sql_query
+
+
+def _match_key(value, case_insensitive):
+    """An order number as SQL Server compares it: trailing spaces ignored, and case under a CI collation."""
+    key = str(value).rstrip(' ') if value is not None else ''
+    return key.casefold() if case_insensitive else key
+
+
+def _by_requested_number(numbers, rows):
+    """Group ``(Customer, record)`` rows under each requested number the database matched them to."""
+    case_insensitive = current_app.config.get('ORDER_NUMBER_CASE_INSENSITIVE', True)
+    requested = {}
+    for number in numbers:
+        requested.setdefault(_match_key(number, case_insensitive), []).append(number)
+    loaded = {number: [] for number in numbers}
+    for customer, record in rows:
+        for number in requested.get(_match_key(customer, case_insensitive), ()):
+            loaded[number].append(record)
+    return loaded
+
+
+def load_order_details(order_numbers, record_cls=MainOrderDetail):
+    """Map each order number to its details (newest first), querying only cache misses.
+
+    ``record_cls`` may be a projection of ``MainOrderDetail`` (see ``Record.project``).
+    """
+    cache = _get_cache()
+    projected = record_cls is not MainOrderDetail
+    details = {}
+    missing = []
+    for number in dict.fromkeys(order_numbers):
+        cached = cache.get(number)
+        if cached is None:
+            missing.append(number)
+        elif projected:
+            details[number] = tuple(record_cls.from_record(record) for record in cached)
+        else:
+            details[number] = cached
+
+    if missing and projected:
+        rows = fetch_all(_details_sql(record_cls), {'order_numbers': missing})
+        loaded = _by_requested_number(missing, ((row[0], record_cls.from_row(row[1:])) for row in rows))
+        for number in missing:
+            details[number] = tuple(loaded[number])
+    elif missing:
+        rows = fetch_all(ORDER_DETAILS_SQL, {'order_numbers': missing})
+        loaded = _by_requested_number(missing, ((row[7], MainOrderDetail.from_row(row)) for row in rows))
+        for number in missing:
+            records = tuple(loaded[number])
+            cache.put(number, records)
+            details[number] = records
+
+    return {number: details[number] for number in dict.fromkeys(order_numbers)}
+
+
+def _prefetch(app, order_numbers):
+    try:
+        with app.app_context():
+            load_order_details(order_numbers)
+    except Exception as e:
+        print(f"Order details prefetch failed: {str(e)}")
+    finally:
+        with _cache_lock:
+            _prefetch_pending.difference_update(order_numbers)
+
+
+def prefetch_top_orders(orders):
+    """Load details of the first K orders by ``MaxEndDate`` in the background."""
+    limit = current_app.config.get('ORDER_DETAILS_PREFETCH', 0)
+    if limit <= 0 or not orders:
+        return []
+
+    latest_first = sorted(orders, key=lambda order: order.max_end_date or '', reverse=True)
+    candidates = [order.customer for order in latest_first[:limit] if order.customer]
+    cached = set(cached_orders(candidates))
+    missing = [number for number in candidates if number not in cached]
+    with _cache_lock:
+        missing = [number for number in missing if number not in _prefetch_pending]
+        _prefetch_pending.update(missing)
+    if missing:
+        _prefetch_executor.submit(_prefetch, current_app._get_current_object(), missing)
+    return missing
@@ -0,0 +1,69 @@
+"""Customer-order aggregates shared by the order routes and the live feed.
+
+``OPEN_ORDERS_SQL`` is the per-order status breakdown behind
+``/orders-in-progress``: every customer order that still has a piece which is
+not shipped. Rows are identified by ``order_key``, the full group, never by
+the order number alone.
+
+The ``/orders/late`` and ``/orders/ready`` queries select subsets of those
+rows, so consumers that already hold the open orders classify them with
+``is_late``/``is_ready`` instead of querying again. Their SQL differs in one
+place: the order-level exclusion only looks at pieces not booked to stock
+(``customerNumber != '6000'``), so it also drops orders whose only unshipped
+pieces are stock pieces. Those orders' rows have nothing in production or in
+the warehouse, so ``is_late``/``is_ready`` are false for them as well, and
+classifying the open orders gives exactly the late and ready lists.
+"""
+from datetime import datetime
+
+
+OPEN_ORDERS_SQL = """
+    SELECT
+        Main.Customer,
+        Main.customerNumber,
+        Customers.name,
+        MAX(Main.Invoice) AS Invoice,
+        COUNT(CASE WHEN Main.Status = 'مستودع' THEN 1 END) AS [في مستودع],
+        COUNT(CASE WHEN Main.Status = 'تصنيع' THEN 1 END) AS [في تصنيع],
+        COUNT(CASE WHEN Main.Status = 'مصبغة' THEN 1 END) AS [في مصبغة],
+        COUNT(CASE WHEN Main.Status = 'مستودع الخام' THEN 1 END) AS [في مستودع الخام],
+        COUNT(CASE WHEN Main.Status = 'مشحون' THEN 1 END) AS [مشحون],
+        (COUNT(CASE WHEN Main.Status = 'مستودع' THEN 1 END)
+         + COUNT(CASE WHEN Main.Status = 'تصنيع' THEN 1 END)
+         + COUNT(CASE WHEN Main.Status = 'مصبغة' THEN 1 END)
+         + COUNT(CASE WHEN Main.Status = 'مستودع الخام' THEN 1 END)
+         + COUNT(CASE WHEN Main.Status = 'مشحون' THEN 1 END)) AS Totals,
+        MAX(Main.endDate) AS MaxEndDate
+    FROM Main
+    JOIN Customers ON Main.customerNumber = Customers.Number
+    WHERE Main.Status IN ('مستودع', 'تصنيع', 'مصبغة', 'مشحون', 'مستودع الخام')
+      AND Main.customerNumber != '6000'
+      AND Main.Customer NOT IN (
+          SELECT Customer FROM Main
+          GROUP BY Customer
+          HAVING COUNT(DISTINCT CASE WHEN Status != 'مشحون' THEN Status END) = 0
+      )
+    GROUP BY Main.Customer, Main.customerNumber, Customers.name
+    ORDER BY MaxEndDate DESC
+"""
+
+
+def order_key(order):
+    """The ``GROUP BY`` of the order queries: one order number may span several customers."""
+    return (order.customer, order.customer_number, order.customer_name)
+
+
+def in_production(order):
+    return order.in_manufacturing > 0 or order.in_dyeing > 0 or order.in_raw_warehouse > 0
+
+
+def is_late(order, now=None):
+    """Past its due date with pieces still in production (``/orders/late``)."""
+    # ``max_end_date`` is kept as an ISO string, which orders like the datetime
+    now = (now or datetime.now()).isoformat()
+    return order.max_end_date is not None and order.max_end_date < now and in_production(order)
+
+
+def is_ready(order):
+    """Nothing left in production and pieces waiting in the warehouse (``/orders/ready``)."""
+    return not in_production(order) and order.in_warehouse > 0
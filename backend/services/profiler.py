@@ -0,0 +1,274 @@
+"""Opt-in sampling profiler for single requests, written as speedscope files.
+
+When a route is slow it is not obvious whether the time goes to SQL, to the
+row loops or to JSON encoding. A profiled request gets a sampler thread that
+reads the request thread's stack every ``PROFILER_INTERVAL_MS`` milliseconds,
+plus engine event timings for every statement that thread executes. The
+result is saved under ``PROFILER_DIR`` as a speedscope file
+(https://www.speedscope.app) with two profiles: the sampled stacks
+(left-heavy/flame view) and the SQL statements as an evented timeline. The
+``X-Profile-Id`` response header names the file; ``/profiles`` lists the
+recent ones and ``/profiles/<name>`` downloads one; both need the token.
+
+A request is profiled when ``PROFILER_ENABLED`` is set, or when it carries an
+``X-Profile`` header equal to ``PROFILER_TOKEN``. With neither configured
+``install_profiler`` registers no hooks and no engine listeners at all, so
+unprofiled servers pay nothing. Streaming responses are profiled up to the
+point where the body starts streaming. A request that fails before its
+response is finished is still stopped (and saved) when its context tears down.
+"""
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+# Request thread id -> active RequestProfile
+_active = {}
+_active_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if threading.get_ident() in _active:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get(threading.get_ident())
+    started = conn.info.get('profile_started')
+    if profile is not None and started:
+        profile.statements.append((started.pop(), time.perf_counter(), statement))
+
+
+class _Sampler(threading.Thread):
+    """Record the target thread's stack at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class RequestProfile:
+    """Samples and SQL timings of one request."""
+
+    def __init__(self, name, interval):
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.statements = []
+        self.sampler = _Sampler(self.thread_id, interval)
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        with _active_lock:
+            if not _active:
+                event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _active[self.thread_id] = self
+        self.started = time.perf_counter()
+        self.sampler.start()
+        return self
+
+    def stop(self):
+        self.sampler.stop()
+        self.finished = time.perf_counter()
+        with _active_lock:
+            _active.pop(self.thread_id, None)
+            if not _active:
+                event.remove(Engine, 'before_cursor_execute', _before_cursor_execute)
+                event.remove(Engine, 'after_cursor_execute', _after_cursor_execute)
+        return self
+
+    @property
+    def duration_ms(self):
+        return (self.finished - self.started) * 1000
+
+    def speedscope(self, metadata):
+        """The profile as a speedscope document."""
+        frames = []
+        frame_ids = {}
+
+        def frame_id(key):
+            if key not in frame_ids:
+                name, path, line = key
+                frame_ids[key] = len(frames)
+                frames.append({'name': name, 'file': path, 'line': line})
+            return frame_ids[key]
+
+        samples, weights = [], []
+        previous = self.started
+        for moment, stack in self.sampler.samples:
+            samples.append([frame_id(key) for key in stack])
+            weights.append(round((moment - previous) * 1000, 3))
+            previous = moment
+
+        events = []
+        for started, finished, statement in self.statements:
+            index = frame_id((' '.join(statement.split())[:120], 'SQL', 0))
+            events.append({'type': 'O', 'frame': index, 'at': round((started - self.started) * 1000, 3)})
+            events.append({'type': 'C', 'frame': index, 'at': round((finished - self.started) * 1000, 3)})
+        end = round(self.duration_ms, 3)
+
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': self.name,
+            'exporter': 'warehouse-backend profiler',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': [
+                {'type': 'sampled', 'name': f'{self.name} (stacks)', 'unit': 'milliseconds',
+                 'startValue': 0, 'endValue': end, 'samples': samples, 'weights': weights},
+                {'type': 'evented', 'name': f'{self.name} (SQL)', 'unit': 'milliseconds',
+                 'startValue': 0, 'endValue': end, 'events': events},
+            ],
+            'metadata': metadata,
+        }
+
+
+def profile_dir():
+    return current_app.config.get('PROFILER_DIR') or os.path.join(current_app.root_path, 'data', 'profiles')
+
+
+def _wants_profile():
+    config = current_app.config
+    # Reading profiles is not worth a profile of its own
+    if request.method == 'OPTIONS' or '/profiles' in request.path:
+        return False
+    if config.get('PROFILER_ENABLED', False):
+        return True
+    token = config.get('PROFILER_TOKEN')
+    return bool(token) and request.headers.get('X-Profile') == token
+
+
+def _start_profile():
+    if not _wants_profile():
+        return
+    name = _SAFE_NAME.sub('_', f"{request.method}{request.path}").strip('_')
+    interval = current_app.config.get('PROFILER_INTERVAL_MS', 5) / 1000
+    g.request_profile = RequestProfile(name, interval).start()
+
+
+def _stop_profile(profile, status, error=None):
+    """Stop ``profile`` and save it; returns the file name, or None when saving failed."""
+    profile.stop()
+    sql_ms = sum(finished - started for started, finished, _ in profile.statements) * 1000
+    metadata = {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': status,
+        'duration_ms': round(profile.duration_ms, 2),
+        'samples': len(profile.sampler.samples),
+        'sql_statements': len(profile.statements),
+        'sql_ms': round(sql_ms, 2),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    if error is not None:
+        metadata['error'] = repr(error)
+    try:
+        return save_profile(profile.speedscope(metadata), profile.name)
+    except Exception as e:
+        print(f"Saving request profile failed: {str(e)}")
+        return None
+
+
+def _finish_profile(response):
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        name = _stop_profile(profile, response.status_code)
+        if name:
+            response.headers['X-Profile-Id'] = name
+    return response
+
+
+def _teardown_profile(error):
+    # An exception can skip the after_request hooks; never leave the sampler and engine listeners running
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        _stop_profile(profile, 500, error)
+
+
+def save_profile(document, name):
+    """Write ``document`` to the profile directory, keeping the newest ``PROFILER_KEEP`` (0: all); returns its file name."""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{name}.speedscope.json"
+    with open(os.path.join(directory, filename), 'w', encoding='utf-8') as handle:
+        json.dump(document, handle, ensure_ascii=False)
+
+    keep = current_app.config.get('PROFILER_KEEP', 50)
+    if keep > 0:
+        for old in sorted(profile_files(directory))[:-keep]:
+            os.remove(os.path.join(directory, old))
+    return filename
+
+
+def profile_files(directory=None):
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    return [name for name in os.listdir(directory) if name.endswith('.speedscope.json')]
+
+
+def list_profiles(limit=50):
+    """Metadata of the newest saved profiles, newest first."""
+    directory = profile_dir()
+    profiles = []
+    for name in sorted(profile_files(directory), reverse=True)[:limit]:
+        path = os.path.join(directory, name)
+        try:
+            with open(path, encoding='utf-8') as handle:
+                metadata = json.load(handle).get('metadata', {})
+        except (OSError, ValueError):
+            continue
+        profiles.append(dict(metadata, id=name, size=os.path.getsize(path)))
+    return profiles
+
+
+def profiles_authorized():
+    """Whether this request may read saved profiles: only with ``X-Profile`` equal to ``PROFILER_TOKEN``.
+
+    Profiles hold SQL text and stack frames, so without a token configured
+    (even with ``PROFILER_ENABLED``) nobody may read them over HTTP.
+    """
+    token = current_app.config.get('PROFILER_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Profile', ''), token)
+
+
+def install_profiler(app):
+    """Register the request hooks when profiling is configured; otherwise do nothing."""
+    if not (app.config.get('PROFILER_ENABLED', False) or app.config.get('PROFILER_TOKEN')):
+        return False
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_teardown_profile)
+    return True
@@ -0,0 +1,58 @@
+"""Query execution shared by the warehouse routes.
+
+Every route runs its SQL through ``fetch_all``/``fetch_one`` so that identical
+statements issued concurrently (a burst of dashboard loads, say) reach the
+database once and all callers share the fetched rows.
+
+A request may point its reads at another engine by setting ``g.query_engine``
+(the sales routes do this for the local analytics mirror); without it the
+statements run on the app's session, behind the database circuit breaker
+(as do the reporting routes' isolation-level variants of the primary engine).
+"""
+from flask import current_app, g, has_app_context
+
+from services.breaker import guarded
+from services.singleflight import SingleFlight
+
+
+# In-flight executions keyed by statement text and bound parameters
+inflight_queries = SingleFlight()
+
+
+def _statement_key(statement, params, engine=None):
+    # Engines differ by URL, or by isolation level for the reporting variants of the primary
+    target = f"{engine.url}|{engine.get_execution_options().get('isolation_level', '')}" if engine is not None else ''
+    return (target, str(statement), tuple(sorted((name, repr(value)) for name, value in (params or {}).items())))
+
+
+def query_engine():
+    """The engine the current request (or background job's app context) reads from, or None for the app's session."""
+    return g.get('query_engine') if has_app_context() else None
+
+
+def fetch_all(statement, params=None):
+    """Execute ``statement`` and return all rows, sharing identical in-flight executions."""
+    engine = query_engine()
+    db = current_app.extensions['sqlalchemy']
+
+    if engine is None:
+        def execute():
+            return guarded(lambda: db.session.execute(statement, params or {}).fetchall())
+    else:
+        def read():
+            with engine.connect() as connection:
+                return connection.execute(statement, params or {}).fetchall()
+
+        # Isolation-level variants of the primary engine still go through the breaker
+        def execute():
+            return guarded(read) if engine.url == db.engine.url else read()
+
+    if not current_app.config.get('QUERY_COALESCING', True):
+        return execute()
+    return inflight_queries.do(_statement_key(statement, params, engine), execute)
+
+
+def fetch_one(statement, params=None):
+    """Execute ``statement`` and return its first row, or None."""
+    rows = fetch_all(statement, params)
+    return rows[0] if rows else None
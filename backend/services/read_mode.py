@@ -0,0 +1,128 @@
+"""Isolation level of the reporting queries (snapshot or dirty reads).
+
+The sales and inventory aggregates scan ``Main``/``Chines`` at the default
+READ COMMITTED while the factory updates piece statuses all day, so a long
+``GROUP BY`` blocks status updates or waits behind them. Reporting routes
+(``REPORTING_ROUTES``) read in ``REPORT_READ_MODE`` instead:
+
+* ``snapshot`` - row versions as of the start of the transaction; never
+  blocks writers and is never blocked. Needs ``ALLOW_SNAPSHOT_ISOLATION ON``
+  on the database, checked once per engine through the database breaker;
+  without it, or while the check fails, the routes use ``REPORT_READ_FALLBACK``;
+* ``read_uncommitted`` - dirty reads, for dashboards where approximate
+  totals are acceptable;
+* ``read_committed`` - the server default.
+
+``?read_mode=`` picks another mode for one request. The mode is applied by
+pointing ``g.query_engine`` at ``db.engine.execution_options(isolation_level=...)``,
+so each statement checks out a pooled connection at that level and the pool
+resets it on return. Responses say which mode was used in ``X-Read-Mode``.
+Reports served by the analytics mirror keep reading the mirror.
+"""
+import threading
+import time
+
+from flask import current_app, g, request
+from sqlalchemy import text
+
+from services.breaker import database_breaker, guarded
+
+
+READ_MODES = {
+    'snapshot': 'SNAPSHOT',
+    'read_uncommitted': 'READ UNCOMMITTED',
+    'read_committed': None,
+}
+
+# Routes whose aggregates read in the reporting mode
+REPORTING_ROUTES = (
+    '/api/warehouse/scrap',
+    '/api/warehouse/classic',
+    '/api/warehouse/chinese',
+    '/api/warehouse/summary',
+    '/api/warehouse/sales/',
+    '/api/warehouse/cube',
+)
+
+_SNAPSHOT_STATE_SQL = "SELECT snapshot_isolation_state FROM sys.databases WHERE name = DB_NAME()"
+
+# Seconds before a failed check is retried; meanwhile the routes use the fallback
+_UNKNOWN_RECHECK = 30
+
+_snapshot_allowed = {}
+_read_engines = {}
+_lock = threading.Lock()
+
+
+def snapshot_allowed(engine):
+    """Whether the database behind ``engine`` accepts SNAPSHOT transactions.
+
+    The answer is kept for the life of the process. A failed check counts as
+    "not allowed" for ``_UNKNOWN_RECHECK`` seconds; it runs through the
+    database breaker and is skipped altogether while the circuit is open.
+    """
+    key = str(engine.url)
+    now = time.monotonic()
+    with _lock:
+        allowed, expires = _snapshot_allowed.get(key, (None, None))
+        if allowed is not None and (expires is None or now < expires):
+            return allowed
+    if engine.dialect.name != 'mssql':
+        allowed, expires = False, None
+    else:
+        breaker = database_breaker()
+        if breaker is not None and breaker.rejecting():
+            return False
+
+        def check():
+            with engine.connect() as connection:
+                return connection.execute(text(_SNAPSHOT_STATE_SQL)).scalar() == 1
+
+        try:
+            allowed, expires = guarded(check), None
+        except Exception as e:
+            print(f"Checking snapshot isolation failed: {str(e)}")
+            allowed, expires = False, now + _UNKNOWN_RECHECK
+    with _lock:
+        _snapshot_allowed[key] = (allowed, expires)
+    return allowed
+
+
+def read_engine(engine, isolation_level):
+    """``engine`` with every connection at ``isolation_level``."""
+    key = (str(engine.url), isolation_level)
+    with _lock:
+        if key not in _read_engines:
+            _read_engines[key] = engine.execution_options(isolation_level=isolation_level)
+        return _read_engines[key]
+
+
+def resolve_read_mode(engine, requested=None):
+    """The mode a reporting request reads in: ``requested`` (or the configured one) if the database allows it."""
+    config = current_app.config
+    mode = requested if requested in READ_MODES else config.get('REPORT_READ_MODE', 'snapshot')
+    if mode == 'snapshot' and not snapshot_allowed(engine):
+        mode = config.get('REPORT_READ_FALLBACK', 'read_committed')
+    return mode if mode in READ_MODES else 'read_committed'
+
+
+def apply_read_mode():
+    """``before_request`` hook: read reporting routes in the configured isolation level."""
+    if request.url_rule is None or not request.url_rule.rule.startswith(REPORTING_ROUTES):
+        return
+    # The analytics mirror already answers without touching SQL Server
+    if g.get('query_engine') is not None:
+        return
+    engine = current_app.extensions['sqlalchemy'].engine
+    mode = resolve_read_mode(engine, request.args.get('read_mode'))
+    if READ_MODES[mode] is not None:
+        g.query_engine = read_engine(engine, READ_MODES[mode])
+    g.read_mode = mode
+
+
+def tag_read_mode(response):
+    """``after_request`` hook: report the isolation level the request read in."""
+    mode = g.get('read_mode')
+    if mode is not None:
+        response.headers['X-Read-Mode'] = mode
+    return response
@@ -0,0 +1,278 @@
+"""Compact record types for the warehouse listings.
+
+Listing routes used to build one dict per row, repeating every key string for
+every piece. The records below keep their values in ``__slots__`` instead, so
+a cached listing holds no per-row dicts. ``records_response`` builds the dicts
+only for the length of one ``json.dumps`` call over the whole body: the C
+encoder is faster than assembling the JSON field by field in Python, and it
+skips the per-row key sorting ``jsonify`` does.
+
+Records that declare ``columns`` (the SQL expression and cleaning of each
+slot) can be projected for ``?fields=``: ``project`` returns a record class
+with only the requested slots, whose ``select_list`` is the matching SQL
+projection, so the query, the Python rows and the JSON shrink together.
+"""
+import json
+from operator import attrgetter
+
+from flask import current_app
+
+
+class Record:
+    """Base class for slot-based result rows.
+
+    Subclasses declare ``__slots__`` and ``json_keys`` (the JSON key of each
+    slot, in the same order) and either ``columns`` (``(sql, clean)`` per slot,
+    used by the generic ``from_row``) or a ``from_row`` constructor of their
+    own that applies the same cleaning the routes did on the raw SQL row.
+    """
+    __slots__ = ()
+    json_keys = ()
+    columns = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*[clean(value) for (_, clean), value in zip(cls.columns, row)])
+
+    @classmethod
+    def from_record(cls, record):
+        """Copy of ``record`` (of the class this one was projected from) with only this class's slots."""
+        return cls(*[getattr(record, name) for name in cls.__slots__])
+
+    @classmethod
+    def select_list(cls):
+        """The SQL projection that produces this record's slots, in order."""
+        return ', '.join(sql for sql, _ in cls.columns)
+
+    @classmethod
+    def uses_table(cls, table):
+        """Whether any selected column comes from ``table`` (so the query needs its join)."""
+        return any(sql.startswith(f'{table}.') for sql, _ in cls.columns)
+
+    @classmethod
+    def project(cls, fields=None):
+        """Record class with only the JSON keys in ``fields`` (comma-separated), or ``cls`` for all.
+
+        Raises ``ValueError`` for keys the record does not have.
+        """
+        keys = [key.strip() for key in (fields or '').split(',') if key.strip()]
+        if not keys:
+            return cls
+        unknown = [key for key in keys if key not in cls.json_keys]
+        if unknown:
+            raise ValueError(f"Unknown field '{unknown[0]}', expected any of: {', '.join(cls.json_keys)}")
+        selected = tuple(index for index, key in enumerate(cls.json_keys) if key in keys)
+        if len(selected) == len(cls.json_keys):
+            return cls
+
+        cache_key = (cls, selected)
+        projected = _projections.get(cache_key)
+        if projected is None:
+            projected = type(f"{cls.__name__}[{','.join(cls.json_keys[index] for index in selected)}]", (Record,), {
+                '__slots__': tuple(cls.__slots__[index] for index in selected),
+                'json_keys': tuple(cls.json_keys[index] for index in selected),
+                'columns': tuple(cls.columns[index] for index in selected),
+                '__doc__': cls.__doc__,
+            })
+            _projections[cache_key] = projected
+        return projected
+
+    def values(self):
+        return _values_getter(type(self))(self)
+
+    def to_dict(self):
+        return dict(zip(self.json_keys, self.values()))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __hash__(self):
+        return hash((type(self), self.values()))
+
+    def __repr__(self):
+        return f"{type(self).__name__}{self.values()!r}"
+
+
+# Projected record classes per (record class, selected slot indexes)
+_projections = {}
+_getters = {}
+
+
+def _date(value, fmt='%Y-%m-%d'):
+    return value.strftime(fmt) if value else ''
+
+
+def _text(value):
+    return value if value else ''
+
+
+def _float(value):
+    return float(value) if value else 0.0
+
+
+def _count(value):
+    return value if value is not None else 0
+
+
+def _str(value):
+    return str(value) if value else ''
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _customer_name(value):
+    return value if value else 'غير معروف'
+
+
+def _long2_text(value):
+    return str(value) if value else '0'
+
+
+class MainPiece(Record):
+    """A shipped piece from ``Main`` as returned by ``/sales/main/detailed``."""
+    __slots__ = ('number', 'desan', 'color', 'length', 'date', 'customer_number', 'customer_name')
+    json_keys = __slots__
+    columns = (
+        ('Main.Number', _text), ('Main.Desan', _text), ('Main.Color', _text), ('Main.Long2', _float),
+        ('Main.Date3', _date), ('Main.customerNumber', _text), ('Customers.Name', _text),
+    )
+
+
+class MainOrderLine(Record):
+    """A ``Main`` piece as listed by ``/orders/all``."""
+    __slots__ = ('customer', 'desan', 'length', 'order_date', 'start_date', 'end_date',
+                 'in_manufacturing', 'in_dyeing', 'in_raw_warehouse', 'status')
+    json_keys = __slots__
+    columns = (
+        ('Customer', _text), ('Desan', _text), ('Long', _float), ('Date1', _date), ('Date2', _date),
+        ('Date3', _date), ('في_تصنيع', _count), ('في_مصبغة', _count), ('في_مستودع_الخام', _count),
+        ('Status', _text),
+    )
+
+
+class MainOrderDetail(Record):
+    """A ``Main`` piece joined to its customer for ``/orders/details``."""
+    __slots__ = ('customer_name', 'number', 'desan', 'color', 'long2', 'status',
+                 'customer_number', 'customer', 'date', 'date4', 'end_date')
+    json_keys = ('customerName', 'Number', 'Desan', 'Color', 'Long2', 'Status',
+                 'customerNumber', 'Customer', 'Date', 'Date4', 'endDate')
+    columns = (
+        ('Customers.Name', _customer_name), ('Main.Number', _text), ('Main.Desan', _text),
+        ('Main.Color', _text), ('Main.Long2', _long2_text), ('Main.Status', _text),
+        ('Main.customerNumber', _str), ('Main.Customer', _str), ('Main.Date', _isoformat),
+        ('Main.Date4', _isoformat), ('Main.endDate', _isoformat),
+    )
+
+
+class MainStockPiece(Record):
+    """A single ``Main`` piece in the classic or scrap warehouse."""
+    __slots__ = ('number', 'long2', 'date3', 'notes')
+    json_keys = __slots__
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row[0] if row[0] else '',
+            float(row[1]) if row[1] else 0.0,
+            _date(row[2]),
+            row[3] if row[3] else ''
+        )
+
+
+class ChinesPiece(Record):
+    """A shipped piece from ``Chines`` as returned by ``/sales/chinese/detailed``."""
+    __slots__ = ('number', 'type', 'color', 'length', 'customer', 'date')
+    json_keys = __slots__
+    columns = (
+        ('Number', _text), ('Type', _text), ('Color', _text), ('Long', _float), ('Customer', _text),
+        ('Date', _date),
+    )
+
+
+class ChinesStockPiece(Record):
+    """A single ``Chines`` piece in the Chinese warehouse."""
+    __slots__ = ('number', 'color', 'type', 'long')
+    json_keys = __slots__
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row[0] if row[0] else '',
+            row[1] if row[1] else '',
+            row[2] if row[2] else '',
+            float(row[3]) if row[3] else 0.0
+        )
+
+
+class OrderAggregate(Record):
+    """One customer order with its piece counts per status."""
+    __slots__ = ('customer', 'customer_number', 'customer_name', 'invoice',
+                 'in_warehouse', 'in_manufacturing', 'in_dyeing', 'in_raw_warehouse',
+                 'shipped', 'totals', 'max_end_date')
+    json_keys = ('customer', 'customer_number', 'customer_name', 'invoice',
+                 'في_مستودع', 'في_تصنيع', 'في_مصبغة', 'في_مستودع_الخام',
+                 'مشحون', 'totals', 'max_end_date')
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row[0] or '',
+            row[1] or '',
+            row[2] or '',
+            row[3] or '',
+            row[4] or 0,
+            row[5] or 0,
+            row[6] or 0,
+            row[7] or 0,
+            row[8] or 0,
+            row[9] or 0,
+            row[10].isoformat() if row[10] else None
+        )
+
+
+def _values_getter(cls):
+    """A C-level ``record -> tuple of slot values`` for ``cls`` (cached)."""
+    getter = _getters.get(cls)
+    if getter is None:
+        slots = cls.__slots__
+        if len(slots) > 1:
+            getter = attrgetter(*slots)
+        else:
+            # attrgetter of one name returns the bare value, of none raises
+            getter = lambda record, slots=slots: tuple(getattr(record, name) for name in slots)
+        _getters[cls] = getter
+    return getter
+
+
+def _as_dicts(records):
+    rows = []
+    append = rows.append
+    cls = None
+    for record in records:
+        if type(record) is not cls:
+            cls = type(record)
+            keys, values = cls.json_keys, _values_getter(cls)
+        append(dict(zip(keys, values(record))))
+    return rows
+
+
+def encode_records(records, ensure_ascii=True, default=None):
+    """Encode a sequence of records as a JSON array, in one call to the C encoder."""
+    return json.dumps(_as_dicts(records), ensure_ascii=ensure_ascii, separators=(',', ':'), default=default)
+
+
+def records_response(records, status=200, **envelope):
+    """Build a JSON response with ``records`` under ``data`` plus envelope keys."""
+    # Follow the app's JSON provider so values encode exactly as jsonify would, but keep the
+    # record's key order instead of sorting every row's keys
+    ensure_ascii = getattr(current_app.json, 'ensure_ascii', True)
+    default = getattr(current_app.json, 'default', None)
+    body = json.dumps(dict(data=_as_dicts(records), **envelope), ensure_ascii=ensure_ascii,
+                      separators=(',', ':'), default=default)
+    return current_app.response_class(body, status=status, mimetype='application/json')
@@ -0,0 +1,50 @@
+"""Background thread that reruns a maintenance job on an interval.
+
+Used for jobs that rebuild derived data from the database (the inventory
+snapshot, the analytics mirror). The job runs once at start, then every
+``interval`` seconds, and early when a change-feed event passes ``wake_on``.
+"""
+import threading
+
+from services.changes import change_feed
+
+
+class Refresher:
+    """Run ``job`` in an app context periodically and after matching change events."""
+
+    def __init__(self, name, job, label, wake_on=None):
+        self.name = name
+        self.job = job
+        self.label = label
+        self.wake_on = wake_on
+        self._wake = threading.Event()
+        self._thread = None
+        self._unsubscribe = None
+        self.refreshes = 0
+        self.last_error = None
+
+    def _on_change(self, event):
+        if self.wake_on(event):
+            self._wake.set()
+
+    def start(self, app, interval=300):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.wake_on is not None:
+            self._unsubscribe = change_feed.subscribe(self._on_change)
+
+        def run():
+            while True:
+                try:
+                    with app.app_context():
+                        self.job()
+                    self.refreshes += 1
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"{self.label} failed: {str(e)}")
+                self._wake.wait(interval)
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+        self._thread.start()
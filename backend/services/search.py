@@ -0,0 +1,278 @@
+"""In-memory autocomplete over product, color, customer and order names.
+
+The tables used to download full lists and filter them in the browser, and
+the backend had nothing better than ``LIKE '%x%'`` scans. This index holds
+the distinct ``Main.Desan``, ``Main.Color``, ``Chines.Type``, ``Chines.Color``,
+``Customers.Name`` and order numbers (``Main.Customer``), and answers
+``/search`` from memory:
+
+* every value is normalized (Arabic alef variants, taa marbuta, alef maqsura,
+  hamza seats, diacritics and tatweel folded; Arabic-Indic digits; case and
+  separators) so "احمر" finds "أحمر";
+* a sorted list of the value and each of its words answers prefix queries
+  with a binary search;
+* a trigram posting list answers infix queries of three or more characters.
+
+Matches rank exact, then whole-value prefix, then word prefix, then infix,
+shorter values first. New values arrive incrementally: the change feed marks
+a source dirty and the refresher reads only the rows above the last ``Number``
+it indexed, plus the ``Customers`` rows of customer numbers it has not seen. The full rebuild every ``SEARCH_INDEX_REBUILD_INTERVAL`` seconds
+drops values that disappeared.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import bindparam, text
+
+from services.query import fetch_all, fetch_one
+from services.refresher import Refresher
+
+
+KINDS = ('desan', 'type', 'color', 'customer', 'order')
+
+STOCK_CUSTOMER = '6000'
+
+_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_SEPARATORS = re.compile(r'[\s\-_/.,]+')
+_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+})
+
+# Prefix matches gathered per query before ranking; bounds one-letter queries
+_MAX_CANDIDATES = 2000
+
+
+def normalize(value):
+    """Fold ``value`` to the form both the index and the queries are compared in."""
+    folded = unicodedata.normalize('NFKC', str(value))
+    folded = _DIACRITICS.sub('', folded).translate(_LETTERS).casefold()
+    return ' '.join(part for part in _SEPARATORS.split(folded) if part)
+
+
+def _trigrams(normalized):
+    return {normalized[index:index + 3] for index in range(len(normalized) - 2)}
+
+
+class SearchIndex:
+    """Prefix and trigram lookups over normalized (kind, value) entries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._ids = {}
+        self._prefixes = []
+        self._trigrams = defaultdict(set)
+        self.high_water = {}
+        # Customers.Number values already loaded (with or without a name)
+        self.customer_numbers = set()
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, kind, value, sorted_insert=True, **attributes):
+        """Index ``value`` under ``kind``; repeated values merge their ``sources``.
+
+        Extra ``attributes`` (a customer's ``number``) are returned with the match.
+        """
+        if value is None or str(value).strip() == '':
+            return
+        value = str(value).strip()
+        normalized = normalize(value)
+        # Customers sharing a name stay separate entries
+        key = (kind, value, attributes.get('number'))
+        with self._lock:
+            entry_id = self._ids.get(key)
+            if entry_id is not None:
+                self._entries[entry_id]['sources'] |= attributes.get('sources', set())
+                return
+            entry_id = self._ids[key] = len(self._entries)
+            entry = {'kind': kind, 'value': value, 'normalized': normalized, 'sources': set(attributes.pop('sources', ()))}
+            entry.update(attributes)
+            self._entries.append(entry)
+            tokens = {normalized, *normalized.split(' ')}
+            if 'number' in attributes:
+                # Customers can also be looked up by number
+                tokens.add(normalize(attributes['number']))
+            for token in tokens:
+                if sorted_insert:
+                    bisect.insort(self._prefixes, (token, entry_id))
+                else:
+                    self._prefixes.append((token, entry_id))
+            for trigram in _trigrams(normalized):
+                self._trigrams[trigram].add(entry_id)
+
+    def seal(self):
+        """Sort the prefix list after a bulk load with ``sorted_insert=False``."""
+        with self._lock:
+            self._prefixes.sort()
+            self.built_at = time.time()
+
+    def search(self, query, kinds=None, limit=10):
+        """Best ``limit`` entries matching ``query``, as dicts with ``kind`` and ``value``."""
+        needle = normalize(query)
+        if not needle:
+            return []
+        with self._lock:
+            ranks = {}
+            position = bisect.bisect_left(self._prefixes, (needle, -1))
+            while position < len(self._prefixes) and len(ranks) < _MAX_CANDIDATES:
+                token, entry_id = self._prefixes[position]
+                if not token.startswith(needle):
+                    break
+                position += 1
+                entry = self._entries[entry_id]
+                if kinds and entry['kind'] not in kinds:
+                    continue
+                rank = 0 if entry['normalized'] == needle else 1 if entry['normalized'].startswith(needle) else 2
+                ranks[entry_id] = min(rank, ranks.get(entry_id, rank))
+
+            # Infix matches rank last, so they only matter while prefix matches are short of the limit
+            if len(needle) >= 3 and len(ranks) < limit:
+                postings = sorted((self._trigrams.get(trigram, set()) for trigram in _trigrams(needle)), key=len)
+                candidates = set.intersection(*postings) if postings and postings[0] else set()
+                for entry_id in candidates:
+                    entry = self._entries[entry_id]
+                    if entry_id not in ranks and needle in entry['normalized'] and (not kinds or entry['kind'] in kinds):
+                        ranks[entry_id] = 3
+
+            entries = [(rank, self._entries[entry_id]) for entry_id, rank in ranks.items()]
+
+        best = heapq.nsmallest(limit, entries, key=lambda item: (item[0], len(item[1]['normalized']), item[1]['normalized']))
+        results = []
+        for rank, entry in best:
+            result = {key: value for key, value in entry.items() if key != 'normalized'}
+            result['sources'] = sorted(entry['sources'])
+            result['match'] = ('exact', 'prefix', 'word', 'infix')[rank]
+            results.append(result)
+        return results
+
+
+_MAIN_SQL = "SELECT Number, Desan, Color, Customer, customerNumber FROM Main WHERE Number > :high_water"
+_CHINESE_SQL = "SELECT Number, Type, Color FROM Chines WHERE Number > :high_water"
+_FULL_SQL = {
+    'main': (
+        ('desan', "SELECT DISTINCT Desan FROM Main"),
+        ('color', "SELECT DISTINCT Color FROM Main"),
+        ('order', "SELECT DISTINCT Customer FROM Main WHERE Customer <> '6000'"),
+    ),
+    'chinese': (
+        ('type', "SELECT DISTINCT Type FROM Chines"),
+        ('color', "SELECT DISTINCT Color FROM Chines"),
+    ),
+}
+_HIGH_WATER_SQL = {'main': "SELECT MAX(Number) FROM Main", 'chinese': "SELECT MAX(Number) FROM Chines"}
+_CUSTOMERS_SQL = "SELECT Number, Name FROM Customers"
+_NEW_CUSTOMERS_SQL = text(f"{_CUSTOMERS_SQL} WHERE Number IN :numbers").bindparams(bindparam('numbers', expanding=True))
+
+
+def _add_customers(index, sorted_insert, numbers=None):
+    """Index the ``Customers`` rows, or only those whose number is in ``numbers``."""
+    if numbers is None:
+        rows = fetch_all(text(_CUSTOMERS_SQL))
+    else:
+        rows = fetch_all(_NEW_CUSTOMERS_SQL, {'numbers': sorted(numbers)}) if numbers else []
+        index.customer_numbers |= numbers
+    for number, name in rows:
+        index.customer_numbers.add(str(number))
+        if str(number) != STOCK_CUSTOMER:
+            index.add('customer', name, sorted_insert, number=str(number), sources={'customers'})
+
+
+def build_search_index():
+    """Load every distinct value into a new ``SearchIndex``."""
+    index = SearchIndex()
+    for source, statements in _FULL_SQL.items():
+        # Read the high-water mark first so rows inserted meanwhile are picked up incrementally
+        row = fetch_one(text(_HIGH_WATER_SQL[source]))
+        index.high_water[source] = (row[0] if row else None) or 0
+        for kind, statement in statements:
+            for value, in fetch_all(text(statement)):
+                index.add(kind, value, False, sources={source})
+    _add_customers(index, False)
+    index.seal()
+    return index
+
+
+def update_search_index(index, sources):
+    """Add the values of rows above each dirty source's high-water mark."""
+    added = 0
+    for source in sources:
+        high_water = index.high_water.get(source, 0)
+        if source == 'main':
+            rows = fetch_all(text(_MAIN_SQL), {'high_water': high_water})
+            customer_numbers = set()
+            for number, desan, color, order, customer_number in rows:
+                index.add('desan', desan, sources={'main'})
+                index.add('color', color, sources={'main'})
+                if order is not None and str(order) != STOCK_CUSTOMER:
+                    index.add('order', order, sources={'main'})
+                if customer_number is not None:
+                    customer_numbers.add(str(customer_number))
+            # New orders may belong to customers added since the last load; read only those
+            _add_customers(index, True, customer_numbers - index.customer_numbers)
+        else:
+            rows = fetch_all(text(_CHINESE_SQL), {'high_water': high_water})
+            for number, kind, color in rows:
+                index.add('type', kind, sources={'chinese'})
+                index.add('color', color, sources={'chinese'})
+        if rows:
+            index.high_water[source] = max(high_water, max(row[0] for row in rows))
+        added += len(rows)
+    return added
+
+
+_index = None
+_index_lock = threading.Lock()
+_dirty = set()
+
+
+def get_search_index():
+    """The current index, built on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = build_search_index()
+        return _index
+
+
+def refresh_search_index():
+    """Rebuild when the index is older than ``SEARCH_INDEX_REBUILD_INTERVAL``, else apply new rows."""
+    global _index
+    rebuild_after = current_app.config.get('SEARCH_INDEX_REBUILD_INTERVAL', 3600)
+    with _index_lock:
+        index = _index
+        sources = set(_dirty) if index is not None else set()
+        _dirty.clear()
+    if index is None or time.time() - index.built_at > rebuild_after:
+        index = build_search_index()
+        with _index_lock:
+            _index = index
+        return len(index)
+    return update_search_index(index, sources or ('main', 'chinese'))
+
+
+def _mark_dirty(event):
+    with _index_lock:
+        _dirty.add(event.source)
+    return True
+
+
+search_refresher = Refresher('search-index', refresh_search_index, 'Search index refresh', wake_on=_mark_dirty)
+
+
+def start_search_index(app):
+    """Build the index in the background and keep it current when an interval is set."""
+    interval = app.config.get('SEARCH_INDEX_INTERVAL', 0)
+    if interval > 0:
+        search_refresher.start(app, interval)
+    return search_refresher
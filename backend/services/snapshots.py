@@ -0,0 +1,74 @@
+"""Bounded snapshot history for ``since``-token delta responses.
+
+List routes record the rows they are about to return, keyed by a stable row
+key, and get back a version token. A client that sends that token as
+``since`` on its next call receives only the rows added or changed since then
+plus the keys that disappeared, instead of the whole list. Only the last
+``max_versions`` distinct snapshots per view are kept; an older or unknown
+token (or one issued before a restart) falls back to the full list.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+from services.records import records_response
+
+
+class SnapshotHistory:
+    """Last few distinct snapshots of each view, addressable by token."""
+
+    def __init__(self, max_versions=16):
+        self.max_versions = max_versions
+        # Tokens from another process lifetime never match
+        self._epoch = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def _token(self, version):
+        return f'{self._epoch}.{version}'
+
+    def record(self, view, rows):
+        """Store ``rows`` (key -> record) for ``view`` and return its token."""
+        with self._lock:
+            history = self._views.setdefault(view, OrderedDict())
+            if history:
+                latest_token = next(reversed(history))
+                if history[latest_token] == rows:
+                    return latest_token
+            self._version += 1
+            token = self._token(self._version)
+            history[token] = rows
+            while len(history) > self.max_versions:
+                history.popitem(last=False)
+            return token
+
+    def diff(self, view, since, rows):
+        """``(upserted, removed)`` between the ``since`` snapshot and ``rows``, or None if unknown."""
+        with self._lock:
+            previous = self._views.get(view, {}).get(since)
+        if previous is None:
+            return None
+        upserted = [row for key, row in rows.items() if previous.get(key) != row]
+        removed = [key for key in previous if key not in rows]
+        return upserted, removed
+
+
+snapshot_history = SnapshotHistory()
+
+
+def delta_response(view, records, key, since=None, **envelope):
+    """Full or ``since``-delta records response for a list view.
+
+    Full responses carry every record in ``data``; deltas carry the added or
+    changed records in ``data`` and the keys of dropped ones in ``removed``
+    (tuple keys are sent as lists).
+    Both include the ``token`` to send as ``since`` next time.
+    """
+    rows = {key(record): record for record in records}
+    token = snapshot_history.record(view, rows)
+    changes = snapshot_history.diff(view, since, rows) if since else None
+    if changes is None:
+        return records_response(records, token=token, delta=False, **envelope)
+    upserted, removed = changes
+    return records_response(upserted, token=token, delta=True, since=since, removed=removed, **envelope)
@@ -0,0 +1,107 @@
+"""Run the blueprint's T-SQL against SQLite (analytics mirror, benchmarks).
+
+The routes are written for SQL Server. This shim makes an SQLite engine accept
+them: statements are rewritten just before execution (``TOP n`` → ``LIMIT n``,
+``CONVERT(date, x)`` → ``date(x)``, quoted ``DATEADD`` parts) and the missing
+functions (``GETDATE``, ``DATEADD``, ``FORMAT``, ``CONCAT``) are registered on
+every connection. Timestamps are returned as ``datetime`` like pymssql does.
+"""
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+
+_TOP = re.compile(r'\bSELECT\s+TOP\s+(\d+)\s', re.IGNORECASE)
+_CONVERT_DATE = re.compile(r'\bCONVERT\(\s*date\s*,', re.IGNORECASE)
+_DATEADD_PART = re.compile(r'\bDATEADD\(\s*(\w+)\s*,', re.IGNORECASE)
+_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}')
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def rewrite_statement(statement):
+    """Rewrite the T-SQL constructs used by the routes into SQLite syntax."""
+    match = _TOP.search(statement)
+    if match:
+        statement = _TOP.sub('SELECT ', statement, count=1).rstrip().rstrip(';') + f' LIMIT {match.group(1)}'
+    statement = _CONVERT_DATE.sub('date(', statement)
+    statement = _DATEADD_PART.sub(lambda m: f"DATEADD('{m.group(1).lower()}',", statement)
+    return statement
+
+
+def _parse(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value)) if value else None
+
+
+def _getdate():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def _dateadd(part, amount, value):
+    moment = _parse(value)
+    if moment is None:
+        return None
+    amount = int(amount)
+    if part in ('day', 'dd', 'd'):
+        moment += timedelta(days=amount)
+    elif part in ('week', 'wk', 'ww'):
+        moment += timedelta(weeks=amount)
+    elif part in ('month', 'mm', 'm'):
+        month_index = moment.month - 1 + amount
+        year, month = moment.year + month_index // 12, month_index % 12 + 1
+        for day in (moment.day, 30, 29, 28):
+            try:
+                moment = moment.replace(year=year, month=month, day=day)
+                break
+            except ValueError:
+                continue
+    elif part in ('year', 'yy', 'yyyy'):
+        moment = moment.replace(year=moment.year + amount)
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def _format(value, pattern):
+    if value is None:
+        return None
+    if pattern.upper().startswith('N'):
+        decimals = int(pattern[1:] or 2)
+        return f'{float(value):,.{decimals}f}'
+    moment = _parse(value)
+    for token, directive in (('yyyy', '%Y'), ('MM', '%m'), ('dd', '%d')):
+        pattern = pattern.replace(token, directive)
+    return moment.strftime(pattern)
+
+
+def _concat(*values):
+    return ''.join('' if value is None else str(value) for value in values)
+
+
+def _row_factory(cursor, row):
+    # pymssql returns datetimes; SQLite hands back the stored ISO text
+    return tuple(
+        datetime.fromisoformat(value) if isinstance(value, str) and _TIMESTAMP.match(value) else value
+        for value in row
+    )
+
+
+def _on_connect(dbapi_connection, connection_record):
+    dbapi_connection.create_function('GETDATE', 0, _getdate)
+    dbapi_connection.create_function('DATEADD', 3, _dateadd)
+    dbapi_connection.create_function('FORMAT', 2, _format)
+    if sqlite3.sqlite_version_info < (3, 44, 0):
+        dbapi_connection.create_function('CONCAT', -1, _concat)
+    dbapi_connection.row_factory = _row_factory
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    return rewrite_statement(statement), parameters
+
+
+def install(engine):
+    """Make ``engine`` (an SQLite engine) accept the routes' T-SQL."""
+    event.listen(engine, 'connect', _on_connect)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute, retval=True)
@@ -0,0 +1,176 @@
+"""Per-route statement timeouts, enforced by the database driver.
+
+No warehouse query had a time limit, so a bad plan on the ``NOT IN`` order
+queries or an unbounded ``/orders/all`` could run for minutes and keep a
+pooled connection. Every statement executed while serving a request now gets
+the timeout of its route: the first ``STATEMENT_TIMEOUTS`` rule substring that
+matches, else ``STATEMENT_TIMEOUT`` seconds (0: no limit). Report jobs run
+their route in a request context of their own but get ``JOB_STATEMENT_TIMEOUT``
+instead, since nobody waits on them interactively; refreshers and prefetching
+run without a limit.
+
+The limit is applied per statement and per connection: just before a
+statement is sent, a timer is started that cancels that statement's own
+connection once the route's timeout has passed. The driver's connection-level
+settings are left alone (pymssql's ``query_timeout`` is global to DB-Lib, so a
+10 s route would cut short a 600 s export running next to it). The timer runs
+until the connection executes its next statement or returns to the pool, so
+slowly fetched results count as well:
+
+* SQL Server (pymssql): ``cancel()`` on the DB-Lib connection sends the
+  server an attention for the running batch; the connection is then
+  invalidated, so the pool replaces it instead of handing out a connection in
+  an unknown state;
+* SQLite (analytics mirror, benchmarks): ``interrupt()`` aborts the statement.
+
+The timeout surfaces as ``StatementTimeout``. Routes still report it through
+their usual ``except`` block; the ``after_request`` hook turns those 500s into
+a structured ``504`` with ``timeout: true``. Timeouts are counted per route
+(``timeout_stats``, reported by ``/api/health``).
+"""
+import threading
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+
+_stats_lock = threading.Lock()
+_timeouts = {}
+
+
+class StatementTimeout(Exception):
+    """A statement ran past its route's timeout and was cancelled."""
+
+    def __init__(self, seconds, route):
+        super().__init__(f"Query cancelled after the {seconds} s statement timeout of {route}")
+        self.seconds = seconds
+        self.route = route
+
+
+def route_timeout(rule, config):
+    """Statement timeout in seconds for a URL rule (0: no limit)."""
+    for pattern, seconds in (config.get('STATEMENT_TIMEOUTS') or {}).items():
+        if pattern in rule:
+            return seconds
+    return config.get('STATEMENT_TIMEOUT', 0)
+
+
+def _current_timeout():
+    if not has_request_context() or request.url_rule is None:
+        return 0, None
+    rule = request.url_rule.rule
+    if g.get('background_job'):
+        return current_app.config.get('JOB_STATEMENT_TIMEOUT', 0), rule
+    return route_timeout(rule, current_app.config), rule
+
+
+class _Deadline:
+    """Cancels the statements of one connection once ``seconds`` have passed."""
+
+    def __init__(self, cancel, seconds, rule):
+        self.seconds = seconds
+        self.rule = rule
+        self._cancel = cancel
+        self._lock = threading.Lock()
+        self._fired = False
+        self._finished = False
+        self._timer = threading.Timer(seconds, self._expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self):
+        with self._lock:
+            if self._finished:
+                return
+            self._fired = True
+        try:
+            self._cancel()
+        except Exception:
+            pass
+
+    def finish(self):
+        """Stop the timer; returns whether the statement was cancelled."""
+        with self._lock:
+            self._finished = True
+        self._timer.cancel()
+        return self._fired
+
+
+def _canceller(conn):
+    """The driver call that aborts whatever ``conn`` is executing, or None."""
+    dbapi_connection = conn.connection.dbapi_connection
+    if conn.dialect.name == 'sqlite':
+        return dbapi_connection.interrupt
+    # pymssql keeps the _mssql connection on ._conn
+    driver_connection = getattr(dbapi_connection, '_conn', None)
+    return getattr(driver_connection, 'cancel', None)
+
+
+def _finish_deadline(info):
+    deadline = info.pop('statement_deadline', None)
+    return deadline is not None and deadline.finish()
+
+
+def _apply_timeout(conn, cursor, statement, parameters, context, executemany):
+    _finish_deadline(conn.info)
+    seconds, rule = _current_timeout()
+    cancel = _canceller(conn) if seconds else None
+    if cancel is not None:
+        conn.info['statement_deadline'] = _Deadline(cancel, seconds, rule)
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    if connection_record is not None:
+        _finish_deadline(connection_record.info)
+
+
+def _on_error(context):
+    connection = context.connection
+    deadline = connection.info.get('statement_deadline') if connection is not None else None
+    if deadline is None or not _finish_deadline(connection.info):
+        return None
+    seconds, rule = deadline.seconds, deadline.rule
+
+    if connection.dialect.name != 'sqlite':
+        # Drop only this connection from the pool
+        context.is_disconnect = True
+        context.invalidate_pool_on_disconnect = False
+
+    with _stats_lock:
+        _timeouts[rule] = _timeouts.get(rule, 0) + 1
+    if has_request_context():
+        g.statement_timeout = (seconds, rule)
+    return StatementTimeout(seconds, rule)
+
+
+def install_statement_timeouts():
+    """Listen on every engine (the primary pool and the mirror)."""
+    if not event.contains(Engine, 'before_cursor_execute', _apply_timeout):
+        event.listen(Engine, 'before_cursor_execute', _apply_timeout)
+        event.listen(Engine, 'handle_error', _on_error)
+        event.listen(Pool, 'checkin', _on_checkin)
+
+
+def timeout_response(response):
+    """``after_request`` hook: report a cancelled statement as a structured 504."""
+    timeout = g.pop('statement_timeout', None)
+    if timeout is None or response.status_code != 500:
+        return response
+    seconds, rule = timeout
+    structured = jsonify({
+        'success': False,
+        'error': f"The query took longer than the {seconds} s allowed for this route and was cancelled",
+        'timeout': True,
+        'timeout_seconds': seconds,
+        'route': rule
+    })
+    structured.status_code = 504
+    return structured
+
+
+def timeout_stats():
+    """Statement timeouts so far, in total and per route."""
+    with _stats_lock:
+        return {'total': sum(_timeouts.values()), 'by_route': dict(_timeouts)}
@@ -0,0 +1,69 @@
+"""Thread-safe TTL + LRU cache.
+
+Entries expire after ``ttl`` seconds but are kept (until evicted by the LRU
+bound) so callers can still fall back to a stale value, e.g. when the source
+of truth is unreachable.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded mapping whose entries are fresh for ``ttl`` seconds."""
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, ttl=None):
+        """Return the value for ``key`` if it is still fresh, else None."""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None or time.monotonic() - entry[0] > ttl:
+                return None
+            return entry[1]
+
+    def get_entry(self, key):
+        """Return ``(value, age_seconds)`` for ``key`` regardless of freshness, or None."""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            return entry[1], time.monotonic() - entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose key satisfies ``predicate``; returns the count."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,70 @@
+"""Shared fixtures for the backend tests (run from ``backend/``: ``python -m pytest``)."""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+class FakeClock:
+    """Stand-in for ``time.monotonic`` that only moves when told to."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(scope='session')
+def synthetic_db(tmp_path_factory):
+    """A small synthetic Main/Chines/Customers SQLite database (see benchmarks.synthetic)."""
+    from benchmarks.synthetic import generate
+
+    path = str(tmp_path_factory.mktemp('warehouse') / 'synthetic.db')
+    generate(path, pieces=3000, customers=50)
+    return path
+
+
+@pytest.fixture
+def db_app(synthetic_db, tmp_path):
+    """A Flask app with the testing config and a SQLAlchemy engine on a copy of the synthetic database."""
+    import shutil
+
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+
+    from config import TestingConfig
+    from services import sqlite_compat
+
+    path = str(tmp_path / 'warehouse.db')
+    shutil.copyfile(synthetic_db, path)
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['DB_BREAKER_ENABLED'] = False
+    SQLAlchemy(app)
+    with app.app_context():
+        sqlite_compat.install(app.extensions['sqlalchemy'].engine)
+        yield app
+
+
+@pytest.fixture
+def client(db_app):
+    """A test client for ``db_app`` with the warehouse routes registered under ``/api/warehouse``."""
+    from routes.warehouse import warehouse_bp
+
+    db_app.register_blueprint(warehouse_bp, url_prefix='/api/warehouse')
+    with db_app.test_client() as client:
+        yield client
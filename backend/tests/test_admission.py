@@ -0,0 +1,81 @@
+"""Admission control: lane limits, the shared capacity and shedding."""
+import threading
+
+import pytest
+
+from services.admission import AdmissionController, AdmissionRejected, route_class
+
+
+CLASSES = {
+    'light': {'limit': 0, 'queue': 2, 'wait': 0},
+    'heavy': {'limit': 1, 'queue': 1, 'wait': 0},
+    'export': {'limit': 1, 'queue': 0, 'wait': 0},
+}
+
+
+@pytest.fixture
+def controller():
+    return AdmissionController(CLASSES, capacity=3, reserved=1, retry_after=7)
+
+
+def rejected(controller, cost_class, pool_saturated=None):
+    with pytest.raises(AdmissionRejected) as info:
+        controller.acquire(cost_class, pool_saturated)
+    return info.value
+
+
+def test_route_classes():
+    assert route_class('/api/warehouse/sales/main/detailed') == 'heavy'
+    assert route_class('/api/warehouse/export/<kind>') == 'export'
+    assert route_class('/api/warehouse/jobs/<job_id>') is None
+    assert route_class('/api/warehouse/inventory') == 'light'
+
+
+def test_bulk_classes_leave_the_reserved_slots(controller):
+    controller.acquire('heavy')
+    controller.acquire('export')
+    assert controller.bulk_active == 2
+    # The heavy lane is full and bulk is at capacity - reserved
+    assert rejected(controller, 'heavy').reason == 'wait timed out'
+    controller.acquire('light')
+    assert controller.status()['active'] == 3
+
+
+def test_light_requests_share_the_capacity_with_bulk(controller):
+    controller.acquire('heavy')
+    controller.acquire('light')
+    controller.acquire('light')
+    # Light may use every connection, but not one a heavy request already holds
+    assert rejected(controller, 'light').reason == 'wait timed out'
+    assert controller.status()['classes']['light']['active'] == 2
+
+
+def test_full_queue_sheds_with_the_configured_retry_after(controller):
+    for _ in range(3):
+        controller.acquire('light')
+    controller.lanes['light'].waiting = 2
+    error = rejected(controller, 'light')
+    assert (error.reason, error.retry_after) == ('queue full', 7)
+    assert controller.lanes['light'].shed == 1
+
+
+def test_saturated_pool_sheds_bulk_but_light_queues(controller):
+    controller.acquire('heavy')
+    assert rejected(controller, 'heavy', lambda: True).reason == 'connection pool saturated'
+    controller.acquire('light', lambda: True)
+    controller.acquire('light', lambda: True)
+    assert rejected(controller, 'light', lambda: True).reason == 'wait timed out'
+
+
+def test_release_wakes_a_waiting_request(controller):
+    controller.lanes['light'].wait = 5
+    tickets = [controller.acquire('light') for _ in range(3)]
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(controller.acquire('light')))
+    waiter.start()
+    tickets[0].release()
+    tickets[0].release()
+    waiter.join(5)
+    assert len(admitted) == 1
+    light = controller.status()['classes']['light']
+    assert (light['active'], light['queued'], light['admitted']) == (3, 1, 4)
@@ -0,0 +1,140 @@
+"""Ranked sales routes against the per-route SQL they replaced, on the synthetic database."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from services.analytics import SalesFrame, SalesQuery, frame_cache, load_frame
+from services.query import fetch_all
+
+
+PERIODS = {
+    'yesterday': "AND CONVERT(date, {date}) = CONVERT(date, DATEADD(day, -1, GETDATE()))",
+    'week': "AND {date} >= DATEADD(week, -1, GETDATE()) AND {date} < GETDATE()",
+    'last_month': "AND {date} >= DATEADD(month, -1, GETDATE()) AND {date} < GETDATE()",
+    'last_3_months': "AND {date} >= DATEADD(month, -3, GETDATE()) AND {date} < GETDATE()",
+}
+
+DATE_WINDOWS = [
+    {'start_date': '2025-06-01', 'end_date': '2026-03-01'},
+    {'start_date': '2025-06-01'},
+    {'end_date': '2025-06-01'},
+    {},
+]
+PERIOD_WINDOWS = [{'period': period} for period in PERIODS]
+
+# The routes' SQL before the shared frame: (select list, FROM and filters, GROUP BY, ORDER BY)
+BASELINE = {
+    'main_products': ("Desan, COUNT(*), SUM(Long2), COUNT(DISTINCT Customer)",
+                      "FROM Main WHERE Status = 'مشحون' {window}", "Desan", "COUNT(*)"),
+    'chinese_products': ("Type, Color, COUNT(*), SUM(Long), COUNT(DISTINCT Customer)",
+                         "FROM Chines WHERE Status = 'مشحون' {window}", "Type, Color", "COUNT(*)"),
+    'chinese_customers': ("Customer, COUNT(*), SUM(Long), COUNT(DISTINCT CONCAT(Type, '-', Color))",
+                          "FROM Chines WHERE Status = 'مشحون' {window}", "Customer", "SUM(Long)"),
+    'main_customers': ("Customers.Name, COUNT(*), SUM(Main.Long2), COUNT(DISTINCT CONCAT(Main.Desan, '-', Main.Color))",
+                       "FROM Main JOIN Customers ON Main.customerNumber = Customers.Number "
+                       "WHERE Status = 'مشحون' AND customerNumber != '6000' {window}",
+                       "Customers.Name", "SUM(Main.Long2)"),
+    'main_color_products': ("Desan, Color, COUNT(*), SUM(Long2), COUNT(DISTINCT customerNumber)",
+                            "FROM Main WHERE Status = 'مشحون' AND customerNumber != '6000' {window}",
+                            "Desan, Color", "COUNT(*)"),
+}
+
+
+def baseline(name, args, date_column):
+    """Rows of the old query for ``name``, with the window the old route built from ``args``."""
+    select, source, group_by, order_by = BASELINE[name]
+    params = {}
+    if args.get('period') in PERIODS:
+        window = PERIODS[args['period']].format(date=date_column)
+    else:
+        window = ''
+        if args.get('start_date'):
+            window += f" AND {date_column} >= :start_date"
+            params['start_date'] = args['start_date']
+        if args.get('end_date'):
+            window += f" AND {date_column} <= :end_date"
+            params['end_date'] = args['end_date']
+    sql = f"SELECT TOP 1000 {select} {source.format(window=window)} GROUP BY {group_by} ORDER BY {order_by} DESC"
+    return fetch_all(text(sql), params)
+
+
+def with_percentages(items):
+    total = sum(item['total_pieces'] for item in items) if items else 1
+    return [dict(item, percentage=round((item['total_pieces'] / total) * 100, 1) if total > 0 else 0)
+            for item in items]
+
+
+def products(rows, keys, **extra):
+    return with_percentages([dict(zip(keys, (value or '' for value in row[:len(keys)])),
+                                  total_pieces=row[len(keys)], total_meters=float(row[len(keys) + 1] or 0.0),
+                                  unique_customers=row[len(keys) + 2], **extra) for row in rows])
+
+
+def customers(rows):
+    return [{'customer': row[0] or 'غير محدد', 'total_pieces': row[1], 'total_meters': float(row[2] or 0.0),
+             'unique_products': row[3]} for row in rows]
+
+
+def same_rows(actual, expected, order_by):
+    """Equal up to the order of tied groups, and ranked by ``order_by``."""
+    normalized = lambda items: sorted(tuple(sorted(dict(item, total_meters=round(item['total_meters'], 6)).items()))
+                                      for item in items)
+    assert normalized(actual) == normalized(expected)
+    ranking = [item[order_by] for item in actual]
+    assert ranking == sorted(ranking, reverse=True)
+
+
+@pytest.fixture
+def get(db_app, client):
+    frame_cache.clear()
+    yield lambda path, args: client.get(f'/api/warehouse{path}', query_string=dict(args, limit=1000)).get_json()
+    frame_cache.clear()
+
+
+@pytest.mark.parametrize('args', DATE_WINDOWS)
+def test_top_products(get, args):
+    data = get('/sales/top-products', args)['data']
+    same_rows(data['main'], products(baseline('main_products', args, 'Date3'), ('name',), table='main'),
+              'total_pieces')
+    same_rows(data['chinese'], products(baseline('chinese_products', args, 'Date'), ('type', 'color'), table='chinese'),
+              'total_pieces')
+
+
+@pytest.mark.parametrize('args', PERIOD_WINDOWS + DATE_WINDOWS)
+def test_chinese_customers(get, args):
+    same_rows(get('/sales/chinese/customers', args)['data'], customers(baseline('chinese_customers', args, 'Date')),
+              'total_meters')
+
+
+@pytest.mark.parametrize('args', PERIOD_WINDOWS + DATE_WINDOWS)
+def test_main_customers(get, args):
+    same_rows(get('/sales/main/customers', args)['data'], customers(baseline('main_customers', args, 'Date3')),
+              'total_meters')
+
+
+# The old route filtered last_3_months by one month; the frame uses the three months it names
+@pytest.mark.parametrize('args', [args for args in PERIOD_WINDOWS if args['period'] != 'last_3_months'] + DATE_WINDOWS)
+def test_chinese_top_products(get, args):
+    response = get('/sales/chinese/top-products', args)
+    expected = products(baseline('chinese_products', args, 'Date'), ('type', 'color'))
+    same_rows(response['data'], expected, 'total_pieces')
+    assert response['total_pieces'] == (sum(item['total_pieces'] for item in expected) if expected else 1)
+
+
+@pytest.mark.parametrize('args', PERIOD_WINDOWS + DATE_WINDOWS)
+def test_main_top_products(get, args):
+    response = get('/sales/main/top-products', args)
+    same_rows(response['data'], products(baseline('main_color_products', args, 'Date3'), ('type', 'color')),
+              'total_pieces')
+
+
+@pytest.mark.parametrize('window, loader', [
+    ((datetime(2025, 6, 1), datetime(2026, 3, 1), True), SalesFrame),
+    ((datetime(2025, 6, 1), None, True), SalesQuery),
+    ((None, datetime(2025, 6, 1), True), SalesQuery),
+    ((None, None, True), SalesQuery),
+])
+def test_open_ended_windows_are_grouped_by_the_database(db_app, window, loader):
+    frame_cache.clear()
+    assert type(load_frame('main', window)) is loader
@@ -0,0 +1,93 @@
+"""Circuit breaker: which errors count as an outage, and the state machine."""
+import types
+
+import pytest
+from sqlalchemy import exc
+
+from services import breaker
+from services.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, is_outage
+from services.timeouts import StatementTimeout
+
+
+class DriverError(Exception):
+    """Shaped like a pymssql error: ``(code, message)``."""
+
+
+def operational(code, message):
+    return exc.OperationalError('SELECT 1', {}, DriverError(code, message))
+
+
+UNREACHABLE = operational(20009, b'DB-Lib error message 20009, severity 9:\nUnable to connect: Adaptive Server is unavailable')
+DEADLOCK = operational(1205, b'Transaction was deadlocked on lock resources.DB-Lib error message 20018, severity 13:\n'
+                             b'General SQL Server error: Check messages from the SQL Server\n')
+
+
+@pytest.mark.parametrize('error', [
+    StatementTimeout(30, '/sales/summary'),
+    exc.TimeoutError('QueuePool limit of size 2 overflow 1 reached'),
+    UNREACHABLE,
+    operational(20003, b'DB-Lib error message 20003, severity 6:\nAdaptive Server connection timed out'),
+    exc.InterfaceError('SELECT 1', {}, DriverError(b'Connection is closed.'), connection_invalidated=True),
+])
+def test_connectivity_errors_are_outages(error):
+    assert is_outage(error)
+
+
+@pytest.mark.parametrize('error', [
+    DEADLOCK,
+    exc.ProgrammingError('SELECT x', {}, DriverError(208, b"Invalid object name 'x'.")),
+    exc.IntegrityError('INSERT', {}, DriverError(2627, b'Violation of PRIMARY KEY constraint')),
+    operational(8114, b'Error converting data type nvarchar to numeric.'),
+    ValueError('bad input'),
+])
+def test_answers_from_the_server_are_not_outages(error):
+    assert not is_outage(error)
+
+
+def fail(error):
+    def call():
+        raise error
+    return call
+
+
+@pytest.fixture
+def circuit(clock, monkeypatch):
+    monkeypatch.setattr(breaker, 'time', types.SimpleNamespace(monotonic=clock))
+    return CircuitBreaker(threshold=3, reset_timeout=30)
+
+
+def test_consecutive_outages_open_the_circuit(circuit):
+    for _ in range(3):
+        with pytest.raises(exc.OperationalError):
+            circuit.call(fail(UNREACHABLE))
+    assert circuit.state == OPEN and circuit.trips == 1
+    with pytest.raises(CircuitOpen) as info:
+        circuit.call(lambda: 1)
+    assert info.value.retry_after == 30
+    assert circuit.rejected == 1
+
+
+def test_server_errors_reset_the_count(circuit):
+    for error in (UNREACHABLE, UNREACHABLE, DEADLOCK, UNREACHABLE, UNREACHABLE):
+        with pytest.raises(exc.OperationalError):
+            circuit.call(fail(error))
+    assert circuit.state == CLOSED and circuit.failures == 2
+
+
+def test_half_open_probe(circuit, clock):
+    for _ in range(3):
+        with pytest.raises(exc.OperationalError):
+            circuit.call(fail(UNREACHABLE))
+    clock.advance(30)
+    assert not circuit.rejecting()
+
+    # A failed probe opens the circuit for another period
+    with pytest.raises(exc.OperationalError):
+        circuit.call(fail(UNREACHABLE))
+    assert circuit.state == OPEN and circuit.rejecting()
+
+    clock.advance(30)
+    circuit._before_call()
+    assert circuit.state == HALF_OPEN and circuit.rejecting()
+    circuit._on_success()
+    assert circuit.state == CLOSED and circuit.call(lambda: 'ok') == 'ok'
@@ -0,0 +1,96 @@
+"""Change feed polling: cheap high-water probes gate the per-status scan."""
+import sqlite3
+import types
+
+import pytest
+from sqlalchemy import event
+
+from services import changes
+from services.changes import ChangeFeed
+
+
+@pytest.fixture
+def statements(db_app):
+    executed = []
+    engine = db_app.extensions['sqlalchemy'].engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(' '.join(statement.split()))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def feed(db_app, clock, monkeypatch):
+    monkeypatch.setattr(changes, 'time', types.SimpleNamespace(monotonic=clock))
+    db_app.config['CHANGE_FEED_SCAN_INTERVAL'] = 60
+    return ChangeFeed()
+
+
+def scans(executed):
+    return [statement for statement in executed if 'GROUP BY Status' in statement]
+
+
+def write(db_app, sql, params=()):
+    path = db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    with sqlite3.connect(path) as connection:
+        connection.execute(sql, params)
+
+
+def test_first_poll_scans_once(feed, statements):
+    assert feed.poll_once() == []
+    assert len(scans(statements)) == 2
+    assert set(feed.watermarks) == {'main', 'chinese'}
+
+
+def test_quiet_polls_only_probe_the_key(feed, statements, clock):
+    feed.poll_once()
+    statements.clear()
+
+    clock.advance(5)
+    assert feed.poll_once() == []
+    assert scans(statements) == []
+    assert statements == ['SELECT MAX(Number) AS max_number FROM Main',
+                          'SELECT MAX(Number) AS max_number FROM Chines']
+
+
+def test_new_pieces_trigger_a_scan(db_app, feed, statements, clock):
+    feed.poll_once()
+    statements.clear()
+
+    write(db_app, "INSERT INTO Chines (Number, Type, Color, Long, Status, Customer, Date) "
+                  "VALUES (999999, 'T001', 'أحمر', 50, 'مستودع', '6000', '2026-01-01 10:00:00')")
+    clock.advance(5)
+    events = feed.poll_once()
+    assert [(event.source, set(event.statuses)) for event in events] == [('chinese', {'مستودع'})]
+    assert len(scans(statements)) == 1
+
+
+def test_status_moves_are_seen_after_the_scan_interval(db_app, feed, clock):
+    feed.poll_once()
+    write(db_app, "UPDATE Main SET Status = 'مشحون', Date3 = '2026-01-02 10:00:00' "
+                  "WHERE Number = (SELECT MIN(Number) FROM Main WHERE Status = 'مستودع')")
+
+    clock.advance(30)
+    assert feed.poll_once() == []
+
+    clock.advance(30)
+    events = feed.poll_once()
+    assert len(events) == 1
+    assert events[0].source == 'main'
+    assert {'مستودع', 'مشحون'} <= events[0].statuses
+
+
+def test_events_reach_subscribers(db_app, feed, clock):
+    received = []
+    unsubscribe = feed.subscribe(received.append)
+    feed.poll_once()
+    write(db_app, "DELETE FROM Chines WHERE Number = (SELECT MAX(Number) FROM Chines)")
+
+    clock.advance(5)
+    feed.poll_once()
+    unsubscribe()
+    assert [event.source for event in received] == ['chinese']
+    assert feed.version == 1
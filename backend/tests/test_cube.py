@@ -0,0 +1,127 @@
+"""Sales cube: label sorts, rebuilding behind the old cube and partial-day windows."""
+import threading
+import types
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from services import cube
+from services.analytics import SHIPPED_STATUS
+from services.cube import SalesCube, split_window
+
+
+ROWS = [
+    ('main', '2026-01-01', 'D002', 'كحلي', '1002', 3, 30.0),
+    ('main', '2026-01-01', 'D003', 'أبيض', '1001', 1, 10.0),
+    ('main', '2026-01-02', 'D001', 'أسود', '1003', 2, 20.0),
+    ('chinese', '2026-01-02', 'T001', 'أبيض', 'زبون', 4, 40.0),
+]
+
+
+def test_sort_by_label_dimension_uses_labels_not_codes():
+    sales = SalesCube(ROWS)
+    rows, _ = sales.query(group_by=['product'], filters={'source': (['main'], False)}, sort='product', descending=False)
+    assert [row['product'] for row in rows] == ['D001', 'D002', 'D003']
+
+    rows, _ = sales.query(group_by=['customer'], filters={'source': (['main'], False)}, sort='customer')
+    assert [row['customer'] for row in rows] == ['1003', '1002', '1001']
+
+
+def test_sort_by_day_stays_chronological():
+    rows, _ = SalesCube(ROWS).query(group_by=['day'], sort='day', descending=False)
+    assert [row['day'] for row in rows] == ['2026-01-01', '2026-01-02']
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Replace ``SalesCube.load``; each load waits for ``release`` when ``block`` is set."""
+    state = types.SimpleNamespace(count=0, block=False, release=threading.Event(), done=threading.Event())
+
+    def load(precision=None):
+        state.count += 1
+        if state.block:
+            state.release.wait(5)
+        built = SalesCube(ROWS)
+        built.number = state.count
+        state.done.set()
+        return built
+
+    monkeypatch.setattr(SalesCube, 'load', staticmethod(load))
+    monkeypatch.setattr(cube, '_cube', None)
+    monkeypatch.setattr(cube, '_cube_loaded', 0.0)
+    monkeypatch.setattr(cube, '_cube_changed', False)
+    monkeypatch.setattr(cube, '_rebuilding', False)
+    return state
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+def test_changes_rebuild_in_background_behind_the_old_cube(app, builds):
+    first = cube.get_cube()
+    assert first.number == 1
+
+    cube._on_change(types.SimpleNamespace(statuses={SHIPPED_STATUS}))
+    builds.block = True
+    builds.done.clear()
+    # The rebuild is waiting on the database; requests keep the old cube
+    assert cube.get_cube() is first
+    assert cube.get_cube() is first
+    assert builds.count == 2
+
+    builds.release.set()
+    assert builds.done.wait(5)
+    for _ in range(100):
+        if cube.get_cube() is not first:
+            break
+        threading.Event().wait(0.01)
+    assert cube.get_cube().number == 2
+    assert builds.count == 2
+
+
+def test_unrelated_changes_keep_the_cube(app, builds):
+    first = cube.get_cube()
+    cube._on_change(types.SimpleNamespace(statuses={'مستودع'}))
+    assert cube.get_cube() is first
+    assert builds.count == 1
+
+
+def test_split_window_separates_partial_days():
+    start, end = datetime(2026, 1, 1, 15, 30), datetime(2026, 1, 8, 15, 30)
+    days, edges = split_window((start, end, False))
+    assert days == (datetime(2026, 1, 2), datetime(2026, 1, 8), False)
+    assert edges == [(start, datetime(2026, 1, 2), False), (datetime(2026, 1, 8), end, False)]
+
+
+def test_split_window_of_whole_days():
+    # Custom dates: the exact routes include pieces stamped at the end date's midnight
+    start, end = datetime(2026, 1, 1), datetime(2026, 1, 8)
+    assert split_window((start, end, True)) == ((start, end, False), [(end, end, True)])
+    assert split_window((start, end, False)) == ((start, end, False), [])
+    assert split_window((None, None, True)) == ((None, None, False), [])
+
+
+def test_split_window_within_one_day():
+    window = (datetime(2026, 1, 1, 8), datetime(2026, 1, 1, 18), False)
+    assert split_window(window) == (None, [window])
+
+
+def test_approx_customer_ranking_matches_the_exact_one(db_app, monkeypatch):
+    from services.analytics import frame_cache, load_frame, resolve_window
+
+    monkeypatch.setattr(cube, '_cube', None)
+    monkeypatch.setattr(cube, '_cube_changed', False)
+    frame_cache.clear()
+    sales = cube.get_cube()
+    for period in ('week', 'last_month', 'yesterday', 'last_3_months'):
+        window = resolve_window(period)
+        frame = load_frame('chinese', window)
+        exact = frame.rank('customer', 10, order_by='meters', distinct=('type', 'color'), distinct_nulls=True)
+        approx = sales.rank_customers('chinese', window, 10)
+        assert [(item['total_pieces'], round(item['total_meters'], 6), item['distinct']) for item in exact] == \
+            [(item['total_pieces'], round(item['total_meters'], 6), item['unique_products']) for item in approx]
@@ -0,0 +1,59 @@
+"""Columnar export: date validation and an Arrow round trip on the synthetic database."""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from services.export import EXPORT_SOURCES
+
+pa = pytest.importorskip('pyarrow')
+
+
+def shipped(db_app, source, start_date, end_date):
+    """The export query run directly on the database file."""
+    sql = EXPORT_SOURCES[source]['sql'].replace(':start_date', '?').replace(':end_date', '?')
+    with sqlite3.connect(db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]) as connection:
+        return connection.execute(sql, (start_date, end_date)).fetchall()
+
+
+@pytest.mark.parametrize('source', list(EXPORT_SOURCES))
+def test_arrow_round_trip(db_app, client, source):
+    start_date, end_date = '2020-01-01', '2099-12-31'
+    expected = shipped(db_app, source, start_date, end_date)
+    assert expected
+
+    response = client.get(f'/api/warehouse/export/{source}', query_string={'start_date': start_date, 'end_date': end_date})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == f'attachment; filename="{source}_sales_{start_date}_{end_date}.arrows"'
+    table = pa.ipc.open_stream(response.get_data()).read_all()
+
+    columns = EXPORT_SOURCES[source]['columns']
+    assert table.column_names == [name for name, _ in columns]
+    assert table.num_rows == len(expected)
+    for index, (name, kind) in enumerate(columns):
+        values = table.column(name).to_pylist()
+        if kind == 'timestamp':
+            assert values == [datetime.fromisoformat(row[index]) for row in expected], name
+        elif kind == 'float64':
+            assert values == [float(row[index]) for row in expected], name
+        else:
+            assert values == [None if row[index] is None else str(row[index]) for row in expected], name
+
+
+@pytest.mark.parametrize('start_date, end_date', [
+    ('2026-13-01', '2026-12-31'),
+    ('2026-01-01', 'yesterday'),
+    ('2026-01-01"; x="', '2026-12-31'),
+])
+def test_malformed_dates_are_rejected(client, start_date, end_date):
+    response = client.get('/api/warehouse/export/main', query_string={'start_date': start_date, 'end_date': end_date})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert 'Content-Disposition' not in response.headers
+
+
+def test_filename_uses_the_parsed_dates(client):
+    response = client.get('/api/warehouse/export/chinese',
+                          query_string={'start_date': '2026-1-5', 'end_date': '2026-02-01', 'format': 'parquet'})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="chinese_sales_2026-01-05_2026-02-01.parquet"'
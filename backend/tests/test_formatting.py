@@ -0,0 +1,106 @@
+"""Display formatting of inventory totals: FORMAT(..., 'N1') compatible strings or typed floats."""
+import sqlite3
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+
+from services.formatting import format_number, format_totals, number_style
+
+
+@pytest.mark.parametrize('value, decimals, expected', [
+    (0, 1, '0.0'),
+    (0.0, 1, '0.0'),
+    (1234.5, 1, '1,234.5'),
+    (1234567.25, 1, '1,234,567.3'),
+    # .NET rounds half away from zero after cutting the double to 15 digits
+    (0.25, 1, '0.3'),
+    (0.15, 1, '0.2'),
+    (2.675, 2, '2.68'),
+    (-0.04, 1, '0.0'),
+    (-1.25, 1, '-1.3'),
+    (Decimal('2.25'), 1, '2.3'),
+    (42, 0, '42'),
+])
+def test_format_number_matches_sql_server(value, decimals, expected):
+    assert format_number(value, decimals) == expected
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+def test_number_style(app):
+    assert number_style() == 'display'
+    app.config['NUMBER_STRING_COMPAT'] = False
+    assert number_style() == 'typed'
+    with app.test_request_context('/?numbers=display'):
+        assert number_style() == 'display'
+    with app.test_request_context('/?numbers=strings'):
+        assert number_style() == 'typed'
+
+
+def test_format_totals(app):
+    rows = [{'total_long': 1234.25, 'count': 3}, {'total_long': None}, {'total_long': 0}]
+    assert format_totals(rows, style='display') is rows
+    assert rows == [{'total_long': '1,234.3', 'count': 3}, {'total_long': None}, {'total_long': '0.0'}]
+
+    rows = [{'total_long': 1234.25, 'other': 1.26}, {'total_long': None}, {'total_long': 0}]
+    format_totals(rows, style='typed')
+    assert rows == [{'total_long': 1234.3, 'other': 1.26}, {'total_long': None}, {'total_long': 0.0}]
+    assert all(type(row['total_long']) is float for row in rows if row['total_long'] is not None)
+
+
+@pytest.fixture
+def inventory(db_app):
+    """Stock, scrap and Chinese rows whose sums are NULL ('ZZNULL') and zero ('ZZZERO')."""
+    with sqlite3.connect(db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]) as connection:
+        for number, (desan, length) in enumerate((('ZZNULL', None), ('ZZZERO', 0)), start=900001):
+            for offset, status in ((0, 'مستودع'), (10, 'سقط')):
+                connection.execute("INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber) "
+                                   "VALUES (?, ?, 'أحمر', ?, ?, '6000', '6000')", (number + offset, desan, length, status))
+            connection.execute("INSERT INTO Chines (Number, Type, Color, Long, Status) VALUES (?, ?, 'أحمر', ?, 'مستودع')",
+                               (number, desan, length))
+    return db_app
+
+
+ROUTES = [
+    ('/scrap', 'desan'),
+    ('/classic', 'desan'),
+    ('/chinese', 'type'),
+    ('/classic/details/ZZNULL', 'desan'),
+    ('/classic/details/ZZZERO', 'desan'),
+    ('/scrap/details/ZZNULL', 'desan'),
+    ('/scrap/details/ZZZERO', 'desan'),
+]
+
+
+@pytest.mark.parametrize('path, name', ROUTES)
+def test_routes_render_totals_per_request(inventory, client, path, name):
+    display = client.get(f'/api/warehouse{path}').get_json()['data']
+    typed = client.get(f'/api/warehouse{path}', query_string={'numbers': 'typed'}).get_json()['data']
+    assert display and [row[name] for row in display] == [row[name] for row in typed]
+
+    for shown, number in zip(display, typed):
+        if shown[name] == 'ZZNULL':
+            assert shown['total_long'] is None and number['total_long'] is None
+            continue
+        assert type(number['total_long']) is float
+        assert shown['total_long'] == format_number(number['total_long'])
+    totals = {row[name]: row['total_long'] for row in display}
+    assert {'ZZNULL', 'ZZZERO'} & set(totals)
+    if 'ZZZERO' in totals:
+        assert totals['ZZZERO'] == '0.0'
+    if '/details/' not in path:
+        assert {'ZZNULL', 'ZZZERO'} <= set(totals)
+
+
+def test_compat_off_serves_floats(inventory, client):
+    inventory.config['NUMBER_STRING_COMPAT'] = False
+    data = client.get('/api/warehouse/classic').get_json()['data']
+    assert all(type(row['total_long']) is float for row in data if row['total_long'] is not None)
+    assert client.get('/api/warehouse/classic', query_string={'numbers': 'display'}).get_json()['data'][0]['total_long'] \
+        == format_number(data[0]['total_long'])
@@ -0,0 +1,46 @@
+"""HyperLogLog sketches: accuracy, merging and per-day ranges."""
+import numpy as np
+
+from services.hll import DailySketches, HyperLogLog, hash_labels
+
+
+def labels(start, stop):
+    return [f'customer-{index}' for index in range(start, stop)]
+
+
+def test_hashes_are_stable():
+    assert hash_labels(['a', 1])[0] == hash_labels(['a'])[0]
+    assert hash_labels([1])[0] == hash_labels(['1'])[0]
+
+
+def test_estimate_within_a_few_standard_errors():
+    for count in (10, 1000, 50000):
+        sketch = HyperLogLog(12).add_hashes(hash_labels(labels(0, count)))
+        assert abs(sketch.estimate() - count) <= max(1, 4 * sketch.standard_error * count)
+
+
+def test_duplicates_do_not_count():
+    hashes = hash_labels(labels(0, 500))
+    sketch = HyperLogLog().add_hashes(np.concatenate([hashes, hashes, hashes]))
+    assert sketch.estimate() == HyperLogLog().add_hashes(hashes).estimate()
+
+
+def test_merge_counts_the_union():
+    first = HyperLogLog(12).add_hashes(hash_labels(labels(0, 3000)))
+    second = HyperLogLog(12).add_hashes(hash_labels(labels(2000, 5000)))
+    union = first.merge(second)
+    assert abs(union.estimate() - 5000) <= 4 * union.standard_error * 5000
+
+
+def test_daily_sketches_merge_day_ranges():
+    # Days 0..9, each with 100 customers, overlapping the next day by half
+    days = np.repeat(np.arange(10, dtype=np.int64), 100)
+    hashes = np.concatenate([hash_labels(labels(day * 50, day * 50 + 100)) for day in range(10)])
+    daily = DailySketches(days, hashes, 12)
+
+    assert len(daily) <= len(days)
+    assert daily.merge(3, 3).estimate() == HyperLogLog(12).add_hashes(hash_labels(labels(150, 250))).estimate()
+    exact = HyperLogLog(12).add_hashes(hash_labels(labels(100, 400))).estimate()
+    assert daily.merge(2, 6).estimate() == exact
+    assert daily.merge().estimate() == daily.merge(None, 9).estimate()
+    assert daily.merge(20, 30).estimate() == 0
@@ -0,0 +1,70 @@
+"""Inventory snapshot: every snapshot-served view matches its live SQL."""
+import sqlite3
+
+import pytest
+from sqlalchemy import event, text
+
+from services import inventory
+from services.inventory import INVENTORY_QUERIES, refresh_inventory_snapshot, snapshot_status
+from services.query import fetch_all
+
+
+def write(db_app, sql, params=()):
+    path = db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    with sqlite3.connect(path) as connection:
+        connection.execute(sql, params)
+
+
+@pytest.fixture
+def snapshot(db_app, monkeypatch):
+    monkeypatch.setattr(inventory, '_refreshed_at', None)
+    monkeypatch.setattr(inventory, '_checked_at', None)
+    # Stock orders whose pieces are booked to a customer, and the reverse: only the flags tell them apart
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber) "
+                  "VALUES (900001, 'D001', 'أحمر', 40, 'مستودع', '6000', '1001')")
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber) "
+                  "VALUES (900002, 'D001', 'أحمر', 60, 'مستودع', '100001', '6000')")
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber) "
+                  "VALUES (900003, 'D001', 'أحمر', 50, 'مستودع', '6000', '6000')")
+    refresh_inventory_snapshot(db_app.extensions['sqlalchemy'].engine)
+    return db_app
+
+
+def rows(statement, params):
+    return [tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+            for row in fetch_all(text(statement), params)]
+
+
+@pytest.mark.parametrize('name', sorted(INVENTORY_QUERIES))
+def test_snapshot_matches_live(snapshot, name):
+    live, from_snapshot = INVENTORY_QUERIES[name]
+    params = {'desan': 'D001', 'type': 'T001'}
+    expected = rows(live, params)
+    assert expected
+    assert rows(from_snapshot, params) == expected
+
+
+def test_status_is_remembered_from_the_refresh(snapshot):
+    snapshot.config['INVENTORY_SNAPSHOT_ENABLED'] = True
+    executed = []
+    engine = snapshot.extensions['sqlalchemy'].engine
+    record = lambda conn, cursor, statement, *args: executed.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        status = snapshot_status()
+        snapshot_status()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert executed == []
+    assert status['stale'] is False and status['refreshed_at'] is not None
+
+
+def test_unknown_refresh_time_is_read_once(db_app, monkeypatch):
+    monkeypatch.setattr(inventory, '_refreshed_at', None)
+    monkeypatch.setattr(inventory, '_checked_at', None)
+    db_app.config['INVENTORY_SNAPSHOT_ENABLED'] = True
+    inventory.ensure_snapshot_table(db_app.extensions['sqlalchemy'].engine)
+    assert snapshot_status()['stale'] is True
+    write(db_app, "INSERT INTO inventory_snapshot VALUES ('main', 'سقط', 0, 0, 'D001', 'أحمر', 1, 1.0, '2020-01-01 00:00:00')")
+    # Within the recheck interval the stale answer is not re-read
+    assert snapshot_status()['refreshed_at'] is None
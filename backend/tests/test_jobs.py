@@ -0,0 +1,85 @@
+"""Report jobs: deduplication, the result cache, failures and their limits."""
+import threading
+
+import pytest
+from flask import Flask, g, jsonify
+
+from services import admission, jobs, timeouts
+from services.jobs import DONE, FAILED, JobQueue
+
+
+@pytest.fixture
+def report(tmp_path, monkeypatch):
+    """A one-route app standing in for the cube report; ``answer`` controls what it returns."""
+    monkeypatch.setattr(admission, '_controller', None)
+    app = Flask(__name__)
+    app.config.update(ADMISSION_ENABLED=True, ADMISSION_CLASSES={'heavy': {'limit': 1}, 'job': {'limit': 0, 'queue': 10, 'wait': 5}},
+                      SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 2, 'max_overflow': 1}, ADMISSION_RESERVED_SLOTS=1,
+                      STATEMENT_TIMEOUTS={'/cube': 120}, JOB_STATEMENT_TIMEOUT=1800)
+    state = {'calls': 0, 'release': threading.Event(), 'headers': {}, 'seen': []}
+    state['release'].set()
+
+    @app.route('/api/warehouse/cube')
+    def cube():
+        state['calls'] += 1
+        state['seen'].append({'timeout': timeouts._current_timeout()[0],
+                              'admission': admission.get_admission_controller().status()['classes']['job']['active']})
+        state['release'].wait(5)
+        response = jsonify({'success': True, 'calls': state['calls']})
+        response.headers.update(state['headers'])
+        return response
+
+    app.before_request(admission.admit_request)
+    app.after_request(admission.release_on_close)
+    app.teardown_request(admission.release_admission)
+    state['queue'] = JobQueue(app, 2, str(tmp_path), 10 * 1024 * 1024, 600)
+    return state
+
+
+def finish(job):
+    with job.changed:
+        job.changed.wait_for(lambda: job.finished, 5)
+    return job
+
+
+def test_identical_specs_share_one_job(report):
+    queue = report['queue']
+    report['release'].clear()
+    first = queue.submit({'report': 'cube', 'params': {'a': 1, 'b': [1, 2]}})
+    second = queue.submit({'report': 'cube', 'params': {'b': '1,2', 'a': '1'}})
+    assert first is second
+    report['release'].set()
+    assert finish(first).state == DONE
+    assert report['calls'] == 1
+
+
+def test_fresh_results_are_reused_until_refresh(report):
+    queue = report['queue']
+    finish(queue.submit({'report': 'cube'}))
+    cached = queue.submit({'report': 'cube'})
+    assert cached.state == DONE and cached.cached
+    assert report['calls'] == 1
+
+    refreshed = finish(queue.submit({'report': 'cube', 'refresh': True}))
+    assert not refreshed.cached and report['calls'] == 2
+
+
+def test_stale_responses_fail_the_job(report):
+    report['headers'] = {'X-Cache': 'STALE'}
+    job = finish(report['queue'].submit({'report': 'cube'}))
+    assert job.state == FAILED
+    assert 'stale' in job.error
+    assert report['queue'].open_result(job.id) is None
+
+
+def test_jobs_use_the_job_timeout_and_admission_class(report):
+    finish(report['queue'].submit({'report': 'cube'}))
+    assert report['seen'] == [{'timeout': 1800, 'admission': 1}]
+    assert admission.get_admission_controller().status()['bulk_active'] == 0
+
+
+def test_unknown_reports_are_rejected(report):
+    with pytest.raises(ValueError):
+        report['queue'].submit({'report': 'nope'})
+    with pytest.raises(ValueError):
+        jobs.normalize_spec({'report': 'cube', 'params': {'a': {'nested': 1}}})
@@ -0,0 +1,111 @@
+"""Live feed: one shared poll, fan-out to subscribers, diffs, order flags and the client cap."""
+import json
+import sqlite3
+
+import pytest
+
+from services.live import LiveHub, TooManyClients, diff_rows
+
+
+def write(db_app, sql, params=()):
+    with sqlite3.connect(db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]) as connection:
+        connection.execute(sql, params)
+
+
+def payload(message):
+    return json.loads(next(line for line in message.splitlines() if line.startswith('data: '))[len('data: '):])
+
+
+def pending(client):
+    messages = []
+    while not client.messages.empty():
+        messages.append(payload(client.messages.get_nowait()))
+    return messages
+
+
+@pytest.fixture
+def hub(db_app):
+    db_app.config['LIVE_POLL_INTERVAL'] = 3600
+    hub = LiveHub()
+    yield hub
+    with hub._lock:
+        hub._clients.clear()
+    hub._wake.set()
+
+
+def test_diff_rows():
+    previous = {'a': {'n': 1}, 'b': {'n': 2}}
+    assert diff_rows(previous, {'a': {'n': 1}, 'b': {'n': 3}, 'c': {'n': 4}}) == \
+        ([{'n': 3, 'key': 'b'}, {'n': 4, 'key': 'c'}], [])
+    assert diff_rows(previous, {'b': {'n': 2}}) == ([], ['a'])
+
+
+def test_clients_share_one_poll(db_app, hub):
+    first, snapshot = hub.connect(db_app, ('orders', 'inventory'))
+    assert [payload(message)['channel'] for message in snapshot] == ['orders', 'inventory']
+    assert hub.polls == 1
+
+    second, snapshot = hub.connect(db_app, ('orders',))
+    assert hub.polls == 1
+    rows = payload(snapshot[0])['rows']
+    assert rows and all(len(row['key']) == 3 for row in rows)
+
+
+def test_changes_fan_out_to_subscribed_clients(db_app, hub):
+    orders, snapshot = hub.connect(db_app, ('orders',))
+    both, _ = hub.connect(db_app, ('orders', 'inventory'))
+    inventory, _ = hub.connect(db_app, ('inventory',))
+    assert hub.poll(db_app) == 0
+    assert pending(orders) == pending(both) == pending(inventory) == []
+
+    row = payload(snapshot[0])['rows'][0]
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber) "
+                  "VALUES (900001, 'D001', 'أحمر', 40, 'تصنيع', ?, ?)", (row['customer'], row['customer_number']))
+    assert hub.poll(db_app) == 1
+    delta, = pending(orders)
+    assert pending(both) == [delta] and pending(inventory) == []
+    assert delta['removed'] == []
+    changed, = delta['upserted']
+    assert changed['key'] == row['key'] and changed['في_تصنيع'] == row['في_تصنيع'] + 1
+
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber) "
+                  "VALUES (900002, 'D001', 'أحمر', 40, 'مستودع', '6000', '6000')")
+    assert hub.poll(db_app) == 1
+    assert pending(orders) == []
+    delta, = pending(inventory)
+    assert pending(both) == [delta]
+    assert [row['key'] for row in delta['upserted']] == ['classic/D001']
+
+
+def test_order_flags_match_the_late_and_ready_routes(db_app, client, hub):
+    # An order whose only unshipped piece is a stock piece: open, but neither late nor ready
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber, endDate) "
+                  "VALUES (900001, 'D001', 'أحمر', 40, 'مشحون', 'X-1', '1001', '2020-01-01 00:00:00')")
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber, endDate) "
+                  "VALUES (900002, 'D001', 'أحمر', 40, 'تصنيع', 'X-1', '6000', '2020-01-01 00:00:00')")
+    _, snapshot = hub.connect(db_app, ('orders',))
+    rows = payload(snapshot[0])['rows']
+    assert ['X-1', '1001'] in [row['key'][:2] for row in rows]
+
+    for flag, path in (('late', '/orders/late'), ('ready', '/orders/ready')):
+        listed = client.get(f'/api/warehouse{path}').get_json()['data']
+        expected = sorted([order['customer'], order['customer_number'], order['customer_name']] for order in listed)
+        assert expected and sorted(row['key'] for row in rows if row[flag]) == expected, flag
+
+
+def test_subscribers_are_capped(db_app, client, hub):
+    db_app.config['LIVE_MAX_CLIENTS'] = 2
+    hub.connect(db_app, ('inventory',))
+    hub.connect(db_app, ('inventory',))
+    with pytest.raises(TooManyClients):
+        hub.connect(db_app, ('inventory',))
+    assert hub.client_count == 2
+
+
+def test_live_route_answers_503_when_full(db_app, client, monkeypatch):
+    monkeypatch.setattr('routes.warehouse.live_hub', LiveHub())
+    db_app.config['LIVE_MAX_CLIENTS'] = 0
+    response = client.get('/api/warehouse/live')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+    assert response.get_json()['success'] is False
@@ -0,0 +1,114 @@
+"""Analytics mirror sync: incremental passes read only new and newly shipped pieces."""
+import sqlite3
+import types
+
+import pytest
+from sqlalchemy import event
+
+from services import mirror
+from services.mirror import MIRROR_TABLES, SHIPPED_STATUS, sync_mirror
+
+
+@pytest.fixture
+def mirror_path(db_app, tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(mirror, 'time', types.SimpleNamespace(time=clock))
+    db_app.config['ANALYTICS_MIRROR_FULL_INTERVAL'] = 3600
+    return str(tmp_path / 'mirror.db')
+
+
+@pytest.fixture
+def statements(db_app):
+    executed = []
+    engine = db_app.extensions['sqlalchemy'].engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(' '.join(statement.split()))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def primary(db_app):
+    return sqlite3.connect(db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):])
+
+
+def rows(connection, table):
+    columns = ', '.join(name for name, _ in MIRROR_TABLES[table]['columns'])
+    return connection.execute(f'SELECT {columns} FROM {table} ORDER BY Number').fetchall()
+
+
+def assert_in_sync(db_app, mirror_path):
+    with primary(db_app) as source, sqlite3.connect(mirror_path) as copy:
+        for table in MIRROR_TABLES:
+            assert rows(copy, table) == rows(source, table), table
+
+
+def test_first_sync_copies_everything(db_app, mirror_path):
+    results = sync_mirror(path=mirror_path)
+    assert {table: stats['mode'] for table, stats in results.items()} == dict.fromkeys(MIRROR_TABLES, 'full copy')
+    assert_in_sync(db_app, mirror_path)
+
+
+def test_quiet_sync_reads_only_the_latest_shipments(db_app, mirror_path, statements):
+    sync_mirror(path=mirror_path)
+    with primary(db_app) as source:
+        total = source.execute('SELECT COUNT(*) FROM Main').fetchone()[0]
+        latest = source.execute('SELECT COUNT(*) FROM Main WHERE Status = ? AND Date3 = (SELECT MAX(Date3) FROM Main '
+                                'WHERE Status = ?)', (SHIPPED_STATUS, SHIPPED_STATUS)).fetchone()[0]
+    statements.clear()
+
+    results = sync_mirror(path=mirror_path)
+    assert results['Main']['mode'] == 'high-water marks'
+    assert results['Main']['copied'] == latest < total / 100
+    assert not any('Status <>' in statement for statement in statements)
+    assert_in_sync(db_app, mirror_path)
+
+
+def test_new_and_shipped_pieces_are_copied(db_app, mirror_path):
+    sync_mirror(path=mirror_path)
+    with primary(db_app) as source:
+        number, = source.execute("SELECT MIN(Number) FROM Main WHERE Status = 'تصنيع'").fetchone()
+        source.execute("UPDATE Main SET Status = ?, Date3 = '2099-01-01 08:00:00' WHERE Number = ?",
+                       (SHIPPED_STATUS, number))
+        source.execute("INSERT INTO Chines (Number, Type, Color, Long, Status, Customer, Date) "
+                       "VALUES (999999, 'T001', 'أحمر', 50, 'مستودع', '6000', '2026-01-01 10:00:00')")
+
+    results = sync_mirror(path=mirror_path)
+    # The shipped piece, plus the few already copied at the previous shipping-date mark
+    assert 1 <= results['Main']['copied'] < 10
+    assert 1 <= results['Chines']['copied'] < 10
+    assert_in_sync(db_app, mirror_path)
+
+
+def test_deletes_and_edits_wait_for_the_full_recopy(db_app, mirror_path, clock):
+    sync_mirror(path=mirror_path)
+    with primary(db_app) as source:
+        source.execute('DELETE FROM Main WHERE Number = (SELECT MIN(Number) FROM Main)')
+        source.execute("UPDATE Chines SET Color = 'أزرق' WHERE Number = (SELECT MIN(Number) FROM Chines)")
+
+    clock.advance(60)
+    assert sync_mirror(path=mirror_path)['Main']['mode'] == 'high-water marks'
+    with sqlite3.connect(mirror_path) as copy, primary(db_app) as source:
+        assert len(rows(copy, 'Main')) == len(rows(source, 'Main')) + 1
+
+    clock.advance(3600)
+    results = sync_mirror(path=mirror_path)
+    assert results['Main']['mode'] == results['Chines']['mode'] == 'full copy'
+    assert_in_sync(db_app, mirror_path)
+
+
+def test_full_flag_recopies(db_app, mirror_path):
+    sync_mirror(path=mirror_path)
+    assert sync_mirror(path=mirror_path, full=True)['Main']['mode'] == 'full copy'
+    assert_in_sync(db_app, mirror_path)
+
+
+def test_old_state_table_forces_a_full_copy(db_app, mirror_path):
+    sync_mirror(path=mirror_path)
+    with sqlite3.connect(mirror_path) as copy:
+        copy.execute('DROP TABLE mirror_state')
+        copy.execute('CREATE TABLE mirror_state (table_name TEXT PRIMARY KEY, high_water INTEGER, '
+                     'row_count INTEGER NOT NULL, synced_at TIMESTAMP NOT NULL)')
+
+    assert sync_mirror(path=mirror_path)['Main']['mode'] == 'full copy'
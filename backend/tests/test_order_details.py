@@ -0,0 +1,118 @@
+"""Order details: the per-order cache, matching rows back to orders, the batch route and prefetching."""
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from services import order_details
+from services.order_details import cached_orders, load_order_details, prefetch_top_orders
+from services.records import MainOrderDetail, OrderAggregate
+
+
+@pytest.fixture
+def details(db_app, monkeypatch):
+    monkeypatch.setattr(order_details, '_cache', None)
+    monkeypatch.setattr(order_details, '_prefetch_pending', set())
+    path = db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    with sqlite3.connect(path) as connection:
+        orders = [row[0] for row in connection.execute(
+            "SELECT DISTINCT Customer FROM Main WHERE Customer <> '6000' ORDER BY Customer LIMIT 3")]
+    return orders
+
+
+@pytest.fixture
+def statements(db_app):
+    executed = []
+    engine = db_app.extensions['sqlalchemy'].engine
+    record = lambda conn, cursor, statement, *args: executed.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_misses_are_loaded_in_one_query_then_cached(details, statements):
+    loaded = load_order_details(details)
+    assert len(statements) == 1
+    assert all(loaded[number] for number in details)
+    assert all(record.customer == number for number in details for record in loaded[number])
+
+    statements.clear()
+    assert load_order_details(details[:2]) == {number: loaded[number] for number in details[:2]}
+    assert statements == []
+    assert cached_orders(details + ['no-such-order']) == details
+
+
+def test_projected_details_are_not_cached(details):
+    projected = MainOrderDetail.project('Number,Color')
+    loaded = load_order_details(details[:1], projected)
+    assert loaded[details[0]] and type(loaded[details[0]][0]) is projected
+    assert cached_orders(details[:1]) == []
+
+
+@pytest.mark.parametrize('record_cls', [MainOrderDetail, MainOrderDetail.project('Number')])
+def test_rows_match_the_requested_number_like_sql_server(details, monkeypatch, record_cls):
+    # SQL Server's IN matched these rows despite trailing spaces and case
+    real_fetch_all = order_details.fetch_all
+
+    def fetch_all(statement, params):
+        rows = real_fetch_all(statement, {'order_numbers': [number.rstrip().upper() for number in params['order_numbers']]})
+        column = 7 if record_cls is MainOrderDetail else 0
+        return [tuple(value.lower() + '  ' if index == column else value for index, value in enumerate(row))
+                for row in rows]
+
+    monkeypatch.setattr(order_details, 'fetch_all', fetch_all)
+    requested = details[0] + ' '
+    assert load_order_details([requested], record_cls)[requested]
+
+
+def test_case_sensitive_collation_matches_exact_case(details, db_app, monkeypatch):
+    row = ('ord-a  ',)
+    monkeypatch.setattr(order_details, 'fetch_all', lambda statement, params: [row])
+    projected = MainOrderDetail.project('Number')
+    assert load_order_details(['ORD-A'], projected)['ORD-A']
+
+    db_app.config['ORDER_NUMBER_CASE_INSENSITIVE'] = False
+    assert load_order_details(['ORD-A'], projected) == {'ORD-A': ()}
+    assert load_order_details(['ord-a'], projected)['ord-a']
+
+
+def test_batch_route(details, client):
+    response = client.get('/api/warehouse/orders/details/batch', query_string={'orderNumbers': ','.join(details)})
+    body = response.get_json()
+    assert response.status_code == 200 and body['count'] == 3
+    assert set(body['data']) == set(details)
+
+    response = client.post('/api/warehouse/orders/details/batch',
+                           json={'orderNumbers': details[:1], 'fields': ['Number', 'Status']})
+    rows = response.get_json()['data'][details[0]]
+    assert rows and all(set(row) == {'Number', 'Status'} for row in rows)
+
+    assert client.get('/api/warehouse/orders/details/batch').status_code == 400
+    assert client.post('/api/warehouse/orders/details/batch',
+                       json={'orderNumbers': details, 'fields': ['Weight']}).status_code == 400
+
+
+def test_single_order_route_serves_the_cache(details, client, statements):
+    first = client.get('/api/warehouse/orders/details', query_string={'orderNumber': details[0]}).get_json()
+    statements.clear()
+    second = client.get('/api/warehouse/orders/details', query_string={'orderNumber': details[0]}).get_json()
+    assert first == second and first['count'] > 0
+    assert not [statement for statement in statements if 'FROM Main' in statement]
+
+
+def test_prefetch_loads_the_latest_orders_once(details, db_app):
+    db_app.config['ORDER_DETAILS_PREFETCH'] = 2
+    orders = [OrderAggregate(number, '', '', '', 0, 0, 0, 0, 0, 0, f'2026-01-0{index + 1}T00:00:00')
+              for index, number in enumerate(details)]
+    release = threading.Event()
+    order_details._prefetch_executor.submit(release.wait, 5)
+
+    assert prefetch_top_orders(orders) == [details[2], details[1]]
+    # Still queued behind the blocked worker: not submitted twice
+    assert prefetch_top_orders(orders) == []
+
+    release.set()
+    order_details._prefetch_executor.submit(lambda: None).result(5)
+    assert sorted(cached_orders(details)) == sorted(details[1:])
+    assert prefetch_top_orders(orders) == []
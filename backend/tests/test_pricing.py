@@ -0,0 +1,208 @@
+"""Pricing proxy against a local stub of the pricing service."""
+import json
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask import Flask
+
+from routes import pricing
+from services import ttl_cache
+
+
+class StubPricing:
+    """Threaded HTTP server answering POSTs from a path -> (status, body) table."""
+
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+        self.delay = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                path = self.path[len('/api'):]
+                stub.calls.append(path)
+                time.sleep(stub.delay)
+                status, body = stub.responses.get(path, (404, {'error': 'not found'}))
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream():
+    stub = StubPricing()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def client(upstream, clock, monkeypatch):
+    monkeypatch.setattr(ttl_cache, 'time', types.SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(pricing, '_session', None)
+    monkeypatch.setattr(pricing, 'pricing_caches', {})
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        PRICING_API_URL=upstream.url,
+        PRICING_TIMEOUT=5,
+        PRICING_CACHE_TTL=300,
+        PRICING_CACHE_TTLS={'desans': 60},
+        PRICING_STALE_TTL=600,
+    )
+    app.register_blueprint(pricing.pricing_bp, url_prefix='/api/warehouse')
+    return app.test_client()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out waiting for the background refresh'
+        time.sleep(0.01)
+
+
+def test_miss_then_hit_within_ttl(client, upstream, clock):
+    upstream.responses['/desans'] = (200, [{'name': 'D001', 'price': 10}])
+
+    first = client.get('/api/warehouse/pricing/desans')
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS'
+    assert first.get_json() == [{'name': 'D001', 'price': 10}]
+
+    clock.advance(59)
+    second = client.get('/api/warehouse/pricing/desans')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+    assert upstream.calls == ['/desans']
+
+
+def test_per_resource_ttl(client, upstream, clock):
+    upstream.responses['/main_desan'] = (200, ['A'])
+    client.get('/api/warehouse/pricing/main_desan')
+
+    # main_desan falls back to PRICING_CACHE_TTL (300 s), desans has 60 s
+    clock.advance(120)
+    assert client.get('/api/warehouse/pricing/main_desan').headers['X-Cache'] == 'HIT'
+    assert upstream.calls == ['/main_desan']
+
+
+def test_stale_while_revalidate(client, upstream, clock):
+    upstream.responses['/desans'] = (200, {'version': 1})
+    client.get('/api/warehouse/pricing/desans')
+
+    upstream.responses['/desans'] = (200, {'version': 2})
+    clock.advance(61)
+    stale = client.get('/api/warehouse/pricing/desans')
+    assert stale.headers['X-Cache'] == 'STALE'
+    assert stale.get_json() == {'version': 1}
+
+    # The refresh runs in the background; the next caller gets its result
+    wait_for(lambda: pricing.pricing_caches['desans'].get('/desans') == {'version': 2})
+    fresh = client.get('/api/warehouse/pricing/desans')
+    assert fresh.headers['X-Cache'] == 'HIT'
+    assert fresh.get_json() == {'version': 2}
+    assert upstream.calls == ['/desans', '/desans']
+
+
+def test_expired_entry_is_refetched(client, upstream, clock):
+    upstream.responses['/desans'] = (200, {'version': 1})
+    client.get('/api/warehouse/pricing/desans')
+
+    upstream.responses['/desans'] = (200, {'version': 2})
+    clock.advance(60 + 600 + 1)
+    response = client.get('/api/warehouse/pricing/desans')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.get_json() == {'version': 2}
+
+
+def test_upstream_error_serves_last_answer(client, upstream, clock):
+    upstream.responses['/desans'] = (200, {'version': 1})
+    client.get('/api/warehouse/pricing/desans')
+
+    upstream.responses['/desans'] = (500, {'error': 'boom'})
+    clock.advance(60 + 600 + 1)
+    response = client.get('/api/warehouse/pricing/desans')
+    assert response.status_code == 200
+    assert response.headers['X-Cache'] == 'STALE'
+    assert response.get_json() == {'version': 1}
+
+
+def test_failed_revalidation_keeps_stale_entry(client, upstream, clock):
+    upstream.responses['/desans'] = (200, {'version': 1})
+    client.get('/api/warehouse/pricing/desans')
+
+    upstream.responses['/desans'] = (503, {'error': 'down'})
+    clock.advance(61)
+    assert client.get('/api/warehouse/pricing/desans').headers['X-Cache'] == 'STALE'
+    wait_for(lambda: len(upstream.calls) == 2 and pricing._inflight.in_flight() == 0)
+
+    response = client.get('/api/warehouse/pricing/desans')
+    assert response.headers['X-Cache'] == 'STALE'
+    assert response.get_json() == {'version': 1}
+
+
+@pytest.mark.parametrize('status, body', [(500, {'error': 'boom'}), (200, b'<html>not json</html>')])
+def test_upstream_error_without_cache_is_502(client, upstream, status, body):
+    upstream.responses['/desans'] = (status, body)
+
+    response = client.get('/api/warehouse/pricing/desans')
+    assert response.status_code == 502
+    assert response.get_json()['success'] is False
+    assert 'Pricing service unavailable' in response.get_json()['error']
+    assert 'desans' not in pricing.pricing_caches or pricing.pricing_caches['desans'].get('/desans') is None
+
+
+def test_unreachable_upstream_is_502(client, upstream):
+    upstream.close()
+
+    response = client.get('/api/warehouse/pricing/desans')
+    assert response.status_code == 502
+
+
+def test_names_are_quoted_and_cached_per_path(client, upstream):
+    upstream.responses['/kalite/%D8%A3%20B'] = (200, ['K1'])
+
+    first = client.get('/api/warehouse/pricing/kalite/أ B')
+    # The tasaneef proxy reads the same resource and cache
+    second = client.get('/api/warehouse/tasaneef-details-proxy/أ B')
+    assert first.get_json() == second.get_json() == ['K1']
+    assert second.headers['X-Cache'] == 'HIT'
+    assert upstream.calls == ['/kalite/%D8%A3%20B']
+
+
+def test_concurrent_misses_share_one_upstream_call(client, upstream):
+    upstream.responses['/desans'] = (200, {'version': 1})
+    upstream.delay = 0.2
+    app = client.application
+    results = []
+
+    def fetch():
+        response = app.test_client().get('/api/warehouse/pricing/desans')
+        results.append((response.status_code, response.get_json()))
+
+    threads = [threading.Thread(target=fetch) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [(200, {'version': 1})] * 5
+    assert upstream.calls == ['/desans']
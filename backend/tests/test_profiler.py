@@ -0,0 +1,87 @@
+"""Request profiler: profiles are always stopped and pruning keeps the newest."""
+import json
+import os
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services import profiler
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(PROFILER_ENABLED=True, PROFILER_DIR=str(tmp_path), PROFILER_KEEP=50,
+                      PROFILER_INTERVAL_MS=1)
+    profiler.install_profiler(app)
+
+    @app.route('/ok')
+    def ok():
+        return 'ok'
+
+    return app
+
+
+def assert_stopped():
+    assert profiler._active == {}
+    assert not event.contains(Engine, 'before_cursor_execute', profiler._before_cursor_execute)
+
+
+def test_profile_is_saved_and_named_in_the_response(app, tmp_path):
+    with app.test_client() as client:
+        response = client.get('/ok')
+    name = response.headers['X-Profile-Id']
+    with open(os.path.join(str(tmp_path), name), encoding='utf-8') as handle:
+        document = json.load(handle)
+    assert document['metadata']['status'] == 200
+    assert_stopped()
+
+
+def test_failing_after_request_hook_still_stops_the_profile(app, tmp_path):
+    # Registered after the profiler, so it runs first and skips the profiler's hook
+    @app.after_request
+    def broken(response):
+        raise RuntimeError('hook failed')
+
+    with app.test_client() as client:
+        assert client.get('/ok').status_code == 500
+    assert_stopped()
+    [name] = profiler.profile_files(str(tmp_path))
+    with open(os.path.join(str(tmp_path), name), encoding='utf-8') as handle:
+        metadata = json.load(handle)['metadata']
+    assert metadata['status'] == 500
+    assert 'hook failed' in metadata['error']
+
+
+@pytest.mark.parametrize('keep, expected', [(2, 2), (0, 4)])
+def test_profiler_keep(app, tmp_path, keep, expected):
+    app.config['PROFILER_KEEP'] = keep
+    with app.test_client() as client:
+        for _ in range(4):
+            client.get('/ok')
+    assert len(profiler.profile_files(str(tmp_path))) == expected
+
+
+@pytest.mark.parametrize('token, header, allowed', [
+    (None, None, False),
+    (None, 'anything', False),
+    ('secret', None, False),
+    ('secret', 'wrong', False),
+    ('secret', 'secret', True),
+])
+def test_profiles_need_the_token(app, token, header, allowed):
+    # PROFILER_ENABLED alone profiles requests but never serves the profiles
+    app.config['PROFILER_TOKEN'] = token
+    with app.test_request_context('/profiles', headers={'X-Profile': header} if header else {}):
+        assert profiler.profiles_authorized() is allowed
+
+
+def test_profiles_routes_are_forbidden_without_a_token(db_app, client, tmp_path):
+    db_app.config.update(PROFILER_ENABLED=True, PROFILER_TOKEN=None, PROFILER_DIR=str(tmp_path))
+    assert client.get('/api/warehouse/profiles').status_code == 403
+    assert client.get('/api/warehouse/profiles/x.speedscope.json').status_code == 403
+
+    db_app.config['PROFILER_TOKEN'] = 'secret'
+    assert client.get('/api/warehouse/profiles', headers={'X-Profile': 'secret'}).status_code == 200
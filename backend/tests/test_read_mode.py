@@ -0,0 +1,122 @@
+"""Reporting read mode: the snapshot isolation check, the fallback and the per-request override."""
+import types
+
+import pytest
+from sqlalchemy import exc
+
+from services import breaker, read_mode
+from services.mirror import sync_mirror
+from services.read_mode import resolve_read_mode, snapshot_allowed
+
+
+class FakeEngine:
+    """An mssql engine whose ``connect`` fails with a DB-Lib outage, or answers ``state``."""
+
+    url = 'mssql+pymssql://reports@warehouse/factory'
+    dialect = types.SimpleNamespace(name='mssql')
+
+    def __init__(self, state=None):
+        self.state = state
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        if self.state is None:
+            raise exc.OperationalError('SELECT', {}, Exception(20009, b'DB-Lib error message 20009'))
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement):
+        return types.SimpleNamespace(scalar=lambda: self.state)
+
+
+@pytest.fixture
+def checks(db_app, clock, monkeypatch):
+    monkeypatch.setattr(read_mode, '_snapshot_allowed', {})
+    monkeypatch.setattr(read_mode, 'time', types.SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(breaker, 'time', types.SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(breaker, '_breaker', None)
+    db_app.config.update(DB_BREAKER_ENABLED=True, DB_BREAKER_THRESHOLD=2, DB_BREAKER_RESET=60)
+    return clock
+
+
+def test_allowed_snapshot_is_checked_once(checks):
+    engine = FakeEngine(state=1)
+    assert snapshot_allowed(engine) and snapshot_allowed(engine)
+    checks.advance(3600)
+    assert snapshot_allowed(engine)
+    assert engine.connects == 1
+
+
+def test_failed_check_is_cached_briefly_and_counts_against_the_breaker(checks):
+    engine = FakeEngine()
+    assert not snapshot_allowed(engine)
+    assert not snapshot_allowed(engine)
+    assert engine.connects == 1
+    assert breaker.database_breaker().failures == 1
+
+    checks.advance(read_mode._UNKNOWN_RECHECK)
+    engine.state = 1
+    assert snapshot_allowed(engine)
+    assert engine.connects == 2
+
+
+def test_open_circuit_skips_the_check(checks):
+    database = breaker.database_breaker()
+    for _ in range(2):
+        database._on_failure()
+    assert database.rejecting()
+
+    engine = FakeEngine(state=1)
+    assert not snapshot_allowed(engine)
+    assert engine.connects == 0 and database.rejected == 0
+
+    checks.advance(60)
+    assert snapshot_allowed(engine)
+    assert engine.connects == 1
+
+
+def test_resolve_falls_back_without_snapshot(db_app, checks):
+    engine = FakeEngine(state=0)
+    assert resolve_read_mode(engine) == 'read_committed'
+    db_app.config['REPORT_READ_FALLBACK'] = 'read_uncommitted'
+    assert resolve_read_mode(engine) == 'read_uncommitted'
+    assert resolve_read_mode(engine, 'snapshot') == 'read_uncommitted'
+    assert resolve_read_mode(engine, 'read_committed') == 'read_committed'
+    # Unknown modes are ignored
+    db_app.config['REPORT_READ_MODE'] = 'read_committed'
+    assert resolve_read_mode(engine, 'serializable') == 'read_committed'
+
+    allowed = FakeEngine(state=1)
+    allowed.url = 'mssql+pymssql://reports@replica/factory'
+    assert resolve_read_mode(allowed, 'snapshot') == 'snapshot'
+
+
+def test_reporting_routes_say_how_they_read(client, checks):
+    # SQLite has no snapshot isolation: the configured fallback
+    response = client.get('/api/warehouse/scrap')
+    assert response.status_code == 200
+    assert response.headers['X-Read-Mode'] == 'read_committed'
+
+    response = client.get('/api/warehouse/scrap', query_string={'read_mode': 'read_uncommitted'})
+    assert response.status_code == 200
+    assert response.headers['X-Read-Mode'] == 'read_uncommitted'
+
+    # Not a reporting route
+    assert 'X-Read-Mode' not in client.get('/api/warehouse/orders', query_string={'limit': 1}).headers
+
+
+def test_mirror_takes_precedence(db_app, client, tmp_path):
+    path = str(tmp_path / 'mirror.db')
+    sync_mirror(path=path)
+    db_app.config.update(ANALYTICS_MIRROR_ENABLED=True, ANALYTICS_MIRROR_PATH=path)
+
+    response = client.get('/api/warehouse/sales/main', query_string={'read_mode': 'read_uncommitted'})
+    assert response.status_code == 200
+    assert response.headers['X-Analytics-Source'] == 'mirror'
+    assert 'X-Read-Mode' not in response.headers
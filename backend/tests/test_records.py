@@ -0,0 +1,97 @@
+"""Record projections for ``?fields=`` and the JSON encoding of records."""
+import gc
+import json
+import time
+
+import pytest
+from flask import jsonify
+from sqlalchemy import text
+
+from services.query import fetch_all
+from services.records import ChinesPiece, MainOrderDetail, MainOrderLine, MainPiece, records_response
+
+
+def test_no_fields_or_every_field_keeps_the_class():
+    assert MainPiece.project(None) is MainPiece
+    assert MainPiece.project(' , ') is MainPiece
+    assert MainPiece.project(','.join(reversed(MainPiece.json_keys))) is MainPiece
+
+
+def test_projection_keeps_record_order_and_is_cached():
+    projected = MainPiece.project('length, number')
+    assert projected.json_keys == ('number', 'length')
+    assert projected.select_list() == 'Main.Number, Main.Long2'
+    assert MainPiece.project('number,length') is projected
+    assert not projected.uses_table('Customers')
+    assert MainPiece.project('customer_name').uses_table('Customers')
+
+
+def test_projection_uses_the_json_keys():
+    projected = MainOrderDetail.project('customerName,endDate')
+    assert projected.__slots__ == ('customer_name', 'end_date')
+    assert projected.from_row((None, None)).to_dict() == {'customerName': 'غير معروف', 'endDate': None}
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(ValueError, match="Unknown field 'weight'"):
+        ChinesPiece.project('number,weight')
+
+
+def test_from_record_copies_the_projected_slots():
+    piece = ChinesPiece('1', 'T001', 'أحمر', 50.0, 'زبون', '2026-01-01')
+    projected = ChinesPiece.project('color,length')
+    assert projected.from_record(piece).values() == ('أحمر', 50.0)
+
+
+def test_projected_query_and_response(db_app):
+    projected = MainPiece.project('number,length')
+    rows = fetch_all(text(f"SELECT TOP 3 {projected.select_list()} FROM Main WHERE Main.Status = 'مشحون' "
+                          "ORDER BY Main.Number"))
+    records = [projected.from_row(row) for row in rows]
+    with db_app.test_request_context():
+        body = json.loads(records_response(records, success=True).get_data())
+    assert body['success'] is True
+    assert [set(item) for item in body['data']] == [{'number', 'length'}] * 3
+    assert all(isinstance(item['length'], float) for item in body['data'])
+
+
+def order_lines(count):
+    return [MainOrderLine(f'ORD{index}', f'D{index % 50:03d}', 55.5 + index % 7, '2026-01-01', '2026-01-02', '',
+                          1, 0, 0, 'مشحون') for index in range(count)]
+
+
+def best_of(runs, *fns):
+    """Fastest time of each of ``fns``, run alternately (so load drift hits all alike) with the GC paused."""
+    timings = [[] for _ in fns]
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(runs):
+            for fn, times in zip(fns, timings):
+                started = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return [min(times) for times in timings]
+
+
+def test_records_response_matches_jsonify(db_app):
+    records = order_lines(3) + [MainPiece('1', None, '', 0.0, '', '6000', 'زبون')]
+    with db_app.test_request_context():
+        ours = json.loads(records_response(records, success=True, count=4).get_data())
+        theirs = json.loads(jsonify({'data': [record.to_dict() for record in records], 'success': True,
+                                     'count': 4}).get_data())
+    assert ours == theirs
+
+
+def test_records_response_is_no_slower_than_jsonify(db_app):
+    records = order_lines(50000)
+    with db_app.test_request_context():
+        ours, theirs = best_of(
+            5,
+            lambda: records_response(records, success=True).get_data(),
+            lambda: jsonify({'data': [record.to_dict() for record in records], 'success': True}).get_data(),
+        )
+    # Margin for timer noise on shared machines; the single dumps is usually faster
+    assert ours <= theirs * 1.1
@@ -0,0 +1,61 @@
+"""Search index: Arabic normalization and incremental updates."""
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+
+from services.search import build_search_index, normalize, update_search_index
+
+
+def write(db_app, sql, params=()):
+    path = db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    with sqlite3.connect(path) as connection:
+        connection.execute(sql, params)
+
+
+@pytest.fixture
+def statements(db_app):
+    executed = []
+    engine = db_app.extensions['sqlalchemy'].engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(' '.join(statement.split()))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_normalize_folds_arabic_variants():
+    assert normalize('أحمر') == normalize('احمر')
+    assert normalize('مكتبة') == normalize('مكتبه')
+    assert normalize('D-١٢٣') == 'd 123'
+
+
+def test_search_ranks_exact_before_prefix(db_app):
+    index = build_search_index()
+    results = index.search('زبون 1001', kinds={'customer'})
+    assert results[0]['value'] == 'زبون 1001'
+    assert results[0]['match'] == 'exact'
+    assert results[0]['number'] == '1001'
+
+
+def test_update_reads_only_new_customers(db_app, statements):
+    index = build_search_index()
+    write(db_app, "INSERT INTO Customers VALUES ('9001', 'شركة النور')")
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Status, Customer, customerNumber) "
+                  "VALUES (999999, 'D999', 'أحمر', 'تصنيع', '777777', '9001')")
+    statements.clear()
+
+    assert update_search_index(index, {'main'}) == 1
+    customer_reads = [statement for statement in statements if 'FROM Customers' in statement]
+    assert len(customer_reads) == 1 and 'WHERE Number IN' in customer_reads[0]
+    assert index.search('النور')[0]['number'] == '9001'
+    assert index.search('777777')[0]['kind'] == 'order'
+
+    # Known customers are not read again
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Status, Customer, customerNumber) "
+                  "VALUES (1000000, 'D999', 'أحمر', 'تصنيع', '777777', '9001')")
+    statements.clear()
+    update_search_index(index, {'main'})
+    assert not [statement for statement in statements if 'FROM Customers' in statement]
@@ -0,0 +1,114 @@
+"""Single-flight coalescing of identical concurrent calls."""
+import threading
+import time
+
+import pytest
+
+from services.query import _statement_key
+from services.singleflight import SingleFlight
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ['row']
+
+    def caller():
+        results.append(flight.do('key', slow))
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=caller) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    # Let the followers reach the wait before the leader finishes
+    wait_until(lambda: flight.coalesced == 4)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [['row']] * 5
+    assert (flight.executions, flight.coalesced) == (1, 4)
+    assert flight.in_flight() == 0
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError('database went away')
+
+    def caller():
+        try:
+            flight.do('key', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: flight.executions + flight.coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ['database went away'] * 3
+    assert flight.executions == 1
+
+
+def test_nothing_is_cached_after_the_call():
+    flight = SingleFlight()
+    values = iter([1, 2])
+
+    assert flight.do('key', lambda: next(values)) == 1
+    assert flight.do('key', lambda: next(values)) == 2
+    assert (flight.executions, flight.coalesced) == (2, 0)
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    barrier = threading.Barrier(2, timeout=5)
+    results = []
+
+    def caller(key):
+        # Both calls must be running at once to pass the barrier
+        results.append(flight.do(key, lambda: (barrier.wait(), key)[1]))
+
+    threads = [threading.Thread(target=caller, args=(key,)) for key in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(results) == ['a', 'b']
+    assert flight.executions == 2
+
+
+@pytest.mark.parametrize('first, second, same', [
+    (('SELECT 1', {'a': 1, 'b': 2}), ('SELECT 1', {'b': 2, 'a': 1}), True),
+    (('SELECT 1', {'a': 1}), ('SELECT 1', {'a': '1'}), False),
+    (('SELECT 1', None), ('SELECT 1', {}), True),
+    (('SELECT 1', {'a': 1}), ('SELECT 2', {'a': 1}), False),
+])
+def test_statement_keys(first, second, same):
+    assert (_statement_key(*first) == _statement_key(*second)) is same
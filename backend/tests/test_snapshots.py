@@ -0,0 +1,86 @@
+"""``since``-token deltas: token issuance, fallbacks and keys of removed orders."""
+import sqlite3
+
+import pytest
+
+from services import snapshots
+from services.snapshots import SnapshotHistory
+
+
+def test_unchanged_snapshots_share_a_token():
+    history = SnapshotHistory()
+    first = history.record('view', {'a': 1})
+    assert history.record('view', {'a': 1}) == first
+    assert history.record('view', {'a': 2}) != first
+    assert history.diff('view', first, {'a': 2, 'b': 3}) == ([2, 3], [])
+    assert history.diff('view', first, {}) == ([], ['a'])
+
+
+def test_old_and_foreign_tokens_are_unknown():
+    history = SnapshotHistory(max_versions=2)
+    first = history.record('view', {'a': 1})
+    history.record('view', {'a': 2})
+    assert history.diff('view', first, {}) is not None
+    history.record('view', {'a': 3})
+    assert history.diff('view', first, {}) is None
+    assert history.diff('other', first, {}) is None
+    assert SnapshotHistory().diff('view', first, {}) is None
+
+
+@pytest.fixture
+def orders(db_app, client, monkeypatch):
+    monkeypatch.setattr(snapshots, 'snapshot_history', SnapshotHistory(max_versions=2))
+    return lambda since=None: client.get('/api/warehouse/orders-in-progress',
+                                         query_string={'since': since} if since else {}).get_json()
+
+
+def write(db_app, sql, params=()):
+    with sqlite3.connect(db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]) as connection:
+        connection.execute(sql, params)
+
+
+def test_token_round_trip(orders):
+    full = orders()
+    assert full['delta'] is False and full['data'] and full['token']
+
+    delta = orders(full['token'])
+    assert delta['delta'] is True and delta['since'] == full['token']
+    assert delta['data'] == [] and delta['removed'] == []
+    assert delta['token'] == full['token']
+
+
+@pytest.mark.parametrize('since', ['not-a-token', 'deadbeef.1'])
+def test_unknown_tokens_fall_back_to_the_full_list(orders, since):
+    full = orders()
+    response = orders(since)
+    assert response['delta'] is False and response['data'] == full['data']
+
+
+def test_expired_tokens_fall_back_to_the_full_list(db_app, orders):
+    first = orders()['token']
+    for _ in range(2):
+        write(db_app, "UPDATE Main SET Status = 'تصنيع' WHERE Number = (SELECT MIN(Number) FROM Main "
+                      "WHERE Status = 'مستودع' AND customerNumber != '6000')")
+        orders()
+    assert orders(first)['delta'] is False
+
+
+def test_orders_sharing_a_number_are_tracked_separately(db_app, orders):
+    full = orders()
+    order = full['data'][0]
+    with sqlite3.connect(db_app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]) as connection:
+        other, name = connection.execute("SELECT Number, Name FROM Customers WHERE Number NOT IN (?, '6000') "
+                                         "ORDER BY Number LIMIT 1", (order['customer_number'],)).fetchone()
+    # The same order number booked under a second customer: a new row of the grouped query
+    write(db_app, "INSERT INTO Main (Number, Desan, Color, Long2, Status, Customer, customerNumber, endDate) "
+                  "VALUES (900001, 'D001', 'أحمر', 40, 'تصنيع', ?, ?, '2020-01-01 00:00:00')",
+          (order['customer'], other))
+
+    delta = orders(full['token'])
+    assert delta['delta'] is True and delta['removed'] == []
+    assert [(row['customer'], row['customer_number']) for row in delta['data']] == [(order['customer'], other)]
+
+    write(db_app, "DELETE FROM Main WHERE Number = 900001")
+    delta = orders(delta['token'])
+    assert delta['data'] == []
+    assert delta['removed'] == [[order['customer'], other, name]]
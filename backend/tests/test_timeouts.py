@@ -0,0 +1,65 @@
+"""Statement timeouts: each connection is cancelled at its own route's limit."""
+import threading
+
+import pytest
+from flask import Flask, jsonify
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+
+from services import timeouts
+from services.query import fetch_one
+
+
+# About a second of work per million rows on SQLite
+SLOW_SQL = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :rows) SELECT COUNT(*) FROM c")
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'timeouts.db'}",
+        STATEMENT_TIMEOUT=0,
+        STATEMENT_TIMEOUTS={'/short': 0.3, '/long': 30},
+    )
+    SQLAlchemy(app)
+    timeouts.install_statement_timeouts()
+    app.after_request(timeouts.timeout_response)
+
+    def count(rows):
+        try:
+            return jsonify({'success': True, 'count': fetch_one(SLOW_SQL, {'rows': rows})[0]}), 200
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    app.add_url_rule('/short', 'short', lambda: count(int(3e6)))
+    app.add_url_rule('/long', 'long', lambda: count(int(1e6)))
+    app.add_url_rule('/unlimited', 'unlimited', lambda: count(1000))
+    return app
+
+
+def get(app, path):
+    with app.test_client() as client:
+        response = client.get(path)
+        return response.status_code, response.get_json()
+
+
+def test_routes_with_different_timeouts_run_side_by_side(app):
+    results = {}
+    threads = [threading.Thread(target=lambda path=path: results.__setitem__(path, get(app, path)))
+               for path in ('/short', '/long')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    status, body = results['/short']
+    assert status == 504
+    assert body['timeout'] and body['timeout_seconds'] == 0.3 and body['route'] == '/short'
+    assert results['/long'] == (200, {'success': True, 'count': int(1e6)})
+    assert timeouts.timeout_stats()['by_route'].get('/short', 0) >= 1
+
+
+def test_cancelled_connection_serves_the_next_request(app):
+    assert get(app, '/short')[0] == 504
+    assert get(app, '/unlimited') == (200, {'success': True, 'count': 1000})
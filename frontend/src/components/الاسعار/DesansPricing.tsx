@@ -75,7 +75,7 @@ const DesansPricing: React.FC<DesansPricingProps> = ({ title }) => {
       setLoading(true);
       setError(null);
       console.log('Fetching desans data from external API...');
-      const response = await fetch('https://istanbul.almaestro.org/api/desans', {
+      const response = await fetch('http://localhost:5000/api/warehouse/pricing/desans', {
         method: 'POST',
         headers: {
           'Accept': 'application/json',
@@ -127,9 +127,7 @@ const DesansPricing: React.FC<DesansPricingProps> = ({ title }) => {
       setModalLoading(true);
       setModalError(null);
       setSelectedDesan(desanName);
-      // Add a small delay to prevent rate limiting
-      await new Promise(resolve => setTimeout(resolve, 500));
-      const response = await fetch(`https://istanbul.almaestro.org/api/desan/${desanName}`, {
+      const response = await fetch(`http://localhost:5000/api/warehouse/pricing/desan/${encodeURIComponent(desanName)}`, {
         method: 'POST',
         headers: {
           'Accept': 'application/json',
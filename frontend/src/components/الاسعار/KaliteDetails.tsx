@@ -32,7 +32,7 @@ const KaliteDetails: React.FC<KaliteDetailsProps> = ({ mainDesan, onBack }) => {
       setError(null);
 
       const response = await fetch(
-        `https://istanbul.almaestro.org/api/kalite/${encodeURIComponent(mainDesan)}`,
+        `http://localhost:5000/api/warehouse/pricing/kalite/${encodeURIComponent(mainDesan)}`,
         {
           method: 'POST',
           headers: {
@@ -99,12 +99,9 @@ const KaliteDetails: React.FC<KaliteDetailsProps> = ({ mainDesan, onBack }) => {
       setModalError(null);
       setSelectedKalite(kaliteName);
       
-      // Add a small delay to prevent rate limiting
-      await new Promise(resolve => setTimeout(resolve, 500));
-      
-      // Fetch quality details from external API
+      // Fetch quality details through the backend pricing proxy
       const response = await fetch(
-        `https://istanbul.almaestro.org/api/details/${encodeURIComponent(kaliteName)}`,
+        `http://localhost:5000/api/warehouse/pricing/details/${encodeURIComponent(kaliteName)}`,
         {
           method: 'POST',
           headers: {
@@ -43,7 +43,7 @@ const TasaneefPricing: React.FC<TasaneefPricingProps> = ({ title, onItemClick })
       setLoading(true);
       setError(null);
       
-      const response = await fetch('https://istanbul.almaestro.org/api/main_desan', {
+      const response = await fetch('http://localhost:5000/api/warehouse/pricing/main_desan', {
         method: 'POST',
         headers: {
           'Accept': 'application/json',